@@ -0,0 +1,207 @@
+"""
+FinBuddy 效能基準測試
+
+以 SyntheticMarketDataProvider 離線產生市場數據, 量測建立數據、各項指標、
+回測與交易建議的耗時, 結果存成 JSON 以便比較不同版本。
+
+用法:
+    python -m benchmarks.run --sizes 50 500 5000 --years 15
+    python -m benchmarks.run --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider
+from utils.market import data as data_module
+from utils.trader import Trader, MaxSharpeStrategy
+
+
+# 量測的 MarketDataProvider 方法 (包含時間, 巢狀呼叫會重複計入外層)
+PROVIDER_STAGES = [
+    'get_history_with_unified_datetime',
+    'get_stock_full_info',          # 大盤指數: 彩虹圖、統計指標、Sharpe
+    'download_stock_data',
+    '_get_features',
+    'integrate_industry_metrics',
+    'calculate_slopes',
+    'find_turning_points',
+    'generate_crossover_state',
+    'summary_overall_state',
+    'build_decline_prediction',
+]
+
+# 量測的 utils.market.data 模組函式 (個股指標在計算執行緒中以矩陣計算)
+MODULE_STAGES = [
+    'compute_universe_indicators',
+]
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def _instrument(obj, names, timings, calls) -> dict:
+    """
+    以計時包裝物件上的方法, 累計耗時與呼叫次數
+
+    Returns:
+        {名稱: 原本的方法}, 供量測結束後還原
+    """
+    originals = {name: getattr(obj, name) for name in names}
+    for name in names:
+        method = getattr(obj, name)
+
+        def timed(*args, _method=method, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                timings[_name] += time.perf_counter() - start
+                calls[_name] += 1
+
+        setattr(obj, name, wraps(method)(timed))
+    return originals
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(n_tickers: int, years: int, tickers_per_industry: int, sharpe_window: int,
+             seed: int, trace_memory: bool = False) -> dict:
+    """執行單一規模的基準測試"""
+    n_industries = max(1, n_tickers // tickers_per_industry)
+    provider = SyntheticMarketDataProvider(
+        n_industries=n_industries,
+        tickers_per_industry=tickers_per_industry,
+        years=years,
+        seed=seed,
+    )
+    timings, calls = defaultdict(float), defaultdict(int)
+    _instrument(provider, PROVIDER_STAGES, timings, calls)
+    simulator = SimulatedMarket(data_provider=provider)
+
+    if trace_memory:
+        tracemalloc.start()
+
+    originals = _instrument(data_module, MODULE_STAGES, timings, calls)
+    start = time.perf_counter()
+    try:
+        simulator.build_portfolio_data(sharpe_window=sharpe_window)
+    finally:
+        for name, function in originals.items():
+            setattr(data_module, name, function)
+    timings['build_portfolio_data'] = time.perf_counter() - start
+
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    for frequency in ['daily', 'monthly']:
+        trader = Trader(balance=10000, strategy=MaxSharpeStrategy(topk=10), rebalance_frequency=frequency)
+        start = time.perf_counter()
+        simulator.run(trader)
+        timings[f'run_{frequency}'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    simulator.get_trading_recommendation(MaxSharpeStrategy(topk=10))
+    timings['get_trading_recommendation'] = time.perf_counter() - start
+
+    return {
+        'tickers': n_industries * tickers_per_industry,
+        'industries': n_industries,
+        'years': years,
+        'rows': int(simulator.portfolio_df.shape[0]),
+        'columns': int(simulator.portfolio_df.shape[1]),
+        'frame_mb': simulator.portfolio_df.memory_usage(deep=True).sum() / 2 ** 20,
+        'peak_build_mb': peak_mb,
+        'timings': dict(timings),
+        'calls': dict(calls),
+    }
+
+
+def compare(old_path: str, new_path: str):
+    """比較兩份基準測試結果"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    old_by_size = {(r['tickers'], r['years']): r for r in old['results']}
+    for result in new['results']:
+        key = (result['tickers'], result['years'])
+        if key not in old_by_size:
+            continue
+        base = old_by_size[key]
+        print(f"\n📊 {key[0]} tickers × {key[1]} years  ({old.get('commit')} -> {new.get('commit')})")
+        print(f"  {'stage':36s} {'old (s)':>10s} {'new (s)':>10s} {'speedup':>8s}")
+        for stage, t_new in result['timings'].items():
+            t_old = base['timings'].get(stage)
+            if t_old is None:
+                print(f"  {stage:36s} {'-':>10s} {t_new:10.3f} {'-':>8s}")
+            else:
+                speedup = t_old / t_new if t_new > 0 else float('inf')
+                print(f"  {stage:36s} {t_old:10.3f} {t_new:10.3f} {speedup:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FinBuddy benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 5000], help='股票數量')
+    parser.add_argument('--years', type=int, default=15, help='歷史長度 (年)')
+    parser.add_argument('--tickers-per-industry', type=int, default=10, help='每個產業的股票數量')
+    parser.add_argument('--sharpe-window', type=int, default=252, help='Sharpe 計算視窗')
+    parser.add_argument('--seed', type=int, default=0, help='合成數據隨機種子')
+    parser.add_argument('--trace-memory', action='store_true', help='以 tracemalloc 量測建立數據的記憶體峰值 (較慢)')
+    parser.add_argument('--output', default=None, help='結果 JSON 路徑 (預設存於 benchmarks/results/)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='比較兩份結果')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'config': vars(args),
+        'results': [],
+    }
+
+    for size in args.sizes:
+        print(f"\n🚀 Benchmark: {size} tickers × {args.years} years")
+        result = run_size(size, args.years, args.tickers_per_industry, args.sharpe_window,
+                          args.seed, trace_memory=args.trace_memory)
+        report['results'].append(result)
+        for stage, seconds in result['timings'].items():
+            print(f"  {stage:36s} {seconds:10.3f}s")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📁 Results saved to: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from utils.trader import Trader, MaxSharpeStrategy, LinearProgrammingStrategy
-from utils.market import SimulatedMarket
+from utils.market import SimulatedMarket, collect_fields
 
 # 建立市場模擬器
 simulator = SimulatedMarket(
@@ -8,7 +8,9 @@ simulator = SimulatedMarket(
 )
 
 # 建立數據 (只需執行一次)
-simulator.build_portfolio_data(sharpe_window=252, slope_window=365, ma_period=30)
+# 只計算策略與交易建議需要的欄位
+fields = collect_fields(MaxSharpeStrategy, SimulatedMarket.REPORT_FIELDS)
+simulator.build_portfolio_data(sharpe_window=252, slope_window=365, ma_period=30, fields=fields)
 
 # 方式1: 單一策略回測
 #trader = Trader(balance=10000, strategy=MaxSharpeStrategy(topk=5), rebalance_frequency='daily')
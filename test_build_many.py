@@ -0,0 +1,77 @@
+"""
+多個 watchlist 共用個股數據的等價性測試 - build_many 與各自 build_portfolio_data 的結果完全相同
+
+執行: python -m pytest test_build_many.py
+"""
+
+import pandas as pd
+import pytest
+
+from utils.market import SyntheticMarketDataProvider, SyntheticWatchlist
+from utils.market.data import MarketDataProvider
+
+
+# 重疊的股票 (NVDA, AAPL, MSFT, WMT) 與同一清單中重複的代碼
+WATCHLISTS = {
+    'A': {'Semis': {'NASDAQ': ['NVDA', 'AMD', 'INTC']}, 'Big': {'NASDAQ': ['AAPL', 'MSFT', 'NVDA']},
+          'Cloud': {'NYSE': ['ORCL', 'CRM']}},
+    'B': {'Tech': {'NASDAQ': ['AAPL', 'NVDA', 'GOOG', 'AAPL']}, 'Retail': {'NYSE': ['WMT', 'COST']},
+          'Energy': {'NYSE': ['XOM', 'CVX']}},
+    'C': {'Mixed': {'NASDAQ': ['MSFT', 'WMT', 'TSLA']}, 'Banks': {'NYSE': ['JPM', 'BAC']},
+          'Health': {'NYSE': ['UNH', 'JNJ']}},
+}
+
+
+class CountingProvider(SyntheticMarketDataProvider):
+    """記錄完整歷史的下載次數"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.downloads = []
+
+    def get_history_with_unified_datetime(self, ticker, period="15y", interval="1d"):
+        if period == "15y":
+            self.downloads.append(ticker)
+        return super().get_history_with_unified_datetime(ticker, period, interval)
+
+
+def watchlists() -> dict:
+    return {name: SyntheticWatchlist(industries=industries) for name, industries in WATCHLISTS.items()}
+
+
+@pytest.mark.parametrize("fields", [None, ['{code}_Sharpe', '{industry}_Crossover_State']],
+                         ids=['full', 'fields'])
+@pytest.mark.parametrize("compact", [False, True], ids=['float64', 'compact'])
+def test_build_many_matches_separate_builds(fields, compact):
+    """每個清單的數據與建立狀態與各自建立完全相同, 每檔股票只下載一次"""
+    lists = watchlists()
+    root = CountingProvider(watchlist=lists['A'], years=10)
+    tenants = root.build_many(lists, fields=fields, compact=compact)
+
+    codes = {code for watchlist in lists.values() for code in MarketDataProvider._watchlist_codes(watchlist)}
+    assert sorted(root.downloads) == sorted(codes | {'^IXIC'})
+
+    for name, watchlist in lists.items():
+        separate = CountingProvider(watchlist=watchlist, years=10)
+        expected = separate.build_portfolio_data(watchlist, fields=fields, compact=compact)
+        tenant = tenants[name]
+        pd.testing.assert_frame_equal(tenant.state.frame.iloc[tenant.WARMUP_DAYS:], expected, check_exact=True)
+        assert list(tenant.state.tickers) == list(separate.state.tickers)
+        assert tenant.state.params == separate.state.params
+        assert tenant.state.stages == separate.state.stages
+
+
+def test_update_many_matches_separate_updates():
+    """共用下載的增量更新與各自更新相同"""
+    lists = watchlists()
+    root = CountingProvider(watchlist=lists['A'], years=10)
+    tenants = root.build_many(lists)
+    for provider in [root, *tenants.values()]:
+        provider.advance(3)
+    updated = root.update_many(tenants)
+
+    for name, watchlist in lists.items():
+        separate = CountingProvider(watchlist=watchlist, years=10)
+        separate.build_portfolio_data(watchlist)
+        separate.advance(3)
+        pd.testing.assert_frame_equal(updated[name], separate.update(), check_exact=False, rtol=1e-9)
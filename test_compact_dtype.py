@@ -0,0 +1,89 @@
+"""
+精簡型別模式 (compact) 的等價性測試 - 以合成數據比較 float32 / int8 與 float64 的回測結果
+
+執行: python -m pytest test_compact_dtype.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider
+from utils.trader import Trader, MaxSharpeStrategy, LinearProgrammingStrategy
+
+
+# 回測權益曲線的相對容許誤差 (float32 約 7 位有效數字, 取整股數後仍應非常接近)
+EQUITY_RTOL = 1e-4
+
+
+def build(compact: bool) -> SimulatedMarket:
+    provider = SyntheticMarketDataProvider(n_industries=4, tickers_per_industry=5, years=8, seed=7)
+    simulator = SimulatedMarket(data_provider=provider)
+    simulator.build_portfolio_data(sharpe_window=252, compact=compact)
+    return simulator
+
+
+@pytest.fixture(scope="module")
+def simulators():
+    return build(compact=False), build(compact=True)
+
+
+def test_compact_dtypes(simulators):
+    """指標為 float32, 區段與交叉狀態為 int8"""
+    _, compact = simulators
+    df = compact.portfolio_df
+    assert df['segments'].dtype == np.int8
+    assert all(df[c].dtype == np.int8 for c in df.columns if c.endswith('_Crossover_State'))
+    assert all(df[c].dtype == np.float32 for c in df.columns if c.endswith(('_Close', '_Sharpe', '_Beta')))
+    assert not (df.dtypes == np.float64).any()
+
+
+def test_compact_memory(simulators):
+    """記憶體約為 float64 的一半"""
+    full, compact = simulators
+    full_mb = full.portfolio_df.memory_usage(deep=True).sum()
+    compact_mb = compact.portfolio_df.memory_usage(deep=True).sum()
+    assert compact_mb <= 0.55 * full_mb
+
+
+def test_compact_values(simulators):
+    """數值在 float32 精度內相同, 離散欄位完全相同"""
+    full, compact = simulators
+    a, b = full.portfolio_df, compact.portfolio_df
+    assert a.index.equals(b.index) and a.columns.equals(b.columns)
+
+    discrete = ['segments'] + [c for c in a.columns if c.endswith('_Crossover_State')]
+    np.testing.assert_array_equal(a[discrete].to_numpy(), b[discrete].to_numpy())
+
+    continuous = [c for c in a.columns if c not in discrete]
+    np.testing.assert_allclose(b[continuous].to_numpy(dtype=float), a[continuous].to_numpy(dtype=float),
+                               rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("strategy", [MaxSharpeStrategy(topk=5), LinearProgrammingStrategy()],
+                         ids=lambda s: s.__class__.__name__)
+@pytest.mark.parametrize("frequency", ['daily', 'monthly'])
+def test_compact_backtest(simulators, strategy, frequency):
+    """float32 數據的回測權益曲線與 float64 在容許誤差內相同"""
+    curves = []
+    for simulator in simulators:
+        trader = Trader(balance=10000, strategy=strategy, rebalance_frequency=frequency)
+        simulator.run(trader)
+        curves.append(np.array([s.total_value for s in trader.portfolio_history]))
+    np.testing.assert_allclose(curves[1], curves[0], rtol=EQUITY_RTOL)
+
+
+def test_compact_update():
+    """增量更新後仍維持精簡型別, 數值與 float64 更新結果在容許誤差內相同"""
+    results = []
+    for compact in (False, True):
+        simulator = build(compact)
+        simulator.data_provider.advance(5)
+        simulator.update()
+        results.append(simulator.portfolio_df)
+    full, compact = results
+
+    assert not (compact.dtypes == np.float64).any()
+    assert compact['segments'].dtype == np.int8
+    pd.testing.assert_index_equal(full.index, compact.index)
+    np.testing.assert_allclose(compact.to_numpy(dtype=float), full.to_numpy(dtype=float), rtol=1e-4, atol=1e-5)
@@ -0,0 +1,57 @@
+"""
+事件分派測試 - listener 拋出例外時只記錄, 不影響其他 listener 與建立數據的管線
+
+執行: python -m pytest test_events.py
+"""
+
+import logging
+
+from utils.events import EventBus
+from utils.market import SyntheticMarketDataProvider
+
+
+class Failing:
+    def on_download(self, code, error):
+        raise RuntimeError("download sink failed")
+
+    def on_progress(self, stage, n=1):
+        raise RuntimeError("progress sink failed")
+
+
+class Recording:
+    def __init__(self):
+        self.downloads = []
+        self.progress = 0
+
+    def on_download(self, code, error):
+        self.downloads.append(code)
+
+    def on_progress(self, stage, n=1):
+        self.progress += n
+
+
+def test_failing_listener_is_isolated(caplog):
+    """拋出例外的 listener 記錄一次, 其他 listener 照常收到事件"""
+    bus = EventBus()
+    failing, recording = bus.subscribe(Failing()), bus.subscribe(Recording())
+    with caplog.at_level(logging.ERROR, logger='finbuddy'):
+        with bus.stage('download', total=3) as advance:
+            for code in ('A', 'B', 'C'):
+                advance()
+                bus.emit('on_download', code=code, error=None)
+    assert recording.downloads == ['A', 'B', 'C'] and recording.progress == 3
+    assert len([r for r in caplog.records if 'failed on' in r.getMessage()]) == 2
+
+    bus.unsubscribe(failing)
+    assert len(bus.handlers('on_download')) == 1
+
+
+def test_failing_listener_does_not_stop_build():
+    """下載管線中的 listener 失敗時仍完成建立 (不會卡住或中斷)"""
+    provider = SyntheticMarketDataProvider(n_industries=3, tickers_per_industry=4, years=10)
+    provider.events = EventBus()
+    provider.events.subscribe(Failing())
+    recording = provider.events.subscribe(Recording())
+    frame = provider.build_portfolio_data(provider.get_watchlist(), sharpe_window=252)
+    assert sorted(recording.downloads) == sorted(provider.get_watchlist().tolist())
+    assert len(frame) > 0
@@ -0,0 +1,74 @@
+"""
+數據來源連線層測試 - 斷路器開啟時以快取退回, 沒有快取的股票拋出 CircuitOpenError 並彙總回報
+
+執行: python -m pytest test_http.py
+"""
+
+import pytest
+import requests
+
+from utils.market import CircuitOpenError, SyntheticMarketDataProvider
+from utils.market.http import DEFAULT_CONFIG, DataSourceClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # 略多於要求的秒數, 避免浮點捨入使 token 停在 1 以下
+        self.now += seconds + 1e-6
+
+
+def failing():
+    raise requests.ConnectionError("upstream down")
+
+
+def test_open_breaker_falls_back_to_bounded_cache():
+    """yahoo 預設設定: 斷路器開啟時快取內的股票退回快取, 其他股票拋出 CircuitOpenError"""
+    clock = Clock()
+    client = DataSourceClient('yahoo', **{**DEFAULT_CONFIG['yahoo'], 'max_retries': 0},
+                              clock=clock, sleep=clock.sleep)
+    for i in range(client.cache_size + 1):
+        assert client.call(('history', i), lambda i=i: i) == i
+    for _ in range(client.breaker.failure_threshold):
+        with pytest.raises(requests.ConnectionError):
+            client.call(('history', 'down'), failing)
+    assert client.breaker.state == client.breaker.OPEN
+
+    assert client.call(('history', client.cache_size), failing) == client.cache_size
+    with pytest.raises(CircuitOpenError):
+        client.call(('history', 0), failing)  # 已被淘汰 (LRU)
+    assert client.metrics()['cached'] == client.cache_size
+    assert client.metrics()['cache_fallbacks'] == 1
+
+
+class CircuitOpenProvider(SyntheticMarketDataProvider):
+    """部分股票下載時斷路器已開啟"""
+
+    def __init__(self, unavailable, **kwargs):
+        super().__init__(**kwargs)
+        self.unavailable = set(unavailable)
+
+    def get_history_with_unified_datetime(self, ticker, period="15y", interval="1d"):
+        if ticker in self.unavailable:
+            raise CircuitOpenError("yahoo: circuit open, no cached result")
+        return super().get_history_with_unified_datetime(ticker, period=period, interval=interval)
+
+
+def test_download_summarizes_circuit_open(tmp_path, capsys):
+    """斷路器開啟而跳過的股票彙總為一則訊息, 記錄於檢查點, 其餘股票照常建立"""
+    codes = SyntheticMarketDataProvider(n_industries=3, tickers_per_industry=4, years=10).get_watchlist().tolist()
+    unavailable = codes[::2]
+    provider = CircuitOpenProvider(unavailable, n_industries=3, tickers_per_industry=4, years=10)
+    frame = provider.build_portfolio_data(provider.get_watchlist(), sharpe_window=252,
+                                          checkpoint=str(tmp_path))
+
+    output = capsys.readouterr().out
+    assert f"Skipped {len(unavailable)} tickers while the data source circuit is open" in output
+    assert "Failed to download" not in output
+    assert all(f'{code}_Sharpe' not in frame.columns for code in unavailable)
+    assert all(f'{code}_Sharpe' in frame.columns for code in codes if code not in unavailable)
@@ -0,0 +1,96 @@
+"""
+增量更新的等價性測試 - 以合成數據比較 update() / apply_watchlist_changes() 與完整重建的結果
+
+執行: python -m pytest test_incremental_update.py
+"""
+
+import copy
+
+import pandas as pd
+import pytest
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider, SyntheticWatchlist
+
+
+# 增量推進與完整重建的相對容許誤差 (累計狀態與全樣本計算只有浮點捨入差異)
+RTOL = 1e-7
+
+PARAMS = dict(sharpe_window=252, slope_window=200, ma_period=20)
+
+WATCHLIST = {
+    'Semis': {'NASDAQ': ['AAA', 'BBB', 'CCC'], 'TWSE': ['2330.TW', '2317.TW']},
+    'Software': {'NYSE': ['DDD', 'EEE', 'FFF']},
+    'Energy': {'NYSE': ['GGG', 'HHH']},
+}
+
+
+def build(industries: dict = None, advance: int = 0) -> SimulatedMarket:
+    watchlist = SyntheticWatchlist(industries=copy.deepcopy(industries or WATCHLIST))
+    provider = SyntheticMarketDataProvider(watchlist=watchlist, years=10, seed=5)
+    provider.advance(advance)
+    simulator = SimulatedMarket(data_provider=provider)
+    simulator.build_portfolio_data(**PARAMS)
+    return simulator
+
+
+def assert_same_frame(incremental: pd.DataFrame, rebuilt: pd.DataFrame):
+    assert set(incremental.columns) == set(rebuilt.columns)
+    pd.testing.assert_frame_equal(incremental[rebuilt.columns], rebuilt, rtol=RTOL, check_exact=False)
+
+
+def test_update_matches_rebuild():
+    """推進 3 個交易日後增量更新, 與以相同資料完整重建相同"""
+    simulator = build()
+    simulator.data_provider.advance(3)
+    simulator.update()
+    assert_same_frame(simulator.portfolio_df, build(advance=3).portfolio_df)
+
+
+def test_repeated_updates_match_rebuild():
+    """逐日更新三次, 與一次完整重建相同"""
+    simulator = build()
+    for _ in range(3):
+        simulator.data_provider.advance(1)
+        simulator.update()
+    assert_same_frame(simulator.portfolio_df, build(advance=3).portfolio_df)
+
+
+def _added(industries):
+    industries['Software']['NYSE'].append('III')
+    industries['Biotech'] = {'NASDAQ': ['JJJ', 'KKK']}
+
+
+def _removed(industries):
+    industries['Semis']['TWSE'].remove('2317.TW')
+    del industries['Energy']
+
+
+def _moved(industries):
+    industries['Semis']['NASDAQ'].remove('CCC')
+    industries['Energy']['NYSE'].append('CCC')
+
+
+@pytest.mark.parametrize("change", [_added, _removed, _moved], ids=['add', 'remove', 'move'])
+def test_watchlist_changes_match_rebuild(change):
+    """新增、移除股票與產業, 以及股票換產業後局部重建, 與以新清單完整重建相同"""
+    industries = copy.deepcopy(WATCHLIST)
+    change(industries)
+
+    simulator = build()
+    simulator.data_provider.get_watchlist()._set_result(copy.deepcopy(industries))
+    simulator.refresh_watchlist()
+    assert_same_frame(simulator.portfolio_df, build(industries).portfolio_df)
+
+
+def test_watchlist_change_then_update():
+    """局部重建後的狀態可繼續增量更新"""
+    industries = copy.deepcopy(WATCHLIST)
+    _added(industries)
+    _moved(industries)
+
+    simulator = build()
+    simulator.data_provider.get_watchlist()._set_result(copy.deepcopy(industries))
+    simulator.refresh_watchlist()
+    simulator.data_provider.advance(3)
+    simulator.update()
+    assert_same_frame(simulator.portfolio_df, build(industries, advance=3).portfolio_df)
@@ -0,0 +1,61 @@
+"""
+線性規劃策略的預先求解測試 - 預先求解的權重與逐日求解相同, 輸入改變時重新求解
+
+執行: python -m pytest test_linear_programming.py
+"""
+
+import pytest
+
+from utils.market import BacktestCache, SimulatedMarket, SyntheticMarketDataProvider
+from utils.trader import Trader, LinearProgrammingStrategy, MaxSharpeStrategy
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    provider = SyntheticMarketDataProvider(n_industries=3, tickers_per_industry=5, years=6, seed=9)
+    simulator = SimulatedMarket(data_provider=provider)
+    simulator.build_portfolio_data(sharpe_window=252)
+    return simulator
+
+
+def direct_weights(frame, codes, dates):
+    strategy = LinearProgrammingStrategy(enable_beta_constraint=False)
+    return [strategy.calculate_weights(frame.loc[date], codes) for date in dates]
+
+
+def test_precomputed_weights_match_direct(simulator):
+    """預先求解的權重與逐日求解完全相同"""
+    frame, codes = simulator.portfolio_df, simulator.data_provider.get_watchlist().tolist()
+    dates = frame.index[::20]
+    strategy = LinearProgrammingStrategy(enable_beta_constraint=False, precompute=True, workers=1)
+    strategy.prepare(frame, dates, codes)
+    assert [strategy.calculate_weights(frame.loc[date], codes) for date in dates] == \
+        direct_weights(frame, codes, dates)
+
+
+def test_reused_instance_resolves_changed_rows(simulator):
+    """同一個實例用於輸入已改變的數據時, 重新求解改變的日期"""
+    frame, codes = simulator.portfolio_df, simulator.data_provider.get_watchlist().tolist()
+    dates = frame.index[::20]
+    strategy = LinearProgrammingStrategy(enable_beta_constraint=False, precompute=True, workers=1)
+    strategy.prepare(frame, dates, codes)
+
+    changed = frame.copy()
+    changed[f'{codes[0]}_Sharpe'] = changed[f'{codes[0]}_Sharpe'] + 5.0
+    expected = direct_weights(changed, codes, dates)
+    assert expected != direct_weights(frame, codes, dates)
+    # 未呼叫 prepare 時也不沿用舊的權重
+    assert [strategy.calculate_weights(changed.loc[date], codes) for date in dates] == expected
+    strategy.prepare(changed, dates, codes)
+    assert [strategy.calculate_weights(changed.loc[date], codes) for date in dates] == expected
+
+
+def test_execution_params_not_in_cache_key():
+    """workers、cache_dir、precompute 不影響回測快取鍵, 其他參數會"""
+    def key(strategy):
+        return BacktestCache.make_key(Trader(10000, strategy, 'monthly'), ['A', 'B'], ['A_Close', 'B_Close'])
+
+    base = key(LinearProgrammingStrategy())
+    assert key(LinearProgrammingStrategy(precompute=True, workers=4, cache_dir='lp_cache')) == base
+    assert key(LinearProgrammingStrategy(max_weight=0.3)) != base
+    assert key(MaxSharpeStrategy()) != base
@@ -0,0 +1,79 @@
+"""
+記憶體上限建立的等價性測試 - 分塊建立 (_build_chunked) 與一般建立的結果在浮點捨入內相同
+
+執行: python -m pytest test_memory_budget.py
+"""
+
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider
+from utils.market.data import MarketDataProvider
+from utils.trader import Trader, MaxSharpeStrategy
+
+
+def provider() -> SyntheticMarketDataProvider:
+    return SyntheticMarketDataProvider(n_industries=4, tickers_per_industry=6, years=10, seed=4)
+
+
+@pytest.mark.parametrize("fields", [None, ['{code}_Sharpe', '{industry}_Crossover_State'], ['Trend']],
+                         ids=['full', 'fields', 'market'])
+@pytest.mark.parametrize("compact", [False, True], ids=['float64', 'compact'])
+def test_chunked_matches_full_build(tmp_path, fields, compact):
+    """每檔一塊 (memory_budget=1) 的建立與一般建立欄位、型別相同, 數值只有產業平均的捨入差異"""
+    reference = provider()
+    expected = reference.build_portfolio_data(reference.watchlist, fields=fields, compact=compact)
+
+    chunked = provider()
+    result = chunked.build_portfolio_data(chunked.watchlist, fields=fields, compact=compact,
+                                          memory_budget=1, spill_dir=str(tmp_path))
+    assert chunked.state is None
+    assert list(result.columns) == list(expected.columns)
+    assert (result.dtypes == expected.dtypes).all()
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+
+    del result
+    gc.collect()
+    assert os.listdir(tmp_path) == []
+
+
+def test_ticker_columns_are_memory_mapped(tmp_path):
+    """個股欄位引用磁碟上的區塊, 不再被引用時刪除"""
+    chunked = provider()
+    result = chunked.build_portfolio_data(chunked.watchlist, memory_budget=1, spill_dir=str(tmp_path))
+    [directory] = os.listdir(tmp_path)
+    assert len(os.listdir(tmp_path / directory)) == len(chunked.get_watchlist().tolist())
+    values = result['S001T001_Sharpe'].to_numpy()
+    assert isinstance(values.base, np.memmap) or isinstance(getattr(values.base, 'base', None), np.memmap)
+
+    del result, values
+    gc.collect()
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_build_removes_chunks(tmp_path, monkeypatch):
+    """建立失敗時已寫入的區塊一併刪除"""
+    def fail(*args, **kwargs):
+        raise RuntimeError("stage failed")
+    monkeypatch.setattr(MarketDataProvider, '_run_stages', fail)
+
+    chunked = provider()
+    with pytest.raises(RuntimeError, match="stage failed"):
+        chunked.build_portfolio_data(chunked.watchlist, memory_budget=1, spill_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_chunked_backtest():
+    """以分塊建立的數據回測, 權益曲線與一般建立相同"""
+    curves = []
+    for memory_budget in (None, 1):
+        simulator = SimulatedMarket(data_provider=provider())
+        simulator.build_portfolio_data(sharpe_window=252, memory_budget=memory_budget)
+        trader = Trader(balance=10000, strategy=MaxSharpeStrategy(topk=5), rebalance_frequency='weekly')
+        simulator.run(trader)
+        curves.append(np.array([snapshot.total_value for snapshot in trader.portfolio_history]))
+    np.testing.assert_allclose(curves[1], curves[0], rtol=1e-9)
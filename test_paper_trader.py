@@ -0,0 +1,110 @@
+"""
+模擬交易的等價性測試 - 逐日推進 (每日重新讀取狀態) 與完整回測逐位元相同
+
+執行: python -m pytest test_paper_trader.py
+"""
+
+import json
+import os
+
+import pytest
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider
+from utils.trader import (Trader, PaperTrader, MaxSharpeStrategy, LinearProgrammingStrategy,
+                          MeanVarianceStrategy)
+from utils.trader import paper as paper_module
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    provider = SyntheticMarketDataProvider(n_industries=3, tickers_per_industry=4, years=6, seed=11)
+    simulator = SimulatedMarket(data_provider=provider)
+    simulator.build_portfolio_data(sharpe_window=252)
+    return simulator
+
+
+def paper_run(simulator, directory, strategy, frequency: str) -> PaperTrader:
+    """前半段以同一個實例推進, 後半段每日重新讀取狀態檔 (如每日排程的獨立行程)"""
+    frame = simulator.portfolio_df
+    codes = simulator.data_provider.get_watchlist().tolist()
+    paper = PaperTrader(str(directory), 'main').create(Trader(10000, strategy, frequency), codes)
+    half = len(frame) // 2
+    for date in frame.index[:half]:
+        paper.step(date, frame.loc[date])
+    for date in frame.index[half:]:
+        PaperTrader(str(directory), 'main').load().step(date, frame.loc[date])
+    return PaperTrader(str(directory), 'main').load()
+
+
+@pytest.mark.parametrize("strategy, frequency", [
+    (MaxSharpeStrategy(topk=3), 'weekly'),
+    (LinearProgrammingStrategy(), 'monthly'),
+    (MeanVarianceStrategy(window=63, topk=5), 'weekly'),
+], ids=['MaxSharpe', 'LinearProgramming', 'MeanVariance'])
+def test_step_matches_full_backtest(simulator, tmp_path, strategy, frequency):
+    """逐日推進的快照與最終狀態與完整回測完全相同, verify 不回報差異"""
+    paper = paper_run(simulator, tmp_path, strategy, frequency)
+    full = Trader(10000, type(strategy)(**strategy.params()), frequency)
+    simulator.run(full)
+
+    assert paper.history() == full.portfolio_history
+    assert paper.trader.cash == full.cash
+    assert paper.trader.inventory == full.inventory
+    assert paper.trader.last_rebalance_date == full.last_rebalance_date
+    assert paper.verify(simulator.portfolio_df) == []
+
+
+def test_verify_detects_tampered_state(simulator, tmp_path):
+    """狀態檔與重播結果有任何差異 (即使只有捨入誤差) 時 verify 回報"""
+    paper = paper_run(simulator, tmp_path, MaxSharpeStrategy(topk=3), 'monthly')
+    with open(paper.state_path, encoding='utf-8') as f:
+        state = json.load(f)
+    state['cash'] += 1e-9
+    with open(paper.state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    errors = PaperTrader(str(tmp_path), 'main').load().verify(simulator.portfolio_df)
+    assert len(errors) == 1 and errors[0].startswith('cash')
+
+
+def test_interrupted_append_is_discarded(simulator, tmp_path):
+    """附加快照後、更新狀態檔前中斷: 讀取時捨棄多出的快照, 可繼續推進"""
+    frame = simulator.portfolio_df
+    paper = paper_run(simulator, tmp_path, MaxSharpeStrategy(topk=3), 'weekly')
+    with open(paper.history_path, 'a', encoding='utf-8') as f:
+        f.write('["2030-01-01T00:00:00",1.0,2.0]\n')
+
+    paper = PaperTrader(str(tmp_path), 'main').load()
+    assert len(paper.history()) == len(frame)
+    assert paper.step(frame.index[-1], frame.iloc[-1]) is None
+    assert paper.verify(frame) == []
+
+
+def test_interrupted_state_write_keeps_strategy(simulator, tmp_path, monkeypatch):
+    """策略狀態寫入後、狀態檔更新前中斷: 仍以上一日的策略狀態讀取, 重新推進後與完整回測相同"""
+    frame = simulator.portfolio_df
+    codes = simulator.data_provider.get_watchlist().tolist()
+    strategy = MeanVarianceStrategy(window=63, topk=5)
+    paper = PaperTrader(str(tmp_path), 'main').create(Trader(10000, strategy, 'weekly'), codes)
+    paper.advance(frame.iloc[:-1])
+
+    write = paper_module.atomic_write
+
+    def crash_on_state(path, writer):
+        if path == paper.state_path:
+            raise KeyboardInterrupt
+        write(path, writer)
+    monkeypatch.setattr(paper_module, 'atomic_write', crash_on_state)
+    with pytest.raises(KeyboardInterrupt):
+        paper.step(frame.index[-1], frame.iloc[-1])
+    monkeypatch.setattr(paper_module, 'atomic_write', write)
+
+    paper = PaperTrader(str(tmp_path), 'main').load()
+    assert paper.days == len(frame) - 1
+    assert [name for name in os.listdir(tmp_path) if '.strategy.' in name] == [f'main.strategy.{paper.days}.pkl']
+    paper.advance(frame)
+
+    full = Trader(10000, MeanVarianceStrategy(window=63, topk=5), 'weekly')
+    simulator.run(full)
+    assert paper.history() == full.portfolio_history
+    assert paper.verify(frame) == []
@@ -0,0 +1,112 @@
+"""
+滾動共變異數的等價性測試 - rank-1 更新 (含缺值與定期重算) 與 DataFrame.rolling(window).cov() 比較;
+以及均值-變異數策略在共變異數不是正定時 (共線、含缺值) 仍可求解
+
+執行: python -m pytest test_rolling_covariance.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.trader import MeanVarianceStrategy
+from utils.trader.covariance import RollingCovariance
+
+
+WINDOW = 40
+
+
+def returns_with_gaps(n_days: int = 200, n_assets: int = 6, seed: int = 0) -> pd.DataFrame:
+    """含缺值的日報酬: 零星缺值、連續停牌、較晚上市與整列缺值"""
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size=(n_assets, n_assets)) * 0.01
+    values = rng.normal(size=(n_days, n_assets)) @ mixing + 0.0005
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[60:85, 1] = np.nan          # 停牌超過半個視窗
+    values[:120, 4] = np.nan           # 較晚上市
+    values[150] = np.nan               # 整列缺值 (休市)
+    return pd.DataFrame(values, index=pd.bdate_range('2020-01-01', periods=n_days))
+
+
+@pytest.mark.parametrize("refresh", [None, 7, 1000], ids=['window', 'frequent', 'never'])
+def test_matches_rolling_cov(refresh):
+    """每日的共變異數、平均與次數與 pandas 的成對完整計算相同"""
+    returns = returns_with_gaps()
+    expected_cov = returns.rolling(WINDOW, min_periods=2).cov()
+    expected_mean = returns.rolling(WINDOW, min_periods=1).mean()
+    expected_count = returns.notna().rolling(WINDOW, min_periods=1).sum()
+
+    estimator = RollingCovariance(WINDOW, refresh=refresh)
+    for date, row in returns.iterrows():
+        estimator.update(row.to_numpy())
+        np.testing.assert_allclose(estimator.covariance(), expected_cov.loc[date].to_numpy(),
+                                   rtol=1e-8, atol=1e-14, err_msg=str(date.date()))
+        np.testing.assert_array_equal(estimator.counts(), expected_count.loc[date].to_numpy())
+        valid = estimator.counts() > 0
+        np.testing.assert_allclose(estimator.mean()[valid], expected_mean.loc[date].to_numpy()[valid],
+                                   rtol=1e-8, atol=1e-14)
+
+
+def test_subset_covariance():
+    """部分資產 (包含非遞增的索引) 的共變異數與完整矩陣的對應區塊相同"""
+    returns = returns_with_gaps(seed=1)
+    estimator = RollingCovariance(WINDOW)
+    for row in returns.to_numpy():
+        estimator.update(row)
+    full = estimator.covariance()
+    for index in ([0, 2, 3], [5, 1, 3, 0]):
+        index = np.array(index)
+        np.testing.assert_array_equal(estimator.covariance(index), full[np.ix_(index, index)])
+
+
+def test_insufficient_pairs_are_nan():
+    """成對有效次數不足 2 時為 NaN"""
+    estimator = RollingCovariance(WINDOW)
+    estimator.update(np.array([0.01, np.nan, 0.02]))
+    estimator.update(np.array([0.02, 0.01, np.nan]))
+    cov = estimator.covariance()
+    assert np.isfinite(cov[0, 0])
+    assert np.isnan(cov[0, 1]) and np.isnan(cov[1, 1]) and np.isnan(cov[1, 2])
+
+
+def mean_variance_weights(closes: pd.DataFrame, every: int = 5, **params) -> list:
+    """逐日 observe, 每 every 日計算一次權重"""
+    codes = list(closes.columns)
+    frame = pd.concat({**{f'{code}_Close': closes[code] for code in codes},
+                       **{f'{code}_Sharpe': pd.Series(1.0, index=closes.index) for code in codes}}, axis=1)
+    strategy = MeanVarianceStrategy(**params)
+    weights = []
+    for i, (_, row) in enumerate(frame.iterrows()):
+        strategy.observe(row, codes)
+        if i % every == 0:
+            weights.append(strategy.calculate_weights(row, codes))
+    return weights
+
+
+def random_closes(n_days: int, n_assets: int, seed: int, missing: float = 0.0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, (n_days, n_assets)), axis=0))
+    closes[rng.random(closes.shape) < missing] = np.nan
+    return pd.DataFrame(closes, index=pd.bdate_range('2020-01-01', periods=n_days),
+                        columns=[f'T{i}' for i in range(n_assets)])
+
+
+def assert_valid_weights(weights: list):
+    for allocation in weights:
+        values = np.array(list(allocation.values()))
+        assert np.isfinite(values).all() and (values >= 0).all()
+        assert sum(allocation.values()) == pytest.approx(1.0)
+
+
+def test_mean_variance_collinear_prices():
+    """兩檔價格完全相同且不收縮時 (共變異數奇異) 仍可求解"""
+    closes = random_closes(300, 3, seed=0)
+    closes['T3'] = closes['T0']
+    assert_valid_weights(mean_variance_weights(closes, window=60, shrinkage=0.0))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_mean_variance_gappy_prices(seed):
+    """大量缺值使成對完整的共變異數不是半正定時仍可求解"""
+    closes = random_closes(300, 8, seed=seed, missing=0.45)
+    assert_valid_weights(mean_variance_weights(closes, window=60))
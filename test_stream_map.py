@@ -0,0 +1,67 @@
+"""
+下載管線 (stream_map) 測試 - 結果順序、分批計算與回報函式失敗時不會卡住
+
+執行: python -m pytest test_stream_map.py
+"""
+
+import threading
+
+import pytest
+
+from utils.market.stream import stream_map
+
+
+def fetch(item):
+    if item % 7 == 3:
+        raise ValueError(f"bad {item}")
+    return item
+
+
+def run_with_timeout(function, timeout: float = 20):
+    """在獨立執行緒中執行, 逾時視為卡住"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = function()
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "stream_map did not return"
+    return outcome
+
+
+@pytest.mark.parametrize("batch_size", [None, 4])
+@pytest.mark.parametrize("compute_workers", [1, 3])
+def test_results_in_order(batch_size, compute_workers):
+    """結果依項目順序排列, 失敗的項目回報錯誤, 每個項目回報一次進度"""
+    items = list(range(50))
+    process = (lambda item, raw: raw * 2) if batch_size is None else (lambda batch, raws: [r * 2 for r in raws])
+    seen = []
+    results = stream_map(items, fetch, process, compute_workers=compute_workers, queue_size=4,
+                         batch_size=batch_size, progress=lambda item, error: seen.append(item))
+    assert [item for item, _, _ in results] == items
+    for item, result, error in results:
+        if item % 7 == 3:
+            assert result is None and isinstance(error, ValueError)
+        else:
+            assert result == item * 2 and error is None
+    assert sorted(seen) == items
+
+
+@pytest.mark.parametrize("batch_size", [None, 4])
+def test_failing_progress_does_not_hang(batch_size):
+    """回報函式拋出例外時處理完所有項目, 之後拋出該例外"""
+    calls = []
+
+    def progress(item, error):
+        calls.append(item)
+        raise RuntimeError("progress failed")
+
+    process = (lambda item, raw: raw) if batch_size is None else (lambda batch, raws: raws)
+    outcome = run_with_timeout(lambda: stream_map(list(range(100)), lambda item: item, process,
+                                                  queue_size=4, batch_size=batch_size, progress=progress))
+    assert isinstance(outcome.get('error'), RuntimeError)
+    assert len(calls) == 1
@@ -0,0 +1,45 @@
+"""
+Walk-forward 串接測試 - 樣本外區段在任何 step 下都首尾相接 (不重疊也不留空)
+
+執行: python -m pytest test_walk_forward.py
+"""
+
+import pytest
+
+from utils.market import SimulatedMarket, SyntheticMarketDataProvider
+from utils.market.walkforward import walk_forward_windows
+from utils.trader import MaxSharpeStrategy
+
+
+IN_SAMPLE, OUT_OF_SAMPLE = 252, 126
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    provider = SyntheticMarketDataProvider(n_industries=3, tickers_per_industry=4, years=10, seed=3)
+    simulator = SimulatedMarket(data_provider=provider)
+    simulator.build_portfolio_data(sharpe_window=252)
+    return simulator
+
+
+@pytest.mark.parametrize("step", [None, 1, 63, 189, 500])
+def test_windows_tile_out_of_sample(step):
+    """每個樣本外區段結束於下一個區段的起點"""
+    windows = walk_forward_windows(1000, IN_SAMPLE, OUT_OF_SAMPLE, step)
+    assert windows[0][1] == IN_SAMPLE
+    for (_, _, stop), (_, split, _) in zip(windows, windows[1:]):
+        assert stop == split
+    assert all(split < stop <= 1000 for _, split, stop in windows)
+
+
+@pytest.mark.parametrize("step", [None, 63, 189])
+def test_walk_forward_curve(simulator, step):
+    """串接的權益曲線每個交易日恰好一筆"""
+    result = simulator.walk_forward([MaxSharpeStrategy(topk=3), MaxSharpeStrategy(topk=5)],
+                                    frequencies=['weekly', 'monthly'], in_sample=IN_SAMPLE,
+                                    out_of_sample=OUT_OF_SAMPLE, step=step, workers=1)
+    index = result.curve.index
+    assert index.is_unique and index.is_monotonic_increasing
+    dates = simulator.portfolio_df.index
+    assert index[0] == dates[IN_SAMPLE]
+    assert index.equals(dates[IN_SAMPLE:IN_SAMPLE + len(index)])
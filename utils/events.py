@@ -0,0 +1,221 @@
+"""
+事件與進度回報 - 建立數據與回測的各階段發出事件, 由訂閱的 listener 處理
+
+事件 (listener 實作同名方法即可, 參數一律以關鍵字傳入):
+    on_stage_start(stage, total, desc)   階段開始 (total 為項目數, 未知時為 None)
+    on_progress(stage, n)                階段完成 n 個項目
+    on_stage_end(stage, seconds)         階段結束
+    on_download(code, error)             一檔股票下載並處理完成 (失敗時 error 不為 None)
+    on_rebalance(trader, date, snapshot) 交易員完成一次 rebalance
+    on_day(trader, date, snapshot)       交易員推進一個交易日
+
+沒有 listener 的事件不會呼叫任何函式: 迴圈外以 handlers(event) 取出 listener 列表,
+迴圈內只在列表非空時才發出事件; track() 在沒有 on_progress listener 時直接產出原本的項目。
+listener 拋出的例外記錄於 'finbuddy' logger 後略過, 不影響其他 listener 與發出事件的下載或回測。
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from tqdm import tqdm
+
+
+EVENTS = ('on_stage_start', 'on_progress', 'on_stage_end', 'on_download', 'on_rebalance', 'on_day')
+
+logger = logging.getLogger('finbuddy')
+
+
+def _isolated(handler: Callable, event: str) -> Callable:
+    """包裝 listener 方法: 例外只記錄 (每個方法第一次失敗時附上 traceback), 不傳給呼叫端"""
+    failures = 0
+
+    def call(**payload):
+        nonlocal failures
+        try:
+            handler(**payload)
+        except Exception:
+            failures += 1
+            if failures == 1:
+                logger.exception("Event listener %r failed on %s", handler, event)
+            else:
+                logger.debug("Event listener %r failed on %s (%d failures)", handler, event, failures)
+    call.listener = getattr(handler, '__self__', handler)
+    return call
+
+
+class EventBus:
+    """事件分派 - listener 為實作部分事件方法的任意物件"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable]] = {event: [] for event in EVENTS}
+        self.progress = None  # set_progress 設定的進度 listener
+
+    def subscribe(self, listener):
+        """訂閱 listener 實作的所有事件, 回傳 listener"""
+        for event in EVENTS:
+            handler = getattr(listener, event, None)
+            if callable(handler):
+                self._handlers[event].append(_isolated(handler, event))
+        return listener
+
+    def unsubscribe(self, listener):
+        """取消訂閱 listener 的所有事件"""
+        for event in EVENTS:
+            self._handlers[event] = [h for h in self._handlers[event] if h.listener is not listener]
+
+    def handlers(self, event: str) -> List[Callable]:
+        """事件的 listener 列表 (空列表表示沒有人訂閱; 呼叫時例外已隔離)"""
+        return self._handlers[event]
+
+    def emit(self, event: str, **payload):
+        for handler in self._handlers[event]:
+            handler(**payload)
+
+    @contextmanager
+    def stage(self, stage: str, total: int = None, desc: str = None):
+        """
+        以 on_stage_start / on_stage_end 包住一個階段
+
+        Yields:
+            advance(n=1): 回報完成 n 個項目 (沒有 on_progress listener 時為 None)
+        """
+        start = time.perf_counter()
+        self.emit('on_stage_start', stage=stage, total=total, desc=desc or stage)
+        progress = self._handlers['on_progress']
+        advance = None
+        if progress:
+            def advance(n: int = 1):
+                for handler in progress:
+                    handler(stage=stage, n=n)
+        try:
+            yield advance
+        finally:
+            self.emit('on_stage_end', stage=stage, seconds=time.perf_counter() - start)
+
+    def track(self, items, stage: str, desc: str = None, total: int = None):
+        """
+        與 tqdm(items, desc=...) 相同的用法: 逐項產出並回報進度
+
+        Args:
+            items: 要迭代的項目
+            stage: 階段名稱
+            desc: 顯示的說明 (預設為 stage)
+            total: 項目數 (預設為 len(items))
+        """
+        if total is None and hasattr(items, '__len__'):
+            total = len(items)
+        with self.stage(stage, total=total, desc=desc) as advance:
+            if advance is None:
+                yield from items
+            else:
+                for item in items:
+                    yield item
+                    advance()
+
+
+class TqdmProgress:
+    """以 tqdm 進度條顯示各階段進度 (預設), 進度條在階段第一次回報進度時建立"""
+
+    def __init__(self, mininterval: float = 0.1):
+        """
+        Args:
+            mininterval: 進度條最短更新間隔 (秒)
+        """
+        self.mininterval = mininterval
+        self._stages = {}
+        self._bars = {}
+
+    def on_stage_start(self, stage, total=None, desc=None, **_):
+        self._stages[stage] = (total, desc)
+
+    def on_progress(self, stage, n=1, **_):
+        bar = self._bars.get(stage)
+        if bar is None:
+            if stage not in self._stages:
+                return
+            total, desc = self._stages[stage]
+            bar = self._bars[stage] = tqdm(total=total, desc=desc, mininterval=self.mininterval)
+        bar.update(n)
+
+    def on_stage_end(self, stage, **_):
+        self._stages.pop(stage, None)
+        bar = self._bars.pop(stage, None)
+        if bar is not None:
+            bar.close()
+
+
+class LogProgress:
+    """
+    以 logging 輸出結構化進度 (適合 Cloud Functions 等收集 log 的環境)
+
+    每個階段記錄開始與結束; 進行中最多每 interval 秒記錄一次進度。
+    log record 的 extra 欄位含 event / stage / done / total / seconds。
+    """
+
+    def __init__(self, logger: logging.Logger = None, interval: float = 10.0, level: int = logging.INFO):
+        """
+        Args:
+            logger: 輸出的 logger (預設為 'finbuddy')
+            interval: 進度記錄的最短間隔 (秒)
+            level: log 等級
+        """
+        self.logger = logger or logging.getLogger('finbuddy')
+        self.interval = interval
+        self.level = level
+        self._stages = {}
+
+    def _log(self, event, stage, message, **fields):
+        self.logger.log(self.level, f"{stage} {message}", extra={'event': event, 'stage': stage, **fields})
+
+    def on_stage_start(self, stage, total=None, desc=None, **_):
+        now = time.monotonic()
+        self._stages[stage] = {'total': total, 'done': 0, 'start': now, 'logged': now}
+        self._log('stage_start', stage, f"started (total={total})", total=total)
+
+    def on_progress(self, stage, n=1, **_):
+        state = self._stages.get(stage)
+        if state is None:
+            return
+        state['done'] += n
+        now = time.monotonic()
+        if now - state['logged'] >= self.interval:
+            state['logged'] = now
+            self._log('progress', stage, f"{state['done']}/{state['total']}",
+                      done=state['done'], total=state['total'], seconds=now - state['start'])
+
+    def on_stage_end(self, stage, seconds=None, **_):
+        state = self._stages.pop(stage, {'done': 0, 'total': None})
+        self._log('stage_end', stage, f"finished in {seconds:.2f}s",
+                  done=state['done'], total=state['total'], seconds=seconds)
+
+
+PROGRESS_SINKS = {'tqdm': TqdmProgress, 'log': LogProgress, 'none': None}
+
+
+def set_progress(kind: str = 'tqdm', bus: EventBus = None, **options):
+    """
+    切換進度回報方式
+
+    Args:
+        kind: 'tqdm' (進度條), 'log' (結構化 logging) 或 'none' (不回報, 不產生任何額外成本)
+        bus: 事件分派 (預設為 default_bus)
+        options: 傳給進度 listener 的參數 (如 LogProgress 的 interval)
+
+    Returns:
+        新的進度 listener ('none' 時為 None)
+    """
+    if kind not in PROGRESS_SINKS:
+        raise ValueError(f"Unknown progress sink: {kind} (expected one of {list(PROGRESS_SINKS)})")
+    bus = bus or default_bus
+    if bus.progress is not None:
+        bus.unsubscribe(bus.progress)
+    sink = PROGRESS_SINKS[kind]
+    bus.progress = bus.subscribe(sink(**options)) if sink is not None else None
+    return bus.progress
+
+
+# 預設的事件分派 (MarketDataProvider 與 SimulatedMarket 共用), 預設以 tqdm 顯示進度
+default_bus = EventBus()
+set_progress('tqdm')
@@ -1,8 +1,26 @@
 from .engine import SimulatedMarket
+from .backtest_cache import BacktestCache
+from .robustness import BlockBootstrap
+from .walkforward import WalkForward
 from .data import MarketDataProvider, TradingViewWatchlist
+from .pipeline import collect_fields
+from .metrics import summarize_curves, drawdown_episodes
+from .http import CircuitOpenError, configure as configure_http, http_metrics
+from .synthetic import SyntheticMarketDataProvider, SyntheticWatchlist
 
 __all__ = [
     'SimulatedMarket',
+    'BacktestCache',
+    'BlockBootstrap',
+    'WalkForward',
     'MarketDataProvider',
     'TradingViewWatchlist',
+    'SyntheticMarketDataProvider',
+    'SyntheticWatchlist',
+    'collect_fields',
+    'summarize_curves',
+    'drawdown_episodes',
+    'configure_http',
+    'http_metrics',
+    'CircuitOpenError',
 ]
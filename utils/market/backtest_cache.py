@@ -0,0 +1,182 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .checkpoint import atomic_write
+
+
+class BacktestCache:
+    """
+    回測結果快取 - 保存每個 (策略類別與參數, rebalance 頻率, 初始資金, 股票池與讀取欄位)
+    的權益曲線與交易員期末狀態 (含策略的內部狀態)
+
+    每筆結果記錄回測所用數據的版本 (讀取欄位的內容雜湊); 數據只在尾端新增交易日時
+    沿用快取並只回測新日期, 歷史數據有任何變動則重新回測。
+    結果以 pickle 保存, 總大小超過 max_bytes 時淘汰最久未使用的結果 (LRU);
+    指定 directory 時同時寫入磁碟, 跨行程沿用。
+    """
+
+    SUFFIX = '.pkl'
+
+    def __init__(self, directory: str = None, max_bytes: int = 64 * 2 ** 20):
+        """
+        Args:
+            directory: 磁碟快取目錄 (可選, None 表示只保存在記憶體)
+            max_bytes: 快取結果的總大小上限 (bytes), 記憶體與磁碟各自計算
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(trader, codes: list, columns: list) -> str:
+        """
+        快取鍵: 策略類別與參數 (不含 execution_params)、rebalance 頻率、初始資金、股票池與讀取欄位
+
+        Args:
+            trader: Trader (尚未回測)
+            codes: 可交易股票列表
+            columns: 回測讀取的數據欄位
+        """
+        strategy = trader.strategy
+        params = sorted((k, v) for k, v in strategy.params().items() if k not in strategy.execution_params)
+        parts = (
+            f'{type(strategy).__module__}.{type(strategy).__qualname__}', repr(params),
+            trader.rebalance_frequency, repr(float(trader.initial_balance)),
+            repr(list(codes)), repr(list(columns)),
+        )
+        return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def data_version(frame: pd.DataFrame, columns: list = None, rows: int = None) -> str:
+        """
+        數據版本: 日期索引、欄位名稱與數值的內容雜湊
+
+        逐欄雜湊, 不組合整個數值矩陣 (memmap 的欄位直接讀取, 非 float64 的欄位一次只轉換一欄)
+
+        Args:
+            frame: 數據
+            columns: 雜湊的欄位 (預設為全部欄位)
+            rows: 只雜湊前 rows 列 (預設為全部)
+        """
+        columns = list(frame.columns) if columns is None else list(columns)
+        rows = len(frame) if rows is None else rows
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(frame.index[:rows].as_unit('ns').asi8))
+        digest.update('\x1f'.join(map(str, columns)).encode('utf-8'))
+        for column in columns:
+            values = frame[column].to_numpy()[:rows]
+            digest.update(np.ascontiguousarray(values, dtype=np.float64))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        取得快取結果 (每次呼叫回傳獨立的複本), 不存在時回傳 None
+
+        Returns:
+            {'version', 'last_date', 'history', 'cash', 'inventory', 'last_rebalance_date', 'strategy'}
+        """
+        with self._lock:
+            blob = self._data.get(key)
+            if blob is not None:
+                self._data.move_to_end(key)
+        if blob is None and self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    blob = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                blob = None
+            if blob is not None:
+                self._remember(key, blob)
+
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key: str, entry: dict):
+        """保存回測結果 (覆寫同一鍵的舊結果)"""
+        blob = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.directory is not None and len(blob) <= self.max_bytes:
+            def write(tmp):
+                with open(tmp, 'wb') as f:
+                    f.write(blob)
+            atomic_write(self._path(key), write)
+            self._evict_files()
+
+    def _remember(self, key: str, blob: bytes):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= len(self._data.pop(key))
+            if len(blob) > self.max_bytes:
+                return
+            self._data[key] = blob
+            self.nbytes += len(blob)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+
+    def _evict_files(self):
+        """磁碟快取超過 max_bytes 時, 依最後使用時間刪除最舊的結果"""
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        """清除記憶體與磁碟上的所有結果"""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.SUFFIX):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> dict:
+        """快取統計"""
+        with self._lock:
+            return {
+                'results': len(self._data),
+                'mb': self.nbytes / 2 ** 20,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,212 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+from urllib.parse import quote
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def atomic_write(path: str, write: Callable[[str], None]):
+    """先寫入同目錄的暫存檔再以 os.replace 取代, 讀取端不會看到寫到一半的檔案"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class DownloadCheckpoint:
+    """
+    可續傳的下載檢查點 - 每檔股票下載完成即寫入, 下次執行只下載未完成的股票
+
+    目錄結構:
+        key             檢查點鍵值 (如資料日期)
+        manifest.json   completed / failed / pending 股票的快照 (start 時重寫)
+        journal.jsonl   快照之後的完成與失敗紀錄 (每檔股票附加一行)
+        tickers/        每檔股票的原始歷史數據 (pickle)
+        .lock           跨行程的檔案鎖
+
+    每檔股票只附加一行紀錄 (O(1)), manifest 快照只在 start 時整理一次。
+    寫入以檔案鎖保護並先確認鍵值, 可由多個執行緒或行程同時寫入; 
+    鍵值已被其他寫入者換掉時, 舊鍵值的結果直接丟棄。
+    """
+
+    KEY = 'key'
+    MANIFEST = 'manifest.json'
+    JOURNAL = 'journal.jsonl'
+
+    def __init__(self, directory: str, key: str = None):
+        """
+        Args:
+            directory: 檢查點目錄
+            key: 檢查點鍵值 (如資料日期); 與既有檢查點不同時清除舊資料重新開始
+        """
+        self.directory = directory
+        self.key = key
+        self.ticker_dir = os.path.join(directory, 'tickers')
+        os.makedirs(self.ticker_dir, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+        with self._locked():
+            if self._current_key() != key:
+                # 同時清除其他寫入者的暫存檔; 它們寫入前會發現鍵值已改變
+                for name in os.listdir(self.ticker_dir):
+                    os.remove(os.path.join(self.ticker_dir, name))
+                self._write({'key': key, 'completed': [], 'failed': {}, 'pending': []})
+                atomic_write(os.path.join(self.directory, self.KEY),
+                             lambda tmp: self._dump(tmp, {'key': key}))
+
+    @contextmanager
+    def _locked(self):
+        """同一行程內以 threading.Lock, 跨行程以檔案鎖互斥"""
+        with self._thread_lock:
+            with open(os.path.join(self.directory, '.lock'), 'a+') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _dump(path: str, data: dict):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _current_key(self):
+        """目錄中的鍵值 (尚未建立時為 False, 與任何鍵值都不同)"""
+        path = os.path.join(self.directory, self.KEY)
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['key']
+
+    def _read(self) -> dict:
+        """manifest 快照加上之後的紀錄"""
+        path = os.path.join(self.directory, self.MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        path = os.path.join(self.directory, self.JOURNAL)
+        if os.path.exists(path):
+            completed = dict.fromkeys(manifest['completed'])
+            pending = dict.fromkeys(manifest['pending'])
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 中斷時寫到一半的最後一行
+                    code = record['code']
+                    pending.pop(code, None)
+                    if record['status'] == 'completed':
+                        completed[code] = None
+                        manifest['failed'].pop(code, None)
+                    else:
+                        completed.pop(code, None)
+                        manifest['failed'][code] = record['error']
+            manifest['completed'], manifest['pending'] = list(completed), list(pending)
+        return manifest
+
+    def _write(self, manifest: dict):
+        """寫入 manifest 快照並清空紀錄"""
+        manifest['updated'] = datetime.now().isoformat(timespec='seconds')
+        atomic_write(os.path.join(self.directory, self.MANIFEST), lambda tmp: self._dump(tmp, manifest))
+        open(os.path.join(self.directory, self.JOURNAL), 'w').close()
+
+    def _append(self, record: dict):
+        """附加一行紀錄 (已持有鎖)"""
+        with open(os.path.join(self.directory, self.JOURNAL), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _path(self, code: str) -> str:
+        return os.path.join(self.ticker_dir, quote(code, safe='') + '.pkl')
+
+    def manifest(self) -> dict:
+        """目前的 manifest"""
+        with self._locked():
+            return self._read()
+
+    def start(self, codes: Iterable[str]):
+        """開始一次下載: 尚未完成的股票標記為 pending, 並將紀錄整理進 manifest 快照"""
+        codes = list(codes)
+        with self._locked():
+            if self._current_key() != self.key:
+                return
+            manifest = self._read()
+            completed = set(manifest['completed'])
+            manifest['pending'] = [code for code in codes if code not in completed]
+            self._write(manifest)
+
+    def load(self, code: str) -> Optional[pd.DataFrame]:
+        """讀取已完成股票的數據 (未完成時回傳 None)"""
+        path = self._path(code)
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+    def save(self, code: str, history: pd.DataFrame):
+        """寫入一檔股票並標記為完成 (鍵值已改變時丟棄)"""
+        fd, tmp = tempfile.mkstemp(dir=self.ticker_dir, prefix='.tmp-')
+        os.close(fd)
+        try:
+            with open(tmp, 'wb') as f:
+                history.to_pickle(f)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._locked():
+                if self._current_key() != self.key or not os.path.exists(tmp):
+                    # 鍵值已改變 (暫存檔可能已被清除)
+                    return
+                os.replace(tmp, self._path(code))
+                self._append({'code': code, 'status': 'completed'})
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def fail(self, code: str, error: Exception):
+        """標記下載或計算失敗的股票 (下次執行會重試)"""
+        with self._locked():
+            if self._current_key() != self.key:
+                return
+            path = self._path(code)
+            if os.path.exists(path):
+                os.remove(path)
+            self._append({'code': code, 'status': 'failed', 'error': str(error)})
+
+    def wrap(self, fetch: Callable[[str], pd.DataFrame]) -> Callable[[str], pd.DataFrame]:
+        """包裝下載函式: 已完成的股票直接讀取檢查點, 否則下載後寫入"""
+        def fetch_with_checkpoint(code: str) -> pd.DataFrame:
+            history = self.load(code)
+            if history is None:
+                history = fetch(code)
+                self.save(code, history)
+            return history
+        return fetch_with_checkpoint
@@ -1,11 +1,19 @@
-import requests
+import copy
 import yfinance as yf
 import numpy as np
 import pandas as pd
-from scipy.stats import linregress
-from tqdm import tqdm
+from scipy import sparse
 from scipy.signal import find_peaks
-from sklearn.linear_model import LogisticRegression
+from typing import Dict
+from .pipeline import ALL_FIELDS, resolve_stages
+from .state import TickerState, IndustryState, DeclineModel, PortfolioState
+from .stream import stream_map
+from .checkpoint import DownloadCheckpoint
+from .store import RawStore, FeatureStore
+from .spill import SpillStore
+from .http import CircuitOpenError, get_client
+from .indicators import compute_indicators, compute_universe_indicators, expanding_rainbow_levels
+from ..events import EventBus, default_bus
 import warnings
 
 warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
@@ -34,7 +42,11 @@ class TradingViewWatchlist:
             'x-requested-with': 'XMLHttpRequest',
         }
         
-        symbols = requests.get(url, headers=headers).json()["symbols"]
+        symbols = get_client('tradingview').get_json(url, cache_key=url, headers=headers)["symbols"]
+        self._set_result(self._parse_symbols(symbols))
+        
+    def _parse_symbols(self, symbols: list) -> dict:
+        """將 TradingView symbols 清單轉為 {industry: {provider: [codes]}}"""
         result = {}
         current_key = None
         
@@ -51,7 +63,10 @@ class TradingViewWatchlist:
                     result[current_key][provider].append(code)
                 elif provider in ['TWSE']:
                     result[current_key][provider].append(f"{code}.TW")
+        return result
         
+    def _set_result(self, result: dict):
+        """設定清單內容並建立 code -> provider / industry 索引"""
         self.result = result
         self.providers = {
             code: provider 
@@ -66,6 +81,10 @@ class TradingViewWatchlist:
             for code in result[industry][provider]
         }
         
+    def refresh(self):
+        """重新取得投資組合清單"""
+        self._fetch_watchlist()
+        
     def todict(self):
         return self.result
         
@@ -84,28 +103,188 @@ class TradingViewWatchlist:
         return self.industries.get(code)
 
 
+def diff_watchlist(old: dict, new: dict) -> dict:
+    """
+    比較兩份 watchlist.todict()
+    
+    Returns:
+        {'added': 新增股票, 'removed': 移除股票, 
+         'dirty_industries': 成員有變動 (含新增) 的產業, 'removed_industries': 移除的產業}
+    """
+    def members(watchlist_dict):
+        return {
+            industry: {code for provider in providers.values() for code in provider}
+            for industry, providers in watchlist_dict.items()
+        }
+    
+    old_members, new_members = members(old), members(new)
+    old_codes = set().union(*old_members.values())
+    new_codes = set().union(*new_members.values())
+    
+    return {
+        'added': [code for code in dict.fromkeys(
+                      c for providers in new.values() for codes in providers.values() for c in codes
+                  ) if code not in old_codes],
+        'removed': sorted(old_codes - new_codes),
+        'dirty_industries': [industry for industry in new 
+                             if old_members.get(industry) != new_members[industry]],
+        'removed_industries': [industry for industry in old if industry not in new],
+    }
+
+
 class MarketDataProvider:
     """市場數據提供者 - 負責數據下載與指標計算"""
     
-    def __init__(self, watchlist_id: str = None, session_id: str = None):
-        if watchlist_id and session_id:
+    # 個股欄位後綴 -> get_stock_full_info 的欄位名稱
+    TICKER_COLUMNS = {
+        'Close': 'Close',
+        'Sharpe': 'Sharpe',
+        'Base': 'base_weights',
+        'Volatility': 'volatilities',
+        'Beta': 'betas',
+    }
+    
+    # 需要足夠歷史才有效的前段資料天數 (建立完成後裁切)
+    WARMUP_DAYS = 912
+    
+    # 增量更新時下載的近期資料長度
+    UPDATE_PERIOD = "1mo"
+    
+    # 下載管線: 同時下載的執行緒數量與等待計算的原始數據上限
+    IO_WORKERS = 4
+    QUEUE_SIZE = 16
+    COMPUTE_WORKERS = 1
+    
+    # 個股指標快取 (FeatureStore) 的大小上限
+    FEATURE_STORE_BYTES = 512 * 2 ** 20
+    
+    # 原始數據層 (RawStore) 的大小上限; 個股只保存 RAW_COLUMNS (指標只使用收盤價)
+    RAW_STORE_BYTES = 128 * 2 ** 20
+    RAW_COLUMNS = ('Close',)
+    
+    # 彩虹圖波段計算方式 (見 calculate_rainbow_bands)
+    BAND_MODES = ('full', 'expanding')
+    
+    # memory_budget 模式估計每檔股票計算時所需的日序列數 (收盤價、計算暫存與配置器額外開銷, 依實測校準)
+    CHUNK_ARRAYS = 20
+    
+    # 精簡模式 (compact_frame) 以 int8 儲存的離散欄位
+    INT8_COLUMNS = ('segments',)
+    INT8_SUFFIXES = ('_Crossover_State',)
+    
+    def __init__(self, watchlist_id: str = None, session_id: str = None, watchlist: TradingViewWatchlist = None,
+                 events: EventBus = None):
+        """
+        Args:
+            watchlist_id: TradingView watchlist ID (可選)
+            session_id: TradingView session ID (可選)
+            watchlist: 直接指定 watchlist 物件 (可選, 優先於 ID)
+            events: 事件分派 (可選, 預設為 utils.events.default_bus)
+        """
+        if watchlist is not None:
+            self.watchlist = watchlist
+        elif watchlist_id and session_id:
             self.watchlist = TradingViewWatchlist(watchlist_id, session_id)
         else:
             self.watchlist = TradingViewWatchlist()  # 使用預設值
+        self.state = None  # 最近一次建立的 PortfolioState
+        self.raw_store = RawStore(self.RAW_STORE_BYTES)  # 原始數據, 不同參數的建立共用
+        self.feature_store = FeatureStore(self.FEATURE_STORE_BYTES)  # (ticker, indicator, params) -> 指標
+        self.events = events or default_bus  # 進度與下載事件
             
+    def _download_progress(self, advance):
+        """
+        stream_map 的回報函式: 更新進度並發出 on_download
+
+        Args:
+            advance: events.stage() 產生的進度函式 (可為 None)
+
+        Returns:
+            progress(code, error); 沒有任何 listener 時為 None
+        """
+        downloads = self.events.handlers('on_download')
+        if advance is None and not downloads:
+            return None
+        def progress(code, error):
+            if advance is not None:
+                advance()
+            for handler in downloads:
+                handler(code=code, error=error)
+        return progress
+        
     def get_watchlist(self):
         """取得 watchlist 物件"""
         return self.watchlist
         
+    def tenant(self, watchlist: TradingViewWatchlist) -> 'MarketDataProvider':
+        """
+        建立另一個 watchlist 的數據提供者 - 共用原始數據、指標快取與事件分派, 建立狀態各自保存
+        
+        Args:
+            watchlist: 此提供者使用的 TradingView 投資組合清單
+        """
+        provider = copy.copy(self)
+        provider.watchlist = watchlist
+        provider.state = None
+        return provider
+        
+    @staticmethod
+    def _watchlist_codes(watchlist: TradingViewWatchlist) -> list:
+        """watchlist 的所有股票代碼 (依產業與來源順序, 可能重複)"""
+        watchlist_dict = watchlist.todict()
+        return [
+            code for industry in watchlist_dict 
+            for provider in watchlist_dict[industry] 
+            for code in watchlist_dict[industry][provider]
+        ]
+        
+    def fetch_history(self, ticker: str, period: str = "15y", interval: str = "1d", load=None,
+                      columns: tuple = None) -> pd.DataFrame:
+        """
+        經由原始數據層取得歷史數據 - 同一資料日期 (checkpoint_key) 內每檔股票只下載一次 
+        (超過 RAW_STORE_BYTES 時最久未使用的數據會被淘汰)
+        
+        Args:
+            load: 實際下載函式 load(ticker) (預設: get_history_with_unified_datetime)
+            columns: 只保存這些欄位 (預設: 全部), 其餘欄位下載後即釋放
+        """
+        if self.raw_store.reset(self.checkpoint_key()):
+            self.feature_store.clear()
+        if load is None:
+            load = lambda t: self.get_history_with_unified_datetime(t, period=period, interval=interval)
+        if columns is None:
+            fetch = lambda: load(ticker)
+        else:
+            # copy 才不會引用原本的 OHLCV 區塊
+            columns = tuple(columns)
+            fetch = lambda: load(ticker)[list(columns)].copy()
+        return self.raw_store.get((ticker, period, interval, columns), fetch)
+        
+    def clear_cache(self):
+        """清空原始數據與指標快取 (下次建立重新下載)"""
+        self.raw_store.clear()
+        self.feature_store.clear()
+        
     def get_history_with_unified_datetime(self, ticker: str, period: str = "15y", interval: str = "1d") -> pd.DataFrame:
-        """下載股票歷史數據"""
-        df = yf.Ticker(ticker).history(period=period, interval=interval)
+        """下載股票歷史數據 (經由共用的 yahoo client 限流、重試與斷路器)"""
+        df = get_client('yahoo').call(
+            ('history', ticker, period, interval),
+            lambda: yf.Ticker(ticker).history(period=period, interval=interval)
+        )
         df = df.tz_localize(None)
         df = df.sort_index()
         return df
         
-    def calculate_rainbow_bands(self, df: pd.DataFrame) -> pd.DataFrame:
-        """計算彩虹圖波段"""
+    def calculate_rainbow_bands(self, df: pd.DataFrame, mode: str = 'full') -> pd.DataFrame:
+        """
+        計算彩虹圖波段
+        
+        Args:
+            mode: 'full' 以全樣本回歸與殘差分位數 (歷史波段使用未來資料);
+                  'expanding' 逐日只使用當日以前的資料 (point-in-time)
+        """
+        if mode not in self.BAND_MODES:
+            raise ValueError(f"Unknown band mode: {mode} (expected one of {self.BAND_MODES})")
         df = df.copy()
         
         # 對數-對數回歸
@@ -114,16 +293,21 @@ class MarketDataProvider:
         df['ln_days'] = np.log(df['days'])
         df['log10_price'] = np.log10(df['Close'])
         
-        a, b = np.polyfit(df['ln_days'], df['log10_price'], deg=1)
-        df['log10_trend'] = a * df['ln_days'] + b
-        df['resid'] = df['log10_price'] - df['log10_trend']
-        
         # 計算分位數波段
         quantiles = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
-        resid_levels = np.quantile(df['resid'], quantiles)
+        if mode == 'expanding':
+            log10_trend, resid, resid_levels = expanding_rainbow_levels(
+                df['ln_days'].to_numpy(), df['log10_price'].to_numpy(), quantiles)
+            df['log10_trend'] = log10_trend
+            df['resid'] = resid
+        else:
+            a, b = np.polyfit(df['ln_days'], df['log10_price'], deg=1)
+            df['log10_trend'] = a * df['ln_days'] + b
+            df['resid'] = df['log10_price'] - df['log10_trend']
+            resid_levels = np.broadcast_to(np.quantile(df['resid'], quantiles), (len(df), len(quantiles)))
         
-        for i, rl in enumerate(resid_levels):
-            band_log10 = df['log10_trend'] + rl
+        for i in range(len(quantiles)):
+            band_log10 = df['log10_trend'] + resid_levels[:, i]
             df[f'Band_{i+1}'] = 10 ** band_log10
             
         df['Trend'] = 10 ** df['log10_trend']
@@ -188,68 +372,352 @@ class MarketDataProvider:
         df["Sharpe"] = rolling_mean / rolling_std * np.sqrt(sharpe_window)
         return df
         
-    def calculate_slope(self, series: pd.Series, slope_window: int = 365) -> pd.Series:
-        """計算斜率"""
-        slopes = [np.nan] * slope_window
-        for i in range(slope_window, len(series)):
-            x = np.arange(slope_window)
-            y = series[i-slope_window:i]
-            slope, _, _, _, _ = linregress(x, y)
-            slopes.append(slope)
-        return pd.Series(slopes, index=series.index)
-        
-    def get_stock_full_info(self, ticker: str, sharpe_window: int = 365) -> pd.DataFrame:
-        """取得單一股票完整資訊"""
-        df = self.get_history_with_unified_datetime(ticker)
-        df = self.calculate_rainbow_bands(df)
-        df = self.calculate_statistical_indicators(df)
+    def get_stock_full_info(self, ticker: str, sharpe_window: int = 365, columns: list = None,
+                            band_mode: str = 'full') -> pd.DataFrame:
+        """
+        取得單一股票完整資訊
+        
+        Args:
+            ticker: 股票代碼
+            sharpe_window: 計算 Sharpe 比率的視窗大小
+            columns: 需要的個股欄位 (TICKER_COLUMNS 的 key, 預設全部); 
+                     不需要 Base/Volatility/Beta 時略過彩虹圖與統計指標
+            band_mode: 彩虹圖波段計算方式 ('full' 或 'expanding', 見 calculate_rainbow_bands)
+        """
+        df = self.fetch_history(ticker)
+        return self.compute_stock_info(df, sharpe_window=sharpe_window, columns=columns, band_mode=band_mode)
+        
+    def compute_stock_info(self, df: pd.DataFrame, sharpe_window: int = 365, columns: list = None,
+                           band_mode: str = 'full') -> pd.DataFrame:
+        """由歷史數據計算單一股票指標 (參數同 get_stock_full_info)"""
+        if columns is None or set(columns) & {'Base', 'Volatility', 'Beta'}:
+            df = self.calculate_rainbow_bands(df, mode=band_mode)
+            df = self.calculate_statistical_indicators(df)
+        else:
+            # 與彩虹圖相同, 排除第一個交易日
+            df = df[df.index > df.index.min()]
         df = self.calculate_sharpe(df, price_col='Close', sharpe_window=sharpe_window)
         return df
         
+    def checkpoint_key(self) -> str:
+        """下載檢查點的鍵值 - 同一天的檢查點可續傳, 隔天重新下載"""
+        return pd.Timestamp.today().strftime('%Y-%m-%d')
+        
+    def compute_ticker_indicators(self, history: pd.DataFrame, sharpe_window: int = 365, 
+                                  columns: list = None) -> pd.DataFrame:
+        """
+        只計算個股需要的欄位 (download_stock_data 的精簡路徑)
+        
+        只取收盤價並以 compute_indicators 在陣列上計算, 不建立彩虹圖波段等中間欄位;
+        結果與 compute_stock_info 的對應欄位相同。
+        
+        Args:
+            history: 股票歷史數據
+            sharpe_window: 計算 Sharpe 比率的視窗大小
+            columns: 需要的個股欄位 (TICKER_COLUMNS 的 key, 預設全部; Close 一律包含)
+            
+        Returns:
+            以 TICKER_COLUMNS 的 key 為欄位的 DataFrame (已排除第一個交易日)
+        """
+        columns = list(self.TICKER_COLUMNS) if columns is None else columns
+        columns = ['Close'] + [c for c in columns if c != 'Close']
+        close = self._close_series(history)
+        result = compute_indicators(close.to_frame(), sharpe_window=sharpe_window, columns=columns)
+        return pd.DataFrame({column: result[column].iloc[:, 0] for column in columns})
+        
+    def _close_series(self, history: pd.DataFrame) -> pd.Series:
+        """取出收盤價 (與彩虹圖相同, 排除第一個交易日)"""
+        if history.empty:
+            raise ValueError("no price data")
+        return history['Close'][history.index > history.index.min()]
+        
     def download_stock_data(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, 
-                           sharpe_window: int = 365) -> pd.DataFrame:
-        """下載所有股票數據"""
-        watchlist_dict = watchlist.todict()
+                           sharpe_window: int = 365, columns: list = None, states: dict = None,
+                           vectorized: bool = True, compact: bool = False,
+                           io_workers: int = None, queue_size: int = None, compute_workers: int = None,
+                           checkpoint: str = None, codes: list = None) -> pd.DataFrame:
+        """
+        下載所有股票數據
+        
+        下載 (I/O) 與計算以 producer-consumer 管線重疊執行 (見 stream_map), 
+        結果依 watchlist 順序組合, 與逐檔依序處理相同。
         
-        for industry in tqdm(watchlist_dict, desc="Downloading data"):
-            for provider in watchlist_dict[industry]:
-                for code in watchlist_dict[industry][provider]:
-                    try:
-                        temp_df = self.get_stock_full_info(code, sharpe_window=sharpe_window)
-                        df[f'{code}_Close'] = temp_df['Close']
-                        df[f'{code}_Sharpe'] = temp_df['Sharpe']
-                        df[f'{code}_Base'] = temp_df['base_weights']
-                        df[f'{code}_Volatility'] = temp_df['volatilities']
-                        df[f'{code}_Beta'] = temp_df['betas']
-                    except Exception as e:
-                        print(f"⚠️ Failed to download {code}: {e}")
+        Args:
+            columns: 需要的個股欄位 (TICKER_COLUMNS 的 key, 預設全部)
+            states: 若提供, 寫入各股票的 TickerState 供增量更新使用
+            vectorized: 收盤價每累積約 queue_size 檔, 即在計算執行緒中以 dates × tickers 矩陣
+                        計算這一批的指標, 同時下載繼續進行 (結果與逐檔計算相同); 
+                        False 時逐檔以 compute_ticker_indicators 計算, 同時只保留一檔的收盤價與所需欄位
+            compact: 個股指標以 float32 儲存 (見 compact_frame)
+            io_workers: 同時下載的執行緒數量 (預設: IO_WORKERS)
+            queue_size: 等待計算的原始數據上限, 控制記憶體, 也是每批計算的股票數 (預設: QUEUE_SIZE)
+            compute_workers: 計算執行緒數量 (預設: COMPUTE_WORKERS)
+            checkpoint: 檢查點目錄 (可選); 每檔股票下載完成即寫入, 中斷後再次執行只下載未完成的股票
+            codes: 要下載的股票代碼 (預設: watchlist 的所有股票, 指定時可不傳 watchlist)
+        """
+        columns = list(self.TICKER_COLUMNS) if columns is None else columns
+        codes = self._watchlist_codes(watchlist) if codes is None else codes
+        queue_size = queue_size or self.QUEUE_SIZE
+        dtype = np.float32 if compact else float
+        
+        load = self.get_history_with_unified_datetime
+        if checkpoint is not None:
+            checkpoint = DownloadCheckpoint(checkpoint, key=self.checkpoint_key())
+            checkpoint.start(codes)
+            resumed = len(checkpoint.manifest()['completed'])
+            load = checkpoint.wrap(load)
+        fetch = lambda code: self.fetch_history(code, load=load, columns=self.RAW_COLUMNS)
+        
+        if vectorized:
+            # 下載端只保留收盤價, 計算端每批以矩陣計算並對齊到大盤交易日
+            download = lambda code: self._close_series(fetch(code))
+            
+            def process(batch, closes):
+                closes = dict(zip(batch, closes))
+                features = self._get_features(closes, columns, sharpe_window)
+                return [
+                    (closes[code], {column: features[code, column].reindex(df.index).astype(dtype)
+                                    for column in columns})
+                    for code in batch
+                ]
+        else:
+            download = fetch
+            process = lambda code, history: self.compute_ticker_indicators(
+                history, sharpe_window=sharpe_window, columns=columns)
+        
+        with self.events.stage('download', total=len(codes), desc="Downloading data") as advance:
+            results = stream_map(
+                codes, download, process,
+                io_workers=io_workers or self.IO_WORKERS,
+                compute_workers=compute_workers or self.COMPUTE_WORKERS,
+                queue_size=queue_size,
+                progress=self._download_progress(advance),
+                batch_size=queue_size if vectorized else None,
+            )
+        
+        outputs, circuit_open = {}, []
+        for code, result, error in results:
+            if error is not None:
+                # 斷路器開啟時其餘股票都會失敗, 彙總為一則訊息
+                if isinstance(error, CircuitOpenError):
+                    circuit_open.append(code)
+                else:
+                    print(f"⚠️ Failed to download {code}: {error}")
+                if checkpoint is not None:
+                    checkpoint.fail(code, error)
+            else:
+                outputs[code] = result
+        if circuit_open:
+            print(f"⚠️ Skipped {len(circuit_open)} tickers while the data source circuit is open "
+                  f"(no cached data): {', '.join(circuit_open[:5])}{' ...' if len(circuit_open) > 5 else ''}")
+        if checkpoint is not None:
+            manifest = checkpoint.manifest()
+            print(f"💾 Checkpoint: {len(manifest['completed'])} completed ({resumed} resumed), "
+                  f"{len(manifest['failed'])} failed, {len(manifest['pending'])} pending")
+        
+        if vectorized:
+            indicators = {
+                f'{code}_{column}': series
+                for code, (_, aligned) in outputs.items() for column, series in aligned.items()
+            }
+            df = pd.concat([df, pd.DataFrame(indicators, index=df.index)], axis=1)
+            if states is not None:
+                for code, (close, _) in outputs.items():
+                    states[code] = TickerState.from_history(close, sharpe_window)
+            return df.ffill()
+        
+        df = self._assign_columns(df, {
+            f'{code}_{column}': temp_df[column] for code, temp_df in outputs.items() for column in columns
+        })
+        if states is not None:
+            for code, temp_df in outputs.items():
+                states[code] = TickerState.from_history(temp_df['Close'], sharpe_window)
                         
-        return df.ffill()
+        df = df.ffill()
+        return self.compact_frame(df) if compact else df
+        
+    def _get_features(self, closes: dict, columns: list, sharpe_window: int) -> dict:
+        """
+        由指標快取取得個股指標, 只計算快取中沒有的 (ticker, indicator, params)
+        
+        Returns:
+            {(ticker, 欄位): 個股交易日曆上的指標序列}
+        """
+        def key(code, column):
+            params = {'sharpe_window': sharpe_window, 'risk_free_rate': 0.04} if column == 'Sharpe' else {}
+            return FeatureStore.make_key(code, column, params)
+        
+        features, missing = {}, {}
+        for code, close in closes.items():
+            need = []
+            for column in columns:
+                if column == 'Close':
+                    features[code, column] = close
+                    continue
+                series = self.feature_store.get(key(code, column))
+                if series is None:
+                    need.append(column)
+                else:
+                    features[code, column] = series
+            if need:
+                missing.setdefault(tuple(need), []).append(code)
+        
+        # 缺少相同欄位的股票一起以矩陣計算
+        for need, codes in missing.items():
+            computed = compute_universe_indicators({code: closes[code] for code in codes}, None, 
+                                                   sharpe_window=sharpe_window, columns=list(need))
+            for code in codes:
+                for column in need:
+                    series = computed[f'{code}_{column}'].copy()
+                    self.feature_store.put(key(code, column), series)
+                    features[code, column] = series
+        return features
+        
+    def calculate_slopes(self, df: pd.DataFrame, slope_window: int = 365) -> pd.DataFrame:
+        """
+        對多個序列一次計算斜率 (第 i 列為前 slope_window 筆對 0..slope_window-1 的最小平方迴歸斜率, 不含第 i 列)
+        
+        斜率 = Σ (t - j - c) * y_t / Σ (x - c)^2, 其中 j 為視窗起點, c 為 x 的平均
+        """
+        t = np.arange(len(df), dtype=float)[:, None]
+        center = (slope_window - 1) / 2
+        x = np.arange(slope_window) - center
+        
+        sum_y = df.rolling(slope_window).sum().shift(1).to_numpy()
+        sum_ty = (df * t).rolling(slope_window).sum().shift(1).to_numpy()
+        start = t - slope_window
+        slopes = (sum_ty - (start + center) * sum_y) / np.dot(x, x)
+        return pd.DataFrame(slopes, index=df.index, columns=df.columns)
+        
+    def compact_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        轉換為精簡型別: 指標 float32、區段與交叉狀態 int8 (含缺值時為 float32)、文字欄位 category
+        
+        已是精簡型別的欄位不會重複轉換, 可在每次更新後重複呼叫。
+        """
+        dtypes = {}
+        for column, dtype in df.dtypes.items():
+            if column in self.INT8_COLUMNS or column.endswith(self.INT8_SUFFIXES):
+                if dtype != np.int8 and df[column].notna().all():
+                    dtypes[column] = np.int8
+                    continue
+            if dtype == np.float64:
+                dtypes[column] = np.float32
+            elif dtype == object:
+                dtypes[column] = 'category'
+        return df.astype(dtypes) if dtypes else df
+        
+    def _assign_columns(self, df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+        """一次寫入多個欄位 (已存在的欄位原地覆寫, 新欄位依序附加在最後)"""
+        new = pd.DataFrame(columns, index=df.index)
+        existing = [c for c in new.columns if c in df.columns]
+        if existing:
+            df[existing] = new[existing]
+        missing = [c for c in new.columns if c not in df.columns]
+        if missing:
+            df = pd.concat([df, new[missing]], axis=1)
+        return df
         
     def integrate_industry_metrics(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, 
-                                   ma_period: int, slope_window: int = 365) -> pd.DataFrame:
-        """整合產業指標"""
+                                   ma_period: int, slope_window: int = 365, industries: list = None,
+                                   aggregates: tuple = ('Sharpe',)) -> pd.DataFrame:
+        """
+        整合產業指標
+        
+        以 dates × tickers 指標矩陣與 tickers × industries 成員矩陣相乘 (忽略 NaN),
+        一次計算所有產業的平均, 斜率與均線同樣以矩陣方式計算。
+        
+        Args:
+            industries: 只計算這些產業 (預設: 全部)
+            aggregates: 要整合的個股指標, 產生 {industry}_Integrated_{指標} 
+                        (預設只有 Sharpe, 可加入 'Volatility', 'Beta'; 斜率與均線以 Sharpe 計算, 一律包含)
+        """
         watchlist_dict = watchlist.todict()
+        industries = list(watchlist_dict) if industries is None else industries
+        aggregates = ('Sharpe',) + tuple(a for a in dict.fromkeys(aggregates) if a != 'Sharpe')
+        codes, membership = self._industry_membership(watchlist_dict, industries)
         
-        for industry in tqdm(watchlist_dict, desc="Integrating metrics"):
-            sharpe_matrix = pd.DataFrame()
-            for provider in watchlist_dict[industry]:
-                for code in watchlist_dict[industry][provider]:
-                    if f'{code}_Sharpe' in df.columns:
-                        sharpe_matrix[code] = df[f'{code}_Sharpe']
-                        
-            df[f'{industry}_Integrated_Sharpe'] = sharpe_matrix.mean(axis=1, skipna=True)
-            df[f'{industry}_Sharpe_Slope'] = self.calculate_slope(df[f'{industry}_Integrated_Sharpe'], slope_window=slope_window)
-            df[f'{industry}_MA_Short'] = df[f'{industry}_Sharpe_Slope'].rolling(window=ma_period).mean()
-            df[f'{industry}_MA_Long'] = df[f'{industry}_Sharpe_Slope'].rolling(window=ma_period * 4).mean()
-            
-        return df
+        integrated = {}
+        for aggregate in aggregates:
+            # 缺少此指標的股票不列入平均
+            available = np.array([f'{code}_{aggregate}' in df.columns for code in codes], dtype=bool)
+            matrix = np.full((len(df), len(codes)), np.nan)
+            if available.any():
+                matrix[:, available] = df[[f'{code}_{aggregate}' for code in np.array(codes)[available]]].to_numpy(dtype=float)
+            sums, counts = self._industry_totals(matrix, membership)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                integrated[aggregate] = pd.DataFrame(np.where(counts > 0, sums / counts, np.nan), 
+                                                     index=df.index, columns=industries)
+        
+        columns = self._industry_columns(integrated, industries, slope_window=slope_window, ma_period=ma_period)
+        return self._assign_columns(df, columns)
+        
+    @staticmethod
+    def _industry_membership(watchlist_dict: dict, industries: list):
+        """
+        成員矩陣
+        
+        Returns:
+            (codes, membership): 不重複的股票列表與 tickers × industries 的稀疏成員矩陣
+        """
+        codes = list(dict.fromkeys(
+            code 
+            for industry in industries 
+            for provider in watchlist_dict[industry] 
+            for code in watchlist_dict[industry][provider]
+        ))
+        position = {code: i for i, code in enumerate(codes)}
+        members = [
+            (position[code], j) 
+            for j, industry in enumerate(industries) 
+            for code in dict.fromkeys(c for provider in watchlist_dict[industry] for c in watchlist_dict[industry][provider])
+        ]
+        rows, cols = zip(*members) if members else ((), ())
+        membership = sparse.csr_matrix((np.ones(len(members)), (rows, cols)), shape=(len(codes), len(industries)))
+        return codes, membership
+        
+    @staticmethod
+    def _industry_totals(matrix: np.ndarray, membership) -> tuple:
+        """
+        dates × tickers 指標矩陣依成員矩陣加總 (忽略 NaN)
         
-    def find_turning_points(self, df: pd.DataFrame, watchlist: TradingViewWatchlist) -> pd.DataFrame:
-        """偵測高低轉折點"""
+        Returns:
+            (sums, counts): 皆為 dates × industries, 可分批計算後相加
+        """
+        valid = ~np.isnan(matrix)
+        sums = membership.T.dot(np.where(valid, matrix, 0.0).T).T
+        counts = membership.T.dot(valid.T.astype(float)).T
+        return sums, counts
+        
+    def _industry_columns(self, integrated: dict, industries: list, slope_window: int, ma_period: int) -> dict:
+        """由各指標的產業平均計算斜率與均線, 回傳依產業排列的產業欄位"""
+        slopes = self.calculate_slopes(integrated['Sharpe'], slope_window=slope_window)
+        ma_short = slopes.rolling(window=ma_period).mean()
+        ma_long = slopes.rolling(window=ma_period * 4).mean()
+        
+        columns = {}
+        for industry in industries:
+            columns[f'{industry}_Integrated_Sharpe'] = integrated['Sharpe'][industry]
+            columns[f'{industry}_Sharpe_Slope'] = slopes[industry]
+            columns[f'{industry}_MA_Short'] = ma_short[industry]
+            columns[f'{industry}_MA_Long'] = ma_long[industry]
+            for aggregate in integrated:
+                if aggregate != 'Sharpe':
+                    columns[f'{industry}_Integrated_{aggregate}'] = integrated[aggregate][industry]
+        return columns
+        
+    def find_turning_points(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, 
+                            industries: list = None) -> pd.DataFrame:
+        """
+        偵測高低轉折點
+        
+        Args:
+            industries: 只計算這些產業 (預設: 全部)
+        """
         watchlist_dict = watchlist.todict()
+        industries = list(watchlist_dict) if industries is None else industries
         
-        for industry in tqdm(watchlist_dict, desc="Finding change points"):
+        for industry in self.events.track(industries, 'turning_points', desc="Finding change points"):
             dir_series = df[f"{industry}_MA_Short"] > df[f"{industry}_MA_Long"]
             slope = df[f"{industry}_Sharpe_Slope"]
             highs = [i for i in find_peaks(slope)[0] if dir_series.iloc[i]]
@@ -297,49 +765,66 @@ class MarketDataProvider:
             
         return state
         
-    def summary_overall_state(self, df: pd.DataFrame, watchlist: TradingViewWatchlist) -> pd.DataFrame:
-        """彙總整體狀態"""
+    def summary_overall_state(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, 
+                              industries: list = None) -> pd.DataFrame:
+        """
+        彙總整體狀態
+        
+        Args:
+            industries: 只重算這些產業的交叉狀態 (預設: 全部), Trend 仍彙總所有產業
+        """
         watchlist_dict = watchlist.todict()
-        df['Trend'] = 0
+        industries = list(watchlist_dict) if industries is None else industries
         
-        for industry in tqdm(watchlist_dict, desc="Summary overall state"):
+        for industry in self.events.track(industries, 'overall_state', desc="Summary overall state"):
             df[f"{industry}_Crossover_State"] = self.generate_crossover_state(
                 df[f"{industry}_MA_Short"], 
                 df[f"{industry}_MA_Long"]
             )
-            df['Trend'] += df[f"{industry}_Crossover_State"]
             
+        df['Trend'] = sum(df[f"{industry}_Crossover_State"] for industry in watchlist_dict)
         df['Trend'] = df['Trend'] / len(watchlist_dict.keys())
         return df
         
-    def build_decline_prediction(self, df: pd.DataFrame, watchlist: TradingViewWatchlist) -> pd.DataFrame:
-        """建立下跌預測模型"""
-        watchlist_dict = watchlist.todict()
+    def build_decline_prediction(self, df: pd.DataFrame, watchlist: TradingViewWatchlist,
+                                 model: DeclineModel = None) -> pd.DataFrame:
+        """
+        建立下跌預測模型
         
-        data = pd.concat([
-            pd.DataFrame({
-                'Industry': industry,
-                'Trend': df['Trend'],
-                'State': df[f'{industry}_Crossover_State'],
-                'Decline': df[f'{industry}_CP']
-            }) for industry in watchlist_dict
-        ]).dropna()
-        
-        model = LogisticRegression().fit(data[['Trend', 'State']], data['Decline'])
-        
-        for industry in watchlist_dict:
-            X = pd.DataFrame({
-                'Trend': df['Trend'], 
-                'State': df[f'{industry}_Crossover_State']
-            })
-            df[f'{industry}_Decline'] = model.predict_proba(X)[:, 1]
-            
-        return df
+        各產業的 (Trend, State) 與轉折點疊成單一 NumPy 設計矩陣共同訓練, 
+        再以一次 predict_proba 預測所有產業。
+        
+        Args:
+            model: 保存的 DeclineModel (可選); 訓練資料未變時沿用, 否則以既有係數 warm start 重新訓練
+        """
+        industries = list(watchlist.todict())
+        n = len(df)
+        
+        trend = np.tile(df['Trend'].to_numpy(dtype=float), len(industries))
+        states = np.concatenate([df[f'{industry}_Crossover_State'].to_numpy(dtype=float) for industry in industries])
+        points = np.concatenate([df[f'{industry}_CP'].to_numpy(dtype=float) for industry in industries])
+        X = np.column_stack([trend, states])
+        
+        valid = ~np.isnan(X).any(axis=1) & ~np.isnan(points)
+        model = DeclineModel() if model is None else model
+        model.fit(X[valid], points[valid])
+        
+        probabilities = model.model.predict_proba(X)[:, 1].reshape(len(industries), n)
+        return self._assign_columns(df, {
+            f'{industry}_Decline': probabilities[i]
+            for i, industry in enumerate(industries)
+        })
         
     def build_portfolio_data(self, watchlist: TradingViewWatchlist, 
                             sharpe_window: int = 365, 
                             slope_window: int = 365, 
-                            ma_period: int = 30) -> pd.DataFrame:
+                            ma_period: int = 30,
+                            fields: list = None,
+                            band_mode: str = 'full',
+                            compact: bool = False,
+                            checkpoint: str = None,
+                            memory_budget: int = None,
+                            spill_dir: str = None) -> pd.DataFrame:
         """
         建立完整投資組合數據
         
@@ -348,26 +833,454 @@ class MarketDataProvider:
             sharpe_window: 計算 Sharpe 比率的視窗大小 (預設: 365天)
             slope_window: 計算斜率的視窗大小 (預設: 365天)
             ma_period: 產業移動平均的短期週期 (預設: 30天, 長期為 30*4=120天)
+            fields: 需求欄位樣板 (如 '{code}_Sharpe', '{industry}_Crossover_State'), 
+                    只執行產生這些欄位所需的階段 (預設: 全部)
+            band_mode: 大盤彩虹圖 (Trend / segments) 的計算方式, 'expanding' 為 point-in-time, 
+                       回測不使用未來資料 (預設: 'full')
+            compact: 精簡記憶體模式 - 指標 float32、區段與交叉狀態 int8 (約為一半記憶體)
+            checkpoint: 下載檢查點目錄 (可選), 中斷後重新執行可從檢查點續傳
+            memory_budget: 建立期間的記憶體上限 (bytes, 不含已載入的程式庫, 如 1 * 2 ** 30); 指定時個股分塊下載計算, 
+                           個股欄位裁切 warmup 後寫入磁碟, 回傳的數據以 memmap 引用 (見 _build_chunked)
+            spill_dir: memory_budget 模式寫入個股欄位的目錄 (預設為系統暫存目錄)
         """
+        stages, columns = resolve_stages(fields)
+        params = {'sharpe_window': sharpe_window, 'slope_window': slope_window, 'ma_period': ma_period,
+                  'band_mode': band_mode, 'compact': compact}
+        if memory_budget is not None:
+            return self._build_chunked(watchlist, params, stages, columns, memory_budget, 
+                                       spill_dir=spill_dir, checkpoint=checkpoint)
+        ticker_states = {}
+        
         # 以大盤指數為基準建立時間序列
-        df = self.get_stock_full_info('^IXIC', sharpe_window=sharpe_window)
+        df = self.get_stock_full_info('^IXIC', sharpe_window=sharpe_window, band_mode=band_mode)
         
         # 下載個股數據
-        df = self.download_stock_data(df, watchlist, sharpe_window=sharpe_window)
+        if 'download' in stages:
+            with self.events.stage('build.download'):
+                df = self.download_stock_data(df, watchlist, sharpe_window=sharpe_window, columns=columns,
+                                              states=ticker_states, compact=compact, checkpoint=checkpoint)
         
-        # 整合產業指標
-        df = self.integrate_industry_metrics(df, watchlist, ma_period=ma_period, slope_window=slope_window)
+        return self._build_watchlist(df, watchlist, params, stages, columns, fields, ticker_states)
         
-        # 偵測轉折點
-        df = self.find_turning_points(df, watchlist)
+    def build_many(self, watchlists: Dict[str, TradingViewWatchlist],
+                   sharpe_window: int = 365, 
+                   slope_window: int = 365, 
+                   ma_period: int = 30,
+                   fields: list = None,
+                   band_mode: str = 'full',
+                   compact: bool = False,
+                   checkpoint: str = None) -> Dict[str, 'MarketDataProvider']:
+        """
+        多個 watchlist 一次建立 - 個股數據以所有 watchlist 的股票聯集只下載、計算一次
         
-        # 彙總整體狀態
-        df = self.summary_overall_state(df, watchlist)
+        大盤指數與個股指標 (download 階段) 共用, 各 watchlist 只各自執行產業整合、轉折點、
+        整體狀態與下跌預測; 建立成本隨不重複的股票數增加, 而非各清單股票數的總和。
+        各 watchlist 的結果與分別呼叫 build_portfolio_data 相同。
         
-        # 建立下跌預測
-        df = self.build_decline_prediction(df, watchlist)
+        Args:
+            watchlists: {名稱: TradingView 投資組合清單}
+            其餘參數同 build_portfolio_data
+            
+        Returns:
+            {名稱: 數據提供者 (tenant)}, 各自保存建立狀態, 可個別 update / apply_watchlist_changes;
+            裁切 warmup 後的數據為 provider.state.frame.iloc[WARMUP_DAYS:]
+        """
+        stages, columns = resolve_stages(fields)
+        ticker_states = {}
+        
+        shared = self.get_stock_full_info('^IXIC', sharpe_window=sharpe_window, band_mode=band_mode)
+        base_columns = list(shared.columns)
+        codes = list(dict.fromkeys(code for watchlist in watchlists.values() for code in self._watchlist_codes(watchlist)))
+        if 'download' in stages:
+            with self.events.stage('build.download'):
+                shared = self.download_stock_data(shared, None, sharpe_window=sharpe_window, columns=columns,
+                                                  states=ticker_states, compact=compact, checkpoint=checkpoint,
+                                                  codes=codes)
+            listed = sum(len(set(self._watchlist_codes(watchlist))) for watchlist in watchlists.values())
+            print(f"📦 Shared ticker data: {len(codes)} unique tickers for {len(watchlists)} watchlists "
+                  f"({listed} listed)")
+        
+        params = {'sharpe_window': sharpe_window, 'slope_window': slope_window, 'ma_period': ma_period,
+                  'band_mode': band_mode, 'compact': compact}
+        tenants = {}
+        for name, watchlist in watchlists.items():
+            tenant = self.tenant(watchlist)
+            # 依 watchlist 順序取出自己的個股欄位 (下載失敗的股票沒有狀態也沒有欄位)
+            present = [code for code in dict.fromkeys(self._watchlist_codes(watchlist)) if code in ticker_states]
+            df = shared[base_columns + [f'{code}_{column}' for code in present for column in columns]]
+            # 增量狀態會被 update 推進, 每個 watchlist 各自一份
+            states = {code: copy.deepcopy(ticker_states[code]) for code in present}
+            with self.events.stage(f'build.{name}'):
+                tenant._build_watchlist(df, watchlist, params, stages, columns, fields, states)
+            tenants[name] = tenant
+        return tenants
         
-        # 清理數據
-        df = df.ffill().iloc[912:, :]
+    def _run_stages(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, params: dict, stages: list,
+                    decline_model: DeclineModel) -> pd.DataFrame:
+        """依序執行 download 之後的階段 (產業整合、轉折點、整體狀態、下跌預測)"""
+        runners = {
+            # 整合產業指標
+            'industry': lambda df: self.integrate_industry_metrics(df, watchlist, ma_period=params['ma_period'], 
+                                                                   slope_window=params['slope_window']),
+            # 偵測轉折點
+            'turning_points': lambda df: self.find_turning_points(df, watchlist),
+            # 彙總整體狀態
+            'overall_state': lambda df: self.summary_overall_state(df, watchlist),
+            # 建立下跌預測
+            'decline': lambda df: self.build_decline_prediction(df, watchlist, model=decline_model),
+        }
         
+        for stage in stages:
+            if stage in runners:
+                with self.events.stage(f'build.{stage}'):
+                    df = runners[stage](df)
         return df
+        
+    def _chunk_size(self, memory_budget: int, n_days: int, n_columns: int, reserved: int = 0) -> int:
+        """
+        memory_budget 模式每塊的股票數
+        
+        每檔股票約需 CHUNK_ARRAYS 個計算用的日序列, 加上輸出欄位的兩份 (計算結果與寫入前的陣列);
+        下載中的原始數據 (最多 IO_WORKERS + QUEUE_SIZE 檔 OHLCV) 與 reserved 先自上限扣除。
+        """
+        in_flight = (self.IO_WORKERS + self.QUEUE_SIZE) * n_days * 8 * 8
+        per_ticker = n_days * 8 * (self.CHUNK_ARRAYS + 2 * n_columns)
+        return max(1, int((memory_budget - in_flight - reserved) // per_ticker))
+        
+    def _build_chunked(self, watchlist: TradingViewWatchlist, params: dict, stages: list, columns: list,
+                       memory_budget: int, spill_dir: str = None, checkpoint: str = None) -> pd.DataFrame:
+        """
+        記憶體上限模式的建立 - 結果與一般建立相同 (產業平均分塊累加, 僅有浮點捨入差異)
+        
+        - 個股分塊下載與計算 (塊大小依 memory_budget 決定), 原始數據不進入共用快取, 處理完即釋放
+        - 每塊的 Sharpe 先累加到產業總和 (產業指標需要完整歷史), 之後個股欄位只有裁切後的交易日會用到,
+          立即丟棄 warmup 並寫入 SpillStore (.npy, 每欄連續)
+        - 產業與市場層級欄位 (每產業數欄) 保留完整歷史在記憶體中, 轉折點與下跌預測依定義使用全樣本
+        - 最後以 memmap 組合成裁切 warmup 後的數據, 個股欄位在讀取時才載入
+        
+        不保存增量更新狀態 (self.state 為 None), 之後需以相同參數重新建立。
+        建立失敗時刪除已寫入的區塊目錄。
+        
+        Returns:
+            裁切 warmup 後的投資組合數據
+        """
+        sharpe_window = params['sharpe_window']
+        df = self.get_stock_full_info('^IXIC', sharpe_window=sharpe_window, band_mode=params['band_mode'])
+        base_columns = list(df.columns)
+        warmup = min(self.WARMUP_DAYS, len(df))
+        watchlist_dict = watchlist.todict()
+        industries = list(watchlist_dict)
+        store = SpillStore(spill_dir)
+        self.state = None
+        try:
+            if 'download' in stages:
+                codes = list(dict.fromkeys(self._watchlist_codes(watchlist)))
+                dtype = np.float32 if params['compact'] else np.float64
+                members, membership = self._industry_membership(watchlist_dict, industries)
+                position = {code: i for i, code in enumerate(members)}
+                sums = np.zeros((len(df), len(industries)))
+                counts = np.zeros((len(df), len(industries)))
+                chunk_size = self._chunk_size(memory_budget, len(df), len(columns),
+                                              reserved=df.memory_usage(deep=True).sum() + 2 * sums.nbytes)
+                
+                load = self.get_history_with_unified_datetime
+                if checkpoint is not None:
+                    checkpoint = DownloadCheckpoint(checkpoint, key=self.checkpoint_key())
+                    checkpoint.start(codes)
+                    resumed = len(checkpoint.manifest()['completed'])
+                    load = checkpoint.wrap(load)
+                
+                with self.events.stage('build.download'), \
+                        self.events.stage('download', total=len(codes), desc="Downloading data") as advance:
+                    for start in range(0, len(codes), chunk_size):
+                        results = stream_map(
+                            codes[start:start + chunk_size], load, lambda code, history: self._close_series(history),
+                            io_workers=self.IO_WORKERS, queue_size=self.QUEUE_SIZE,
+                            progress=self._download_progress(advance),
+                        )
+                        closes = {}
+                        for code, close, error in results:
+                            if error is not None:
+                                print(f"⚠️ Failed to download {code}: {error}")
+                                if checkpoint is not None:
+                                    checkpoint.fail(code, error)
+                            else:
+                                closes[code] = close
+                        if not closes:
+                            continue
+                        
+                        done = list(closes)
+                        computed = compute_universe_indicators(closes, df.index, sharpe_window=sharpe_window,
+                                                               columns=columns, dtype=dtype)
+                        chunk = pd.DataFrame(computed, index=df.index)
+                        del computed, closes
+                        chunk = chunk.ffill()
+                        if 'industry' in stages:
+                            chunk_sums, chunk_counts = self._industry_totals(
+                                chunk[[f'{code}_Sharpe' for code in done]].to_numpy(dtype=float),
+                                membership[[position[code] for code in done]],
+                            )
+                            sums += chunk_sums
+                            counts += chunk_counts
+                        store.write(chunk.to_numpy()[warmup:], list(chunk.columns))
+                        del chunk
+                if checkpoint is not None:
+                    manifest = checkpoint.manifest()
+                    print(f"💾 Checkpoint: {len(manifest['completed'])} completed ({resumed} resumed), "
+                          f"{len(manifest['failed'])} failed, {len(manifest['pending'])} pending")
+                
+                if 'industry' in stages:
+                    with self.events.stage('build.industry'), np.errstate(divide='ignore', invalid='ignore'):
+                        integrated = {'Sharpe': pd.DataFrame(np.where(counts > 0, sums / counts, np.nan),
+                                                             index=df.index, columns=industries)}
+                        df = self._assign_columns(df, self._industry_columns(
+                            integrated, industries, slope_window=params['slope_window'], ma_period=params['ma_period']))
+                print(f"💾 Spilled {store.nbytes / 2 ** 20:.1f} MB of ticker columns in {len(store)} chunks "
+                      f"({min(chunk_size, len(codes))} tickers each) to {store.directory}")
+            
+            # 市場與產業層級的階段只使用產業欄位
+            stages = [stage for stage in stages if stage not in ('download', 'industry')]
+            df = self._run_stages(df, watchlist, params, stages, DeclineModel())
+            df = df.ffill()
+            if params['compact']:
+                df = self.compact_frame(df)
+            
+            # 組合: 大盤指數欄位, 個股欄位 (memmap), 產業與市場欄位 (與一般建立的欄位順序相同)
+            df = df.iloc[warmup:, :]
+            rest = [column for column in df.columns if column not in base_columns]
+            return pd.concat([df[base_columns], store.frame(df.index), df[rest]], axis=1)
+        except BaseException:
+            store.discard()
+            raise
+        
+    def _build_watchlist(self, df: pd.DataFrame, watchlist: TradingViewWatchlist, params: dict,
+                         stages: list, columns: list, fields: list, ticker_states: dict) -> pd.DataFrame:
+        """
+        在個股數據上執行 watchlist 自己的階段 (產業整合之後), 並保存建立狀態
+        
+        Returns:
+            裁切 warmup 後的投資組合數據
+        """
+        decline_model = DeclineModel()
+        df = self._run_stages(df, watchlist, params, stages, decline_model)
+        
+        # 清理數據 (保留完整數據供增量更新)
+        df = df.ffill()
+        if params['compact']:
+            df = self.compact_frame(df)
+        
+        self.state = PortfolioState(
+            frame=df,
+            watchlist=watchlist.todict(),
+            params=params,
+            stages=stages,
+            columns=columns,
+            fields=fields,
+            tickers=ticker_states,
+            decline=decline_model if 'decline' in stages else None,
+        )
+        if 'industry' in stages:
+            self.state.industries = {
+                industry: IndustryState.from_frame(df, industry, params['slope_window'], params['ma_period'])
+                for industry in watchlist.todict()
+            }
+        
+        return df.iloc[self.WARMUP_DAYS:, :]
+        
+    def update(self, watchlist: TradingViewWatchlist = None, refresh: bool = True) -> pd.DataFrame:
+        """
+        增量更新投資組合數據 - 只推進新交易日, 結果與完整重建一致
+        
+        個股與產業指標由保存的累計狀態推進 (每日 O(股票數));
+        大盤指數、轉折點與下跌預測依定義使用全樣本, 仍以完整歷史重算。
+        
+        Args:
+            watchlist: TradingView 投資組合清單 (預設為建立時的清單)
+            refresh: 先清空原始數據快取以取得最新數據 (update_many 只在第一次清空, 其餘共用)
+            
+        Returns:
+            裁切 warmup 後的投資組合數據
+        """
+        state = self.state
+        if state is None:
+            raise RuntimeError("No portfolio state. Run build_portfolio_data() first.")
+        watchlist = watchlist or self.get_watchlist()
+        
+        frame = state.frame
+        # 取得最新數據 (不使用同一天已下載的原始數據)
+        if refresh:
+            self.clear_cache()
+        base = self.get_stock_full_info('^IXIC', sharpe_window=state.params['sharpe_window'],
+                                        band_mode=state.params.get('band_mode', 'full')).ffill()
+        new_dates = base.index[base.index > frame.index[-1]]
+        if len(new_dates) == 0:
+            return frame.iloc[self.WARMUP_DAYS:, :]
+        
+        # 推進個股狀態
+        rows = {}
+        for code, ticker_state in self.events.track(state.tickers.items(), 'update', desc="Updating data"):
+            try:
+                history = self.fetch_history(code, period=self.UPDATE_PERIOD, columns=self.RAW_COLUMNS)
+            except Exception as e:
+                print(f"⚠️ Failed to update {code}: {e}")
+                continue
+            bars = history['Close'][history.index > ticker_state.last_date]
+            values = [ticker_state.advance(date, close) for date, close in bars.items()]
+            for column in state.columns:
+                rows[f'{code}_{column}'] = pd.Series(
+                    [v[column] for v in values], index=bars.index, dtype=float
+                ).reindex(new_dates)
+        
+        # 新交易日先沿用前一日數值 (與完整建立的 ffill 相同)
+        new = pd.DataFrame(rows, index=new_dates).reindex(columns=frame.columns)
+        new = pd.concat([frame.iloc[[-1]], new]).ffill().iloc[1:]
+        
+        # 推進產業狀態
+        watchlist_dict = watchlist.todict()
+        if 'industry' in state.stages:
+            crossover = []
+            for industry, industry_state in state.industries.items():
+                sharpe_cols = [
+                    f'{code}_Sharpe' 
+                    for provider in watchlist_dict[industry] 
+                    for code in watchlist_dict[industry][provider]
+                    if f'{code}_Sharpe' in new.columns
+                ]
+                integrated = new[sharpe_cols].mean(axis=1, skipna=True)
+                values = pd.DataFrame([industry_state.advance(v) for v in integrated], index=new_dates)
+                for column in values.columns:
+                    new[f'{industry}_{column}'] = values[column]
+                if 'Crossover_State' in values.columns:
+                    crossover.append(values['Crossover_State'])
+            if 'overall_state' in state.stages:
+                new['Trend'] = sum(crossover) / len(watchlist_dict.keys())
+        
+        # 大盤指數欄位以完整重算結果覆寫 (全樣本彩虹圖會隨新資料改變)
+        frame = pd.concat([frame, new.astype(frame.dtypes)])
+        base_cols = [c for c in base.columns if not (c == 'Trend' and 'overall_state' in state.stages)]
+        frame[base_cols] = base[base_cols]
+        
+        industry_cols = [c for c in frame.columns if c.endswith(('_Integrated_Sharpe', '_Sharpe_Slope', '_MA_Short', '_MA_Long'))]
+        frame[industry_cols] = frame[industry_cols].ffill()
+        
+        if 'turning_points' in state.stages:
+            frame = self.find_turning_points(frame, watchlist)
+        if 'decline' in state.stages:
+            state.decline = state.decline or DeclineModel()
+            frame = self.build_decline_prediction(frame, watchlist, model=state.decline)
+            decline_cols = [f'{industry}_Decline' for industry in watchlist_dict]
+            frame[decline_cols] = frame[decline_cols].ffill()
+        
+        if state.params.get('compact'):
+            frame = self.compact_frame(frame)
+        state.frame = frame
+        return frame.iloc[self.WARMUP_DAYS:, :]
+        
+    def update_many(self, tenants: Dict[str, 'MarketDataProvider']) -> Dict[str, pd.DataFrame]:
+        """
+        增量更新 build_many 建立的所有 watchlist - 快取只清空一次, 每檔股票的近期數據只下載一次
+        
+        Args:
+            tenants: build_many 回傳的 {名稱: 數據提供者}
+            
+        Returns:
+            {名稱: 裁切 warmup 後的投資組合數據}
+        """
+        self.clear_cache()
+        return {name: tenant.update(refresh=False) for name, tenant in tenants.items()}
+        
+    def apply_watchlist_changes(self, watchlist: TradingViewWatchlist) -> pd.DataFrame:
+        """
+        依 watchlist 異動局部重建 - 只下載新增股票、移除已刪除股票, 
+        並只重算成員有變動的產業指標
+        
+        Args:
+            watchlist: 新的 TradingView 投資組合清單
+            
+        Returns:
+            裁切 warmup 後的投資組合數據
+        """
+        state = self.state
+        if state is None:
+            raise RuntimeError("No portfolio state. Run build_portfolio_data() first.")
+        
+        changes = diff_watchlist(state.watchlist, watchlist.todict())
+        frame = state.frame
+        params = state.params
+        if not any(changes.values()):
+            return frame.iloc[self.WARMUP_DAYS:, :]
+        
+        def industry_columns(industries):
+            return [field.format(industry=industry) for industry in industries 
+                    for field in ALL_FIELDS if field.startswith('{industry}_')]
+        
+        # 移除股票與產業
+        drop = [f'{code}_{column}' for code in changes['removed'] for column in state.columns]
+        drop += industry_columns(changes['removed_industries'])
+        frame = frame.drop(columns=[c for c in drop if c in frame.columns])
+        for code in changes['removed']:
+            state.tickers.pop(code, None)
+        for industry in changes['removed_industries']:
+            state.industries.pop(industry, None)
+        
+        # 下載新增股票 (截至現有數據最後一天, 以便之後增量更新)
+        if 'download' in state.stages:
+            last_date = frame.index[-1]
+            with self.events.stage('download', total=len(changes['added']),
+                                   desc="Downloading new tickers") as advance:
+                results = stream_map(
+                    changes['added'], lambda code: self.fetch_history(code, columns=self.RAW_COLUMNS),
+                    lambda code, history: self.compute_ticker_indicators(
+                        history[history.index <= last_date], sharpe_window=params['sharpe_window'], 
+                        columns=state.columns),
+                    io_workers=self.IO_WORKERS, queue_size=self.QUEUE_SIZE,
+                    progress=self._download_progress(advance),
+                )
+            for code, temp_df, error in results:
+                if error is not None:
+                    print(f"⚠️ Failed to download {code}: {error}")
+                    continue
+                for column in state.columns:
+                    frame[f'{code}_{column}'] = temp_df[column].reindex(frame.index).ffill()
+                state.tickers[code] = TickerState.from_history(temp_df['Close'], params['sharpe_window'])
+        
+        # 只重算異動產業
+        dirty = changes['dirty_industries']
+        if 'industry' in state.stages:
+            frame = self.integrate_industry_metrics(frame, watchlist, ma_period=params['ma_period'], 
+                                                    slope_window=params['slope_window'], industries=dirty)
+        if 'turning_points' in state.stages:
+            frame = self.find_turning_points(frame, watchlist, industries=dirty)
+        if 'overall_state' in state.stages:
+            frame = self.summary_overall_state(frame, watchlist, industries=dirty)
+        if 'decline' in state.stages:
+            # 下跌預測模型跨產業共同訓練, 成員異動時需重新訓練
+            state.decline = state.decline or DeclineModel()
+            frame = self.build_decline_prediction(frame, watchlist, model=state.decline)
+        
+        dirty_cols = [c for c in industry_columns(dirty) if c in frame.columns]
+        frame[dirty_cols] = frame[dirty_cols].ffill()
+        if 'industry' in state.stages:
+            for industry in dirty:
+                state.industries[industry] = IndustryState.from_frame(
+                    frame, industry, params['slope_window'], params['ma_period'])
+        
+        if params.get('compact'):
+            frame = self.compact_frame(frame)
+        state.frame = frame
+        state.watchlist = watchlist.todict()
+        self.watchlist = watchlist
+        print(f"✅ Watchlist changes applied: +{len(changes['added'])} / -{len(changes['removed'])} tickers, "
+              f"{len(dirty)} industries recomputed")
+        return frame.iloc[self.WARMUP_DAYS:, :]
+        
+    def save_state(self, path: str):
+        """將建立狀態存檔 (pickle)"""
+        if self.state is None:
+            raise RuntimeError("No portfolio state. Run build_portfolio_data() first.")
+        pd.to_pickle(self.state, path)
+        
+    def load_state(self, path: str) -> pd.DataFrame:
+        """讀取建立狀態, 回傳裁切 warmup 後的投資組合數據"""
+        self.state = pd.read_pickle(path)
+        return self.state.frame.iloc[self.WARMUP_DAYS:, :]
@@ -1,22 +1,47 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
-from typing import List, Union
-from .data import MarketDataProvider
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from typing import Dict, List, Union
+from .data import MarketDataProvider, TradingViewWatchlist
+from .pipeline import ALL_FIELDS, resolve_stages, available_fields, expand_fields
+from .backtest_cache import BacktestCache
+from .render import downsample, fill_drawdown, figure_to_png
+from .robustness import BlockBootstrap
+from .walkforward import WalkForward, WalkForwardResult
+from .metrics import running_peak, max_drawdown, drawdown_episodes, summarize_curves
 from ..trader.engine import Trader
 
 
 class SimulatedMarket:
     """模擬市場環境 - 執行回測與視覺化"""
     
+    # get_trading_recommendation 讀取的欄位樣板
+    REPORT_FIELDS = ('Trend', 'segments', 'volatilities', '{industry}_Crossover_State')
+    
+    # rebalance 頻率候選 (建議頻率時比較)
+    FREQUENCIES = ('daily', 'weekly', 'monthly', 'quarterly', 'yearly')
+    
+    # 程序內沒有同策略的回測時, 自快取讀取結果所用的初始資金
+    RECOMMENDATION_BALANCE = 10000
+    
+    # headless 繪圖時每條曲線的預設點數 (LTTB 降採樣)
+    PLOT_POINTS = 2000
+    
+    # 曲線數超過此數時, 圖例只列出中位數與區間 (各曲線不列入)
+    LEGEND_CURVES = 12
+    
     def __init__(self, data_provider: MarketDataProvider = None, 
-                 watchlist_id: str = None, session_id: str = None):
+                 watchlist_id: str = None, session_id: str = None,
+                 backtest_cache: BacktestCache = None):
         """
         Args:
             data_provider: 數據提供者 (可選, 若為 None 則使用預設或自訂 ID)
             watchlist_id: TradingView watchlist ID (可選)
             session_id: TradingView session ID (可選)
+            backtest_cache: 回測結果快取 (預設只保存在記憶體), 
+                            如 BacktestCache('backtests') 可跨行程沿用結果
         """
         if data_provider:
             self.data_provider = data_provider
@@ -26,9 +51,14 @@ class SimulatedMarket:
             self.data_provider = MarketDataProvider()
         
         self.portfolio_df = None
+        self.fields = None  # 已建立的欄位樣板 (None 表示完整數據)
         self._traders = {}  # {label: Trader}
+        self.backtest_cache = backtest_cache if backtest_cache is not None else BacktestCache()
+        self._versions = (None, {})  # (portfolio_df, {(欄位, 列數): 數據版本})
         
-    def build_portfolio_data(self, sharpe_window: int = 365, slope_window: int = 365, ma_period: int = 30):
+    def build_portfolio_data(self, sharpe_window: int = 365, slope_window: int = 365, ma_period: int = 30,
+                             fields: list = None, band_mode: str = 'full', compact: bool = False,
+                             checkpoint: str = None, memory_budget: int = None, spill_dir: str = None):
         """
         建立投資組合數據
         
@@ -36,16 +66,106 @@ class SimulatedMarket:
             sharpe_window: 計算 Sharpe 比率的視窗大小 (預設: 365天)
             slope_window: 計算斜率的視窗大小 (預設: 365天)
             ma_period: 產業移動平均的短期週期 (預設: 30天, 長期為 30*4=120天)
+            fields: 需求欄位樣板, 只計算所需階段 (預設: 全部), 
+                    例如 collect_fields(MaxSharpeStrategy, SimulatedMarket.REPORT_FIELDS)
+            band_mode: 大盤彩虹圖計算方式, 'expanding' 只使用當日以前的資料 (預設: 'full')
+            compact: 精簡記憶體模式 (float32 指標 / int8 狀態), 回測結果在容許誤差內相同
+            checkpoint: 下載檢查點目錄 (可選), 中斷後重新執行可從檢查點續傳
+            memory_budget: 記憶體上限 (bytes, 可選); 個股分塊計算並寫入磁碟 (spill_dir), 
+                           數據以 memmap 引用, 不保存增量更新狀態 (update 前需重新建立)
+            spill_dir: memory_budget 模式的暫存目錄 (預設為系統暫存目錄)
         """
         watchlist = self.data_provider.get_watchlist()
         self.portfolio_df = self.data_provider.build_portfolio_data(
             watchlist, 
             sharpe_window=sharpe_window, 
             slope_window=slope_window, 
-            ma_period=ma_period
+            ma_period=ma_period,
+            fields=fields,
+            band_mode=band_mode,
+            compact=compact,
+            checkpoint=checkpoint,
+            memory_budget=memory_budget,
+            spill_dir=spill_dir
         )
+        self._set_fields(fields)
         print(f"✅ Portfolio data built: {self.portfolio_df.shape[0]} days, {self.portfolio_df.shape[1]} columns")
         
+    @classmethod
+    def build_many(cls, watchlists: Dict[str, TradingViewWatchlist], data_provider: MarketDataProvider = None,
+                   backtest_cache: BacktestCache = None, sharpe_window: int = 365, slope_window: int = 365,
+                   ma_period: int = 30, fields: list = None, band_mode: str = 'full', compact: bool = False,
+                   checkpoint: str = None) -> Dict[str, 'SimulatedMarket']:
+        """
+        為多個 watchlist 建立模擬市場, 共用個股數據 (見 MarketDataProvider.build_many)
+        
+        重疊的股票 (如多位使用者都有的 NVDA、AAPL) 只下載與計算一次, 
+        每個市場只各自計算產業指標並執行自己的回測。
+        
+        Args:
+            watchlists: {名稱: TradingView 投資組合清單}
+            data_provider: 共用的數據提供者 (預設: MarketDataProvider())
+            backtest_cache: 回測結果快取 (可選, 所有市場共用; 命中時以數據版本驗證, 不同清單不會誤用)
+            其餘參數同 build_portfolio_data
+            
+        Returns:
+            {名稱: SimulatedMarket}
+        """
+        data_provider = data_provider or MarketDataProvider()
+        tenants = data_provider.build_many(
+            watchlists,
+            sharpe_window=sharpe_window,
+            slope_window=slope_window,
+            ma_period=ma_period,
+            fields=fields,
+            band_mode=band_mode,
+            compact=compact,
+            checkpoint=checkpoint
+        )
+        markets = {}
+        for name, tenant in tenants.items():
+            market = cls(data_provider=tenant, backtest_cache=backtest_cache)
+            market.portfolio_df = tenant.state.frame.iloc[tenant.WARMUP_DAYS:, :]
+            market._set_fields(fields)
+            markets[name] = market
+            print(f"✅ Portfolio data built for {name}: {market.portfolio_df.shape[0]} days, "
+                  f"{market.portfolio_df.shape[1]} columns")
+        return markets
+        
+    def update(self):
+        """增量更新投資組合數據 (只推進新交易日)"""
+        if self.portfolio_df is None:
+            print("⚠️ No portfolio data. Building data first...")
+            self.build_portfolio_data()
+            return
+        
+        self.portfolio_df = self.data_provider.update(self.data_provider.get_watchlist())
+        print(f"✅ Portfolio data updated: {self.portfolio_df.shape[0]} days, {self.portfolio_df.shape[1]} columns")
+        
+    def refresh_watchlist(self):
+        """重新取得 watchlist, 只重建有異動的股票與產業"""
+        if self.portfolio_df is None:
+            print("⚠️ No portfolio data. Building data first...")
+            self.build_portfolio_data()
+            return
+        
+        watchlist = self.data_provider.get_watchlist()
+        watchlist.refresh()
+        self.portfolio_df = self.data_provider.apply_watchlist_changes(watchlist)
+        
+    def save(self, path: str):
+        """儲存投資組合數據與增量狀態"""
+        self.data_provider.save_state(path)
+        
+    def load(self, path: str):
+        """讀取 save() 儲存的投資組合數據與增量狀態"""
+        self.portfolio_df = self.data_provider.load_state(path)
+        self._set_fields(self.data_provider.state.fields)
+        
+    def _set_fields(self, fields):
+        """記錄已建立的欄位樣板"""
+        self.fields = None if fields is None else available_fields(*resolve_stages(fields))
+        
     def run(self, trader_or_traders: Union[Trader, List[Trader]]):
         """
         執行回測
@@ -60,27 +180,131 @@ class SimulatedMarket:
         # 統一轉換成列表
         traders = [trader_or_traders] if isinstance(trader_or_traders, Trader) else trader_or_traders
         
-        # 執行回測
+        for trader in traders:
+            missing = self._missing_fields(trader.strategy.required_fields)
+            if missing:
+                raise ValueError(f"Portfolio data lacks fields required by "
+                                 f"{trader.strategy.__class__.__name__}: {missing}")
+        
+        # 執行回測 (沿用快取結果, 只回測新增的交易日)
         for trader in traders:
             label = f"{trader.strategy.__class__.__name__}_{trader.rebalance_frequency}"
             self._traders[label] = trader
-            self._run_single_trader(trader)
+            self._run_cached(trader)
             
-    def _run_single_trader(self, trader: Trader):
-        """執行單一 trader 的回測"""
-        watchlist = self.data_provider.get_watchlist()
-        codes = watchlist.tolist()
+    def _missing_fields(self, required) -> list:
+        """回傳尚未建立的需求欄位"""
+        if self.fields is None:
+            return []
+        if required is None:
+            required = ALL_FIELDS
+        return [f for f in required if f in ALL_FIELDS and f not in self.fields]
+        
+    def _trader_columns(self, trader: Trader, codes: list) -> list:
+        """回測讀取的數據欄位 (交易員的價格欄位與策略的需求欄位)"""
+        required = trader.strategy.required_fields
+        if required is None:
+            return list(self.portfolio_df.columns)
+        industries = self.data_provider.get_watchlist().todict().keys()
+        columns = set(expand_fields(('{code}_Close',) + tuple(required), codes, industries))
+        return [column for column in self.portfolio_df.columns if column in columns]
+        
+    def _data_version(self, columns: list, rows: int = None) -> str:
+        """
+        portfolio_df 讀取欄位的數據版本 (同一份數據的同一組欄位只雜湊一次)
         
-        for date in tqdm(self.portfolio_df.index, desc=f"Backtest ({trader.rebalance_frequency})"):
-            market_data = self.portfolio_df.loc[date]
-            
-            # 判斷是否該 rebalance
-            if trader._should_rebalance(date):
-                weights = trader.decide(market_data, codes)
-                trader.execute_trades(weights, market_data)
+        Args:
+            columns: 讀取欄位
+            rows: 只雜湊前 rows 列 (預設為全部)
+        """
+        frame = self.portfolio_df
+        if self._versions[0] is not frame:
+            self._versions = (frame, {})
+        key = (tuple(columns), len(frame) if rows is None else rows)
+        versions = self._versions[1]
+        if key not in versions:
+            versions[key] = self.backtest_cache.data_version(frame, columns, rows)
+        return versions[key]
+        
+    def _run_cached(self, trader: Trader, cached_only: bool = False) -> bool:
+        """
+        以快取結果執行回測
+        
+        快取的數據版本與目前數據的同一段歷史相同時, 還原交易員狀態並只回測之後的交易日;
+        否則完整回測。回測結果寫回快取。
+        
+        Args:
+            trader: 尚未回測的 Trader
+            cached_only: 只使用快取結果 (沒有可沿用的結果時不回測)
             
-            # 記錄每日狀態
-            trader.update_daily_snapshot(market_data)
+        Returns:
+            是否已取得回測結果
+        """
+        codes = self.data_provider.get_watchlist().tolist()
+        cache = self.backtest_cache
+        columns = self._trader_columns(trader, codes)
+        key = cache.make_key(trader, codes, columns)
+        index = self.portfolio_df.index
+        
+        start = 0
+        entry = cache.get(key)
+        if entry is not None:
+            start = index.searchsorted(entry['last_date'], side='right')
+            if start == 0 or index[start - 1] != entry['last_date'] or \
+                    self._data_version(columns, start) != entry['version']:
+                start = 0
+        
+        if start == 0 and cached_only:
+            return False
+        if start > 0:
+            trader.portfolio_history = entry['history']
+            trader.cash = entry['cash']
+            trader.inventory = entry['inventory']
+            trader.last_rebalance_date = entry['last_rebalance_date']
+            trader.strategy = entry['strategy']
+            print(f"♻️ Reusing cached backtest ({trader.rebalance_frequency}): "
+                  f"{start} days cached, {len(index) - start} new days")
+            if start == len(index):
+                return True
+        
+        self._run_single_trader(trader, start=start)
+        cache.put(key, {
+            'version': self._data_version(columns),
+            'last_date': index[-1],
+            'history': trader.portfolio_history,
+            'cash': trader.cash,
+            'inventory': trader.inventory,
+            'last_rebalance_date': trader.last_rebalance_date,
+            'strategy': trader.strategy,
+        })
+        return True
+        
+    def _run_single_trader(self, trader: Trader, start: int = 0):
+        """
+        執行單一 trader 的回測
+        
+        Args:
+            trader: Trader
+            start: 從第幾個交易日開始 (之前的交易日已由快取還原)
+        """
+        watchlist = self.data_provider.get_watchlist()
+        codes = watchlist.tolist()
+        dates = self.portfolio_df.index[start:]
+        trader.strategy.prepare(self.portfolio_df, trader.rebalance_dates(dates), codes)
+        
+        events = self.data_provider.events
+        on_day, on_rebalance = events.handlers('on_day'), events.handlers('on_rebalance')
+        with events.stage('backtest', total=len(dates), desc=f"Backtest ({trader.rebalance_frequency})") as advance:
+            for date in dates:
+                snapshot = trader.step(date, self.portfolio_df.loc[date], codes)
+                if on_rebalance and trader.last_rebalance_date == date:
+                    for handler in on_rebalance:
+                        handler(trader=trader, date=date, snapshot=snapshot)
+                if on_day:
+                    for handler in on_day:
+                        handler(trader=trader, date=date, snapshot=snapshot)
+                if advance is not None:
+                    advance()
             
     def summary(self):
         """輸出回測摘要"""
@@ -92,39 +316,47 @@ class SimulatedMarket:
         print("📊 Backtest Summary")
         print("="*70)
         
-        for label, trader in self._traders.items():
-            self._print_trader_stats(label, trader)
+        stats = self._trader_stats(self._traders)
+        for label in self._traders:
+            self._print_trader_stats(label, stats.loc[label] if label in stats.index else None)
             print("-"*70)
             
-    def _print_trader_stats(self, label: str, trader: Trader):
-        """列印單一 trader 的統計資訊"""
-        history = [snap.total_value for snap in trader.portfolio_history]
-        dates = [snap.timestamp for snap in trader.portfolio_history]
+    @staticmethod
+    def _equity_curves(traders: dict, min_days: int = 1) -> pd.DataFrame:
+        """
+        交易員的權益曲線 (日期索引, 每個交易員一欄; 期間不同時以 NaN 對齊)
         
-        if not history:
+        Args:
+            traders: {label: Trader}
+            min_days: 快照數少於此數的交易員不列入
+        """
+        curves = {}
+        for label, trader in traders.items():
+            if len(trader.portfolio_history) >= min_days:
+                curves[label] = pd.Series(
+                    [snap.total_value for snap in trader.portfolio_history],
+                    index=pd.DatetimeIndex([snap.timestamp for snap in trader.portfolio_history])
+                )
+        return pd.DataFrame(curves)
+        
+    def _trader_stats(self, traders: dict, min_days: int = 1, threshold: float = 0.15) -> pd.DataFrame:
+        """以 metrics.summarize_curves 一次計算所有交易員的績效 (每個交易員一列)"""
+        curves = self._equity_curves(traders, min_days)
+        initial = [traders[label].initial_balance for label in curves.columns]
+        return summarize_curves(curves, initial=initial, threshold=threshold)
+        
+    def _print_trader_stats(self, label: str, stats: pd.Series = None):
+        """列印單一 trader 的統計資訊 (stats 為 _trader_stats 的一列, None 表示沒有歷史)"""
+        if stats is None:
             print(f"\n{label}: No history data")
             return
         
-        initial = trader.initial_balance
-        final = history[-1]
-        days = (dates[-1] - dates[0]).days
-        annual_return = (final / initial) ** (365 / days) - 1 if days > 0 else 0
-        
-        # 計算最大回撤
-        peak = pd.Series(history).cummax()
-        drawdown = (peak - pd.Series(history)) / peak
-        max_dd = drawdown.max()
-        
-        # 計算 Sharpe (簡化版)
-        returns = pd.Series(history).pct_change().dropna()
-        sharpe = returns.mean() / returns.std() * np.sqrt(252) if returns.std() > 0 else 0
-        
         print(f"\n{label}")
-        print(f"  💰 Final Value: ${final:,.2f}")
-        print(f"  📈 Total Return: {(final/initial - 1)*100:.2f}%")
-        print(f"  📊 Annual Return: {annual_return*100:.2f}%")
-        print(f"  📉 Max Drawdown: {max_dd*100:.2f}%")
-        print(f"  📐 Sharpe Ratio: {sharpe:.2f}")
+        print(f"  💰 Final Value: ${stats['final_value']:,.2f}")
+        print(f"  📈 Total Return: {stats['total_return']*100:.2f}%")
+        print(f"  📊 Annual Return: {stats['annual_return']*100:.2f}%")
+        print(f"  📉 Max Drawdown: {stats['max_drawdown']*100:.2f}%")
+        print(f"  📐 Sharpe Ratio: {stats['sharpe']:.2f}")
     
     def get_trading_recommendation(self, strategy, date: pd.Timestamp = None) -> str:
         """
@@ -146,12 +378,19 @@ class SimulatedMarket:
         elif date not in self.portfolio_df.index:
             return f"⚠️ 日期 {date} 不在數據範圍內"
         
+        missing = self._missing_fields(list(self.REPORT_FIELDS) + list(strategy.required_fields or ALL_FIELDS))
+        if missing:
+            return f"⚠️ 數據缺少交易建議所需欄位: {', '.join(missing)}"
+        
         market_data = self.portfolio_df.loc[date]
         watchlist = self.data_provider.get_watchlist()
         codes = watchlist.tolist()
         watchlist_dict = watchlist.todict()
         
-        # 取得策略建議權重
+        # 取得策略建議權重 (需要每日數據的策略先以當日以前的歷史建立狀態)
+        if strategy.lookback:
+            strategy = type(strategy)(**strategy.params())
+            strategy.prime(self.portfolio_df.loc[:date], codes)
         weights = strategy.calculate_weights(market_data, codes)
         
         # 建立股票到產業的映射
@@ -168,7 +407,7 @@ class SimulatedMarket:
         lines.append("━" * 43)
         
         strategy_name = strategy.__class__.__name__
-        if hasattr(strategy, 'topk'):
+        if getattr(strategy, 'topk', None) is not None:
             strategy_name += f" (topk={strategy.topk})"
         lines.append(f"策略：{strategy_name}")
         
@@ -243,87 +482,58 @@ class SimulatedMarket:
         
         return "\n".join(lines)
     
-    def _calculate_average_drawdown(self, history, min_drawdown_threshold=0.15):
-        """計算超過門檻的平均回撤
+    def _cached_traders(self, strategy) -> list:
+        """
+        本次執行未回測的頻率, 自回測快取讀取結果 (不會開始新的完整回測)
         
         Args:
-            history: 資產歷史價值列表
-            min_drawdown_threshold: 回撤門檻 (預設 0.15，即 15%)
+            strategy: 交易策略實例
             
         Returns:
-            (average_drawdown, count): 超過門檻的平均回撤值和次數
+            已還原回測結果的 Trader 列表
         """
-        series = pd.Series(history)
-        peak = series.cummax()
-        drawdown = (series - peak) / peak
-        
-        significant_drawdowns = []  # 儲存超過門檻的回撤
-        in_drawdown = False
-        current_dd = 0
-        
-        for dd in drawdown:
-            if dd < 0:  # 在回撤中
-                if not in_drawdown:
-                    in_drawdown = True
-                current_dd = min(current_dd, dd)
-            else:  # 創新高，結束回撤
-                if in_drawdown:
-                    dd_abs = abs(current_dd)
-                    # 只記錄超過門檻的回撤
-                    if dd_abs >= min_drawdown_threshold:
-                        significant_drawdowns.append(dd_abs)
-                    in_drawdown = False
-                    current_dd = 0
-        
-        # 最後一段如果還在回撤中
-        if in_drawdown and current_dd < 0:
-            dd_abs = abs(current_dd)
-            if dd_abs >= min_drawdown_threshold:
-                significant_drawdowns.append(dd_abs)
-        
-        if significant_drawdowns:
-            avg = sum(significant_drawdowns) / len(significant_drawdowns)
-            return avg, len(significant_drawdowns)
-        return 0, 0
+        strategy_name = strategy.__class__.__name__
+        balance = self.RECOMMENDATION_BALANCE
+        done = set()
+        for trader in self._traders.values():
+            if trader.strategy.__class__.__name__ == strategy_name:
+                balance = trader.initial_balance
+                done.add(trader.rebalance_frequency)
+        
+        traders = []
+        for frequency in self.FREQUENCIES:
+            if frequency in done:
+                continue
+            trader = Trader(balance=balance, strategy=type(strategy)(**strategy.params()),
+                            rebalance_frequency=frequency)
+            if self._run_cached(trader, cached_only=True):
+                traders.append(trader)
+        return traders
     
     def _get_best_rebalance_frequency(self, strategy):
         """計算最佳再平衡頻率"""
-        if not self._traders:
+        traders = list(self._traders.values()) + self._cached_traders(strategy)
+        if not traders:
             return None
         
-        # 找出相同策略的所有 traders
+        # 找出相同策略的所有 traders, 一次計算年化報酬與平均回撤 (使用固定門檻 0.15)
         strategy_name = strategy.__class__.__name__
-        matching_traders = {}
+        candidates = {
+            i: trader for i, trader in enumerate(traders)
+            if trader.strategy.__class__.__name__ == strategy_name
+        }
+        stats = self._trader_stats(candidates, min_days=2, threshold=0.15)
         
-        for label, trader in self._traders.items():
-            if trader.strategy.__class__.__name__ == strategy_name:
-                # 計算績效指標
-                history = [snap.total_value for snap in trader.portfolio_history]
-                dates = [snap.timestamp for snap in trader.portfolio_history]
-                
-                if len(history) < 2:
-                    continue
-                
-                initial = trader.initial_balance
-                final = history[-1]
-                days = (dates[-1] - dates[0]).days
-                
-                # 年化報酬
-                annual_return = (final / initial) ** (365 / days) - 1 if days > 0 else 0
-                
-                # 平均回撤 (使用固定門檻 0.15)
-                avg_dd, dd_count = self._calculate_average_drawdown(history, min_drawdown_threshold=0.15)
-                
-                # 計算分數
-                score = annual_return - avg_dd
-                
-                matching_traders[trader.rebalance_frequency] = {
-                    'frequency': trader.rebalance_frequency,
-                    'annual_return': annual_return,
-                    'avg_drawdown': avg_dd,
-                    'drawdown_count': dd_count,
-                    'score': score
-                }
+        matching_traders = {}
+        for i, row in stats.iterrows():
+            frequency = candidates[i].rebalance_frequency
+            matching_traders[frequency] = {
+                'frequency': frequency,
+                'annual_return': float(row['annual_return']),
+                'avg_drawdown': float(row['avg_drawdown']),
+                'drawdown_count': int(row['drawdown_count']),
+                'score': float(row['annual_return'] - row['avg_drawdown'])
+            }
         
         if not matching_traders:
             return None
@@ -343,165 +553,222 @@ class SimulatedMarket:
         
         return best
         
-    def plot_equity_curve(self, save_path: str = None, min_drawdown_label: float = 0.15):
+    def _backtest_scores(self, strategies: dict, combos: list, threshold: float = 0.15) -> np.ndarray:
+        """
+        各 (策略, 頻率) 實際回測的分數 (年化報酬 - 平均回撤, 與 _get_best_rebalance_frequency 相同)
+        
+        已回測的交易員直接沿用, 其餘以相同策略交易員的初始資金 (預設 RECOMMENDATION_BALANCE)
+        自回測快取讀取或回測一次。
+        
+        Args:
+            strategies: {名稱: 策略}
+            combos: [(名稱, 頻率)]
+            threshold: 平均回撤的門檻
+        """
+        traders = {}
+        for i, (name, frequency) in enumerate(combos):
+            strategy = strategies[name]
+            balance, trader = self.RECOMMENDATION_BALANCE, None
+            for existing in self._traders.values():
+                if type(existing.strategy) is not type(strategy):
+                    continue
+                balance = existing.initial_balance
+                if existing.rebalance_frequency == frequency and existing.strategy.params() == strategy.params():
+                    trader = existing
+                    break
+            if trader is None:
+                trader = Trader(balance=balance, strategy=type(strategy)(**strategy.params()),
+                                rebalance_frequency=frequency)
+                self._run_cached(trader)
+            traders[i] = trader
+        stats = self._trader_stats(traders, min_days=2, threshold=threshold)
+        scores = stats['annual_return'] - stats['avg_drawdown']
+        return scores.reindex(range(len(combos))).to_numpy(dtype=float)
+        
+    def robustness(self, strategies=None, frequencies: list = None, n_paths: int = 1000,
+                   block_size: int = 21, chunk_size: int = 128, workers: int = None,
+                   seed: int = 0, confidence: float = 0.9) -> pd.DataFrame:
+        """
+        區塊自助法穩健性評估 - 以重抽的歷史報酬區塊產生 n_paths 條合成路徑, 
+        回報各策略與頻率的分數 (年化報酬 - 平均回撤, 與交易建議相同) 的信賴區間
+        
+        合成路徑以分數持股模擬 (不取整股)。historical 為實際回測 (整股, 與交易建議的分數相同) 的分數,
+        fractional 為歷史路徑以合成路徑相同的分數持股模擬的分數, 兩者的差異即整股與資金規模的影響。
+        
+        Args:
+            strategies: 策略實例列表或 {名稱: 策略} (預設: 已回測交易員的策略)
+            frequencies: rebalance 頻率列表 (預設: FREQUENCIES)
+            n_paths: 合成路徑數量
+            block_size: 重抽區塊長度 (交易日)
+            chunk_size: 每次計算的路徑數 (限制記憶體用量)
+            workers: 行程數量 (預設為 CPU 核心數)
+            seed: 隨機種子 (相同種子的結果與 workers 無關)
+            confidence: 信賴區間的信賴水準
+            
+        Returns:
+            DataFrame, 索引為 (strategy, frequency), 欄位為 historical / fractional / mean / median / low / high / std / p_best
+        """
+        if self.portfolio_df is None:
+            print("⚠️ No portfolio data. Building data first...")
+            self.build_portfolio_data()
+        
+        if strategies is None:
+            strategies = [trader.strategy for trader in self._traders.values()]
+        if not isinstance(strategies, dict):
+            named = {}
+            for strategy in strategies:
+                name = strategy.__class__.__name__
+                if name in named and named[name].params() != strategy.params():
+                    name = f"{name}_{len(named)}"
+                named.setdefault(name, strategy)
+            strategies = named
+        if not strategies:
+            print("⚠️ No strategies to evaluate. Run backtest first or pass strategies.")
+            return None
+        for strategy in strategies.values():
+            missing = self._missing_fields(strategy.required_fields)
+            if missing:
+                raise ValueError(f"Portfolio data lacks fields required by "
+                                 f"{strategy.__class__.__name__}: {missing}")
+        
+        bootstrap = BlockBootstrap(n_paths=n_paths, block_size=block_size, chunk_size=chunk_size,
+                                   workers=workers, seed=seed, confidence=confidence)
+        codes = self.data_provider.get_watchlist().tolist()
+        result = bootstrap.evaluate(self.portfolio_df, strategies, frequencies or list(self.FREQUENCIES),
+                                    codes, events=self.data_provider.events)
+        result.insert(0, 'historical', self._backtest_scores(strategies, list(result.index), bootstrap.threshold))
+        
+        print("\n" + "="*70)
+        print(f"🎲 Bootstrap Robustness ({n_paths} paths, {block_size}-day blocks, {confidence:.0%} CI)")
+        print("="*70)
+        for (name, frequency), row in result.iterrows():
+            print(f"  {name:<28} {frequency:<10} 歷史 {row['historical']*100:6.1f}% "
+                  f"(分數持股 {row['fractional']*100:6.1f}%)  "
+                  f"中位數 {row['median']*100:6.1f}%  [{row['low']*100:6.1f}%, {row['high']*100:6.1f}%]  "
+                  f"最佳機率 {row['p_best']:.0%}")
+        return result
+        
+    def walk_forward(self, strategies: list, frequencies: list = None, in_sample: int = 756,
+                     out_of_sample: int = 126, step: int = None, metric: str = 'score',
+                     balance: float = None, workers: int = None) -> WalkForwardResult:
+        """
+        Walk-forward 最佳化 - 每個樣本內視窗選出評分最高的 (策略, 頻率), 套用到接下來的樣本外視窗
+        
+        Args:
+            strategies: 候選策略實例, 如 [MaxSharpeStrategy(topk=k) for k in (3, 5, 10)]
+            frequencies: 候選 rebalance 頻率 (預設: FREQUENCIES)
+            in_sample: 樣本內交易日數
+            out_of_sample: 樣本外交易日數
+            step: 視窗每次前進的交易日數 (預設為 out_of_sample; 樣本外區段只到下一個視窗為止, 不重疊)
+            metric: 樣本內評分 ('score' = 年化報酬 - 平均回撤, 'annual_return', 'sharpe')
+            balance: 初始資金 (預設: RECOMMENDATION_BALANCE)
+            workers: 行程數量 (預設為 CPU 核心數)
+            
+        Returns:
+            WalkForwardResult (windows / scores / curve / history)
+        """
+        if self.portfolio_df is None:
+            print("⚠️ No portfolio data. Building data first...")
+            self.build_portfolio_data()
+        for strategy in strategies:
+            missing = self._missing_fields(strategy.required_fields)
+            if missing:
+                raise ValueError(f"Portfolio data lacks fields required by "
+                                 f"{strategy.__class__.__name__}: {missing}")
+        
+        runner = WalkForward(in_sample=in_sample, out_of_sample=out_of_sample, step=step,
+                             metric=metric, workers=workers)
+        codes = self.data_provider.get_watchlist().tolist()
+        result = runner.run(self.portfolio_df, strategies, frequencies or list(self.FREQUENCIES), codes,
+                            balance=balance or self.RECOMMENDATION_BALANCE, events=self.data_provider.events)
+        
+        stats = result.stats()
+        print("\n" + "="*70)
+        print(f"🔁 Walk-Forward ({len(result.windows)} windows, {in_sample}/{out_of_sample} days)")
+        print("="*70)
+        for _, row in result.windows.iterrows():
+            print(f"  {row['out_of_sample_start'].date()} ~ {row['out_of_sample_end'].date()}  "
+                  f"{row['candidate']:<50} {row['out_of_sample_return']*100:7.2f}%")
+        print(f"  📊 Out-of-sample Annual Return: {stats['annual_return']*100:.2f}%")
+        print(f"  📉 Out-of-sample Max Drawdown: {stats['max_drawdown']*100:.2f}%")
+        return result
+        
+    def plot_equity_curve(self, save_path: str = None, min_drawdown_label: float = 0.15,
+                          headless: bool = False, max_points: int = None, dpi: int = None):
         """
         繪製權益曲線
         
         Args:
             save_path: 圖片儲存路徑
             min_drawdown_label: 顯示回撤標籤的最小回撤比例(0-1)，例如0.15表示只顯示>=15%的回撤標籤。設為None則不顯示標籤。
+            headless: 無視窗模式 - 以 Agg 繪製於獨立的 Figure (不經過 pyplot、不呼叫 plt.show()), 回傳 PNG bytes
+            max_points: 每條曲線最多繪製的點數, 以 LTTB 降採樣保留形狀 (預設: headless 時為 PLOT_POINTS, 否則不降採樣)
+            dpi: 輸出解析度 (預設: headless 時為 100, 否則為 300)
+            
+        Returns:
+            headless 時為 PNG bytes, 否則為 None
         """
         if not self._traders:
             print("⚠️ No traders to plot. Run backtest first.")
-            return
+            return None
         
-        fig, ax = plt.subplots(figsize=(14, 7))
+        if headless:
+            fig = Figure(figsize=(14, 7))
+            FigureCanvasAgg(fig)
+            ax = fig.subplots()
+            max_points = self.PLOT_POINTS if max_points is None else max_points
+            dpi = dpi or 100
+        else:
+            fig, ax = plt.subplots(figsize=(14, 7))
+            dpi = dpi or 300
+        layer_step = min_drawdown_label if min_drawdown_label is not None and min_drawdown_label > 0 else None
         
         # 收集所有曲線
-        all_curves = {}
-        for label, trader in self._traders.items():
-            history = pd.DataFrame([
-                {'date': snap.timestamp, 'value': snap.total_value}
-                for snap in trader.portfolio_history
-            ]).set_index('date')
-            all_curves[label] = history['value']
-        
-        df = pd.DataFrame(all_curves)
+        df = self._equity_curves(self._traders)
         
         # 單曲線模式
         if len(df.columns) == 1:
             series = df.iloc[:, 0]
-            ax.plot(series, linewidth=2, color='blue', label=df.columns[0])
-            
-            # 繪製疊加式 drawdown 陰影
-            peak = series.cummax()
-            drawdown_pct = (series - peak) / peak  # 負值表示回撤
+            shown = downsample(df, max_points)[df.columns[0]]
+            ax.plot(shown, linewidth=2, color='blue', label=df.columns[0])
             
-            if min_drawdown_label is not None and min_drawdown_label > 0:
-                # 計算最大回撤深度，決定要畫幾層
-                max_dd = abs(drawdown_pct.min())
-                num_layers = int(max_dd / min_drawdown_label) + 1
-                
-                # 從淺到深依序疊加繪製
-                for layer in range(1, num_layers + 1):
-                    threshold = -layer * min_drawdown_label
-                    layer_top = peak * (1 + threshold)  # 該層的上界（前一層的下界）
-                    
-                    # 前一層的下界作為這層的上界
-                    if layer == 1:
-                        fill_top = peak  # 第一層從peak開始
-                    else:
-                        fill_top = peak * (1 + (-(layer-1) * min_drawdown_label))
-                    
-                    # 填充條件：series低於這層的上界
-                    where_condition = series < fill_top
-                    if where_condition.any():
-                        label_text = f'Drawdown >{(layer-1)*min_drawdown_label*100:.0f}%' if layer == 1 else None
-                        ax.fill_between(df.index, series, fill_top,
-                                       where=where_condition,
-                                       color='red', alpha=0.25, label=label_text)
-            else:
-                # 不分層，直接畫一層
-                ax.fill_between(df.index, series, peak, 
-                               where=(series < peak),
-                               color='red', alpha=0.3, label='Drawdown')
+            # 繪製疊加式 drawdown 陰影 (從淺到深, 所有層一次繪製)
+            peak = pd.Series(running_peak(series), index=series.index)
+            fill_drawdown(ax, shown, peak.loc[shown.index], layer_step, max_drawdown(series),
+                          alpha=0.25 if layer_step else 0.3,
+                          label='Drawdown >0%' if layer_step else 'Drawdown')
             
             # 標註顯著回撤點
             if min_drawdown_label is not None:
-                in_drawdown = False
-                maxdd, maxdd_date = 0, None
-                drawdown_labels = []
-                
-                for date, value in series.items():
-                    if value >= peak[date]:
-                        # 結束回撤期，記錄標籤
-                        if in_drawdown and maxdd < -min_drawdown_label:
-                            drawdown_labels.append((maxdd_date, maxdd))
-                        in_drawdown = False
-                        maxdd, maxdd_date = 0, None
-                    else:
-                        # 進入或持續回撤期
-                        if not in_drawdown:
-                            in_drawdown = True
-                        dd_val = (value - peak[date]) / peak[date]
-                        if dd_val < maxdd:
-                            maxdd = dd_val
-                            maxdd_date = date
-                
-                # 繪製標籤
-                for date, dd_val in drawdown_labels:
-                    ax.text(date, series[date], f"{abs(dd_val):.2%}",
-                           color='red', fontsize=9, va='bottom', ha='right')
+                self._label_drawdowns(ax, series, min_drawdown_label)
         else:
             # 多曲線模式 - 繪製區間 + 各曲線
             lower_band = df.quantile(0.25, axis=1)
             upper_band = df.quantile(0.75, axis=1)
             median = df.median(axis=1)
+            bands = pd.DataFrame({'median': median, 'lower': lower_band, 'upper': upper_band}).dropna()
+            shown = bands.loc[downsample(bands[['median']], max_points)['median'].index]
             
             # 繪製疊加式回撤陰影 (基於中位數)
-            peak = median.cummax()
-            drawdown_pct = (median - peak) / peak
-            
-            if min_drawdown_label is not None and min_drawdown_label > 0:
-                # 計算最大回撤深度，決定要畫幾層
-                max_dd = abs(drawdown_pct.min())
-                num_layers = int(max_dd / min_drawdown_label) + 1
-                
-                # 從淺到深依序疊加繪製
-                for layer in range(1, num_layers + 1):
-                    threshold = -layer * min_drawdown_label
-                    
-                    if layer == 1:
-                        fill_top = peak  # 第一層從peak開始
-                    else:
-                        fill_top = peak * (1 + (-(layer-1) * min_drawdown_label))
-                    
-                    where_condition = median < fill_top
-                    if where_condition.any():
-                        label_text = f'Median DD >{(layer-1)*min_drawdown_label*100:.0f}%' if layer == 1 else None
-                        ax.fill_between(df.index, median, fill_top,
-                                       where=where_condition,
-                                       color='red', alpha=0.2, label=label_text)
-            else:
-                # 不分層
-                ax.fill_between(df.index, median, peak, 
-                               where=(median < peak),
-                               color='red', alpha=0.2, label='Median Drawdown')
+            peak = pd.Series(running_peak(median), index=median.index)
+            fill_drawdown(ax, shown['median'], peak.loc[shown.index], layer_step, max_drawdown(median),
+                          alpha=0.2, label='Median DD >0%' if layer_step else 'Median Drawdown')
             
             # 繪製區間
-            ax.fill_between(df.index, lower_band, upper_band,
+            ax.fill_between(shown.index, shown['lower'], shown['upper'],
                            color='lightblue', alpha=0.3, label='IQR Band (25%-75%)')
-            ax.plot(median, color='navy', linewidth=2.5, 
+            ax.plot(shown['median'], color='navy', linewidth=2.5, 
                    linestyle='--', label='Median', alpha=0.8)
             
             # 標註顯著回撤點 (基於中位數)
             if min_drawdown_label is not None:
-                in_drawdown = False
-                maxdd, maxdd_date = 0, None
-                drawdown_labels = []
-                
-                for date, value in median.items():
-                    if value >= peak[date]:
-                        if in_drawdown and maxdd < -min_drawdown_label:
-                            drawdown_labels.append((maxdd_date, maxdd))
-                        in_drawdown = False
-                        maxdd, maxdd_date = 0, None
-                    else:
-                        if not in_drawdown:
-                            in_drawdown = True
-                        dd_val = (value - peak[date]) / peak[date]
-                        if dd_val < maxdd:
-                            maxdd = dd_val
-                            maxdd_date = date
-                
-                for date, dd_val in drawdown_labels:
-                    ax.text(date, median[date], f"{abs(dd_val):.2%}",
-                           color='red', fontsize=9, va='bottom', ha='right')
+                self._label_drawdowns(ax, median, min_drawdown_label)
             
             # 繪製各策略曲線
             colors = plt.cm.Set2(np.linspace(0, 1, len(df.columns)))
-            for (label, series), color in zip(df.items(), colors):
-                ax.plot(series, label=label, linewidth=1.5, 
+            show_labels = len(df.columns) <= self.LEGEND_CURVES
+            for (label, series), color in zip(downsample(df, max_points).items(), colors):
+                ax.plot(series, label=label if show_labels else None, linewidth=1.5, 
                        color=color, alpha=0.7)
         
         ax.set_yscale('log')
@@ -510,10 +777,26 @@ class SimulatedMarket:
         ax.set_title('Portfolio Equity Curve', fontsize=14, fontweight='bold')
         ax.set_ylabel('Portfolio Value (Log Scale)')
         ax.set_xlabel('Date')
-        plt.tight_layout()
+        fig.tight_layout()
         
+        png = figure_to_png(fig, dpi) if headless else None
         if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            if png is not None and save_path.lower().endswith('.png'):
+                with open(save_path, 'wb') as f:
+                    f.write(png)
+            else:
+                fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
             print(f"📊 Chart saved to: {save_path}")
         
-        plt.show()
+        if not headless:
+            plt.show()
+        return png
+        
+    @staticmethod
+    def _label_drawdowns(ax, series: pd.Series, min_drawdown: float):
+        """在已回到前高、幅度超過 min_drawdown 的回撤區間最低點標註回撤幅度"""
+        episodes = drawdown_episodes(series)
+        selected = episodes.recovered & (episodes.depth > min_drawdown)
+        for trough, depth in zip(episodes.trough[selected], episodes.depth[selected]):
+            ax.text(series.index[trough], series.iloc[trough], f"{depth:.2%}",
+                   color='red', fontsize=9, va='bottom', ha='right')
@@ -0,0 +1,277 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(RuntimeError):
+    """斷路器開啟中且沒有快取可用"""
+
+
+class TokenBucket:
+    """Token bucket 限流器 (執行緒安全) - 平均每秒 rate 次, 最多連續 capacity 次"""
+
+    def __init__(self, rate: float, capacity: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取得一個 token, 不足時等待; 回傳等待秒數"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """斷路器 - 連續失敗 failure_threshold 次後開啟, reset_timeout 秒後允許一次試探"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允許呼叫上游"""
+        with self.lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_neutral(self):
+        """
+        上游有回應但無法判斷是否恢復 (如 404、錯誤的代碼): 不改變狀態與失敗次數;
+        試探中時恢復為開啟, 下一次呼叫再試探
+        """
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self) -> bool:
+        """記錄一次失敗, 回傳是否因此開啟斷路器"""
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or \
+                    (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                return True
+            return False
+
+
+class DataSourceClient:
+    """
+    數據來源的共用連線層 - 連線池、限流、隨機退避重試與斷路器
+
+    同一來源的所有呼叫 (含多執行緒) 共用一個 client, 以 metrics() 取得限流統計。
+    上游持續失敗時斷路器開啟, 改用最近一次成功的快取結果。
+    """
+
+    def __init__(self, name: str, rate: float = 5.0, capacity: int = 10, max_retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 8.0, timeout: float = 30.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, cache_size: int = 256,
+                 pool_size: int = 16, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            name: 來源名稱
+            rate: 每秒平均請求數
+            capacity: 最多可連續發出的請求數 (burst)
+            max_retries: 可重試錯誤的最大重試次數
+            backoff: 退避基準秒數, 第 n 次重試等待 uniform(0, backoff * 2^n) 秒 (full jitter)
+            max_backoff: 單次退避上限秒數
+            timeout: HTTP 請求逾時秒數
+            failure_threshold: 連續失敗幾次後開啟斷路器
+            reset_timeout: 斷路器開啟後多久允許試探
+            cache_size: 最近成功結果的快取筆數 (LRU), 斷路器開啟時使用
+            pool_size: 連線池大小
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.sleep = sleep
+        self.limiter = TokenBucket(rate, capacity, clock=clock, sleep=sleep)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = dict.fromkeys([
+            'requests', 'successes', 'failures', 'retries', 'throttled',
+            'circuit_trips', 'circuit_rejections', 'cache_fallbacks'
+        ], 0)
+        self._metrics['rate_limit_wait'] = 0.0
+
+    def _count(self, key: str, value=1):
+        with self._lock:
+            self._metrics[key] += value
+
+    @staticmethod
+    def is_throttled(error: Exception) -> bool:
+        """是否為上游限流 (HTTP 429 或 yfinance 的 YFRateLimitError)"""
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None) == 429 or 'RateLimit' in type(error).__name__
+
+    @classmethod
+    def is_retryable(cls, error: Exception) -> bool:
+        """暫時性錯誤 (限流、連線、逾時、5xx) 才重試並計入斷路器"""
+        if cls.is_throttled(error):
+            return True
+        if isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError)):
+            return True
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status is not None and status >= 500
+
+    def call(self, key: Optional[Hashable], fn: Callable[[], Any]) -> Any:
+        """
+        經過限流、重試與斷路器執行一次上游呼叫
+
+        Args:
+            key: 快取鍵 (None 表示不快取)
+            fn: 實際呼叫上游的函式
+
+        Returns:
+            fn() 的結果; 斷路器開啟或重試用盡時回傳快取結果 (若有)
+        """
+        if not self.breaker.allow():
+            self._count('circuit_rejections')
+            return self._fallback(key, CircuitOpenError(f"{self.name}: circuit open, no cached result"))
+
+        for attempt in range(self.max_retries + 1):
+            self._count('rate_limit_wait', self.limiter.acquire())
+            self._count('requests')
+            try:
+                result = fn()
+            except Exception as e:
+                if not self.is_retryable(e):
+                    # 上游有回應 (如 404 或資料錯誤), 不視為連線失敗, 也不代表已恢復
+                    self.breaker.record_neutral()
+                    raise
+                if self.is_throttled(e):
+                    self._count('throttled')
+                if self.breaker.record_failure():
+                    self._count('circuit_trips')
+                if attempt == self.max_retries or not self.breaker.allow():
+                    self._count('failures')
+                    return self._fallback(key, e)
+                self._count('retries')
+                self.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+                continue
+
+            self.breaker.record_success()
+            self._count('successes')
+            if key is not None and self.cache_size > 0:
+                with self._lock:
+                    self._cache[key] = result
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+            return result
+
+    def _fallback(self, key: Optional[Hashable], error: Exception) -> Any:
+        """回傳快取結果, 沒有快取時拋出原本的錯誤"""
+        with self._lock:
+            if key is not None and key in self._cache:
+                self._metrics['cache_fallbacks'] += 1
+                return self._cache[key]
+        raise error
+
+    def get(self, url: str, cache_key: Optional[Hashable] = None, **kwargs) -> requests.Response:
+        """以共用連線池發出 GET 請求 (非 2xx 時拋出 HTTPError)"""
+        timeout = kwargs.pop('timeout', self.timeout)
+
+        def request():
+            response = self.session.get(url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response
+        return self.call(cache_key, request)
+
+    def get_json(self, url: str, cache_key: Optional[Hashable] = None, **kwargs) -> Any:
+        """GET 並解析 JSON (快取的是解析後的結果)"""
+        timeout = kwargs.pop('timeout', self.timeout)
+
+        def request():
+            response = self.session.get(url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        return self.call(cache_key, request)
+
+    def metrics(self) -> Dict[str, Any]:
+        """限流與錯誤統計"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['circuit_state'] = self.breaker.state
+        metrics['cached'] = len(self._cache)
+        return metrics
+
+
+# 各數據來源的預設設定 (可用 configure 調整)
+DEFAULT_CONFIG = {
+    'tradingview': {'rate': 1.0, 'capacity': 2, 'cache_size': 16},
+    # 歷史數據由 MarketDataProvider.raw_store 保存; client 只保留少量完整數據, 
+    # 供斷路器開啟時 (如隔天重新下載) 退回使用, 其餘股票拋出 CircuitOpenError
+    'yahoo': {'rate': 5.0, 'capacity': 10, 'cache_size': 32},
+}
+
+_clients: Dict[str, DataSourceClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str) -> DataSourceClient:
+    """取得指定來源的共用 client (第一次使用時以 DEFAULT_CONFIG 建立)"""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = DataSourceClient(name, **DEFAULT_CONFIG.get(name, {}))
+        return _clients[name]
+
+
+def configure(name: str, **config) -> DataSourceClient:
+    """以新設定重建指定來源的共用 client (如調整 rate / capacity 以配合併發數)"""
+    with _clients_lock:
+        _clients[name] = DataSourceClient(name, **{**DEFAULT_CONFIG.get(name, {}), **config})
+        return _clients[name]
+
+
+def http_metrics() -> Dict[str, Dict[str, Any]]:
+    """所有已建立 client 的統計"""
+    with _clients_lock:
+        clients = dict(_clients)
+    return {name: client.metrics() for name, client in clients.items()}
@@ -0,0 +1,195 @@
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+
+
+# 個股指標欄位 (與 MarketDataProvider.TICKER_COLUMNS 的 key 相同)
+TICKER_FIELDS = ('Close', 'Sharpe', 'Base', 'Volatility', 'Beta')
+
+
+def compute_indicators(close: pd.DataFrame, sharpe_window: int = 365, risk_free_rate: float = 0.04,
+                       columns: list = None) -> Dict[str, pd.DataFrame]:
+    """
+    對 dates × tickers 收盤價矩陣一次計算所有股票的指標
+
+    與 calculate_statistical_indicators / calculate_sharpe 逐檔計算的結果相同;
+    逐元素運算以 NumPy 處理, 滾動平均與標準差使用 pandas 的 2-D 視窗核心。
+
+    Args:
+        close: 收盤價矩陣 (所有欄位需共用同一交易日曆, 且已排除第一個交易日)
+        sharpe_window: 計算 Sharpe 比率的視窗大小
+        risk_free_rate: 年化無風險利率
+        columns: 需要的欄位 (TICKER_FIELDS 子集, 預設全部)
+
+    Returns:
+        {欄位: dates × tickers DataFrame}
+    """
+    columns = TICKER_FIELDS if columns is None else columns
+    values = close.to_numpy(dtype=float)
+    index, tickers = close.index, close.columns
+
+    def frame(array):
+        return pd.DataFrame(array, index=index, columns=tickers)
+
+    result = {}
+    if 'Close' in columns:
+        result['Close'] = close
+
+    if 'Sharpe' in columns:
+        returns = np.full_like(values, np.nan)
+        returns[1:] = values[1:] / values[:-1] - 1
+        rolling = frame(returns - risk_free_rate / sharpe_window).rolling(sharpe_window)
+        result['Sharpe'] = rolling.mean() / rolling.std() * np.sqrt(sharpe_window)
+
+    if set(columns) & {'Base', 'Volatility', 'Beta'}:
+        log_ret = np.full_like(values, np.nan)
+        log_ret[1:] = np.diff(np.log(values), axis=0)
+        vol = frame(log_ret).expanding().std(ddof=0).to_numpy() * np.sqrt(252)
+        vol[0] = np.nan
+
+        vol_clean = np.where(vol == 0, np.nan, vol)
+        cum_avg = frame(vol_clean).expanding().mean().to_numpy()
+        cum_max = np.fmax.accumulate(vol_clean, axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base = 1.0 / cum_avg
+            betas = np.where(cum_max > 0, vol / cum_max, np.nan)
+
+        if 'Volatility' in columns:
+            result['Volatility'] = frame(vol)
+        if 'Base' in columns:
+            result['Base'] = frame(base).ffill()
+        if 'Beta' in columns:
+            result['Beta'] = frame(betas).ffill()
+
+    return result
+
+
+def group_by_calendar(closes: Dict[str, pd.Series]) -> List[pd.DataFrame]:
+    """將收盤價依交易日曆分組, 每組組成一個 dates × tickers 矩陣"""
+    groups = {}
+    for ticker, series in closes.items():
+        key = (len(series.index), series.index[0], series.index[-1])
+        for index, members in groups.setdefault(key, []):
+            if index.equals(series.index):
+                members.append(ticker)
+                break
+        else:
+            groups[key].append((series.index, [ticker]))
+
+    return [
+        pd.DataFrame(np.column_stack([closes[t].to_numpy(dtype=float) for t in members]),
+                     index=index, columns=members)
+        for candidates in groups.values() for index, members in candidates
+    ]
+
+
+def compute_universe_indicators(closes: Dict[str, pd.Series], index: pd.Index, sharpe_window: int = 365,
+                                risk_free_rate: float = 0.04, columns: list = None,
+                                dtype=None) -> Dict[str, pd.Series]:
+    """
+    計算整個股票池的指標並對齊到指定日期索引
+
+    Args:
+        closes: {ticker: 收盤價 (已排除第一個交易日)}
+        index: 輸出的日期索引 (大盤指數的交易日); None 時保留各股票自己的交易日曆
+        dtype: 輸出型別 (如 np.float32); 指標仍以 float64 計算, 每個交易日曆分組算完即轉換
+
+    Returns:
+        {f'{ticker}_{欄位}': Series}, 依 closes 與 columns 的順序排列
+    """
+    columns = TICKER_FIELDS if columns is None else columns
+    aligned = {}
+    for close in group_by_calendar(closes):
+        result = compute_indicators(close, sharpe_window=sharpe_window,
+                                    risk_free_rate=risk_free_rate, columns=columns)
+        for column, values in result.items():
+            if index is not None:
+                values = values.reindex(index)
+            if dtype is not None:
+                values = values.astype(dtype)
+            for ticker in values.columns:
+                aligned[f'{ticker}_{column}'] = values[ticker]
+
+    return {
+        f'{ticker}_{column}': aligned[f'{ticker}_{column}']
+        for ticker in closes for column in columns
+    }
+
+
+class _OrderStatistics:
+    """以 Fenwick tree 維護已加入數值的順序統計量 (插入與查詢第 k 小皆為 O(log n))"""
+
+    def __init__(self, values: np.ndarray):
+        """
+        Args:
+            values: 之後會依序加入的所有數值 (只用來決定排名, 不代表已加入)
+        """
+        order = np.argsort(values, kind='stable')
+        self.sorted = values[order]
+        self.rank = np.empty(len(values), dtype=np.int64)
+        self.rank[order] = np.arange(len(values))
+        self.tree = [0] * (len(values) + 1)
+        self.top = 1 << max(len(values).bit_length() - 1, 0)
+        self.size = 0
+
+    def insert(self, i: int):
+        """加入第 i 個數值"""
+        pos = int(self.rank[i]) + 1
+        while pos < len(self.tree):
+            self.tree[pos] += 1
+            pos += pos & -pos
+        self.size += 1
+
+    def kth(self, k: int) -> float:
+        """已加入數值中第 k 小 (0 起算)"""
+        pos, remaining, step = 0, k + 1, self.top
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] < remaining:
+                pos = nxt
+                remaining -= self.tree[nxt]
+            step >>= 1
+        return self.sorted[pos]
+
+    def quantile(self, q: float) -> float:
+        """已加入數值的分位數 (與 np.quantile 預設的線性內插相同)"""
+        position = q * (self.size - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, self.size - 1)
+        low = self.kth(lower)
+        return low + (position - lower) * (self.kth(upper) - low)
+
+
+def expanding_rainbow_levels(ln_days: np.ndarray, log10_price: np.ndarray, quantiles: list):
+    """
+    逐日只使用當日以前的資料計算彩虹圖 (point-in-time)
+
+    對數-對數回歸以累計和更新; 每日殘差以當日的回歸計算後固定,
+    分位數以順序統計結構逐日維護, 整段歷史約 O(n log n)。
+
+    Returns:
+        (log10_trend, resid, levels): 每日趨勢、當日殘差與 (n × len(quantiles)) 的殘差分位數
+    """
+    x, y = np.asarray(ln_days, dtype=float), np.asarray(log10_price, dtype=float)
+    n = np.arange(1, len(x) + 1)
+    sx, sy = np.cumsum(x), np.cumsum(y)
+    sxx, sxy = np.cumsum(x * x), np.cumsum(x * y)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sxx - sx * sx
+        a = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+        b = (sy - a * sx) / n
+    log10_trend = a * x + b
+    resid = y - log10_trend
+
+    levels = np.full((len(x), len(quantiles)), np.nan)
+    valid = np.isfinite(resid)
+    stats = _OrderStatistics(np.where(valid, resid, np.inf))
+    for i in range(len(x)):
+        if valid[i]:
+            stats.insert(i)
+        if stats.size:
+            levels[i] = [stats.quantile(q) for q in quantiles]
+    levels[~valid] = np.nan
+    return log10_trend, resid, levels
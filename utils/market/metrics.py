@@ -0,0 +1,234 @@
+"""
+績效指標 - 以陣列運算一次計算多條權益曲線的回撤、回撤區間、年化報酬與 Sharpe
+
+所有函式接受單一曲線 (長度 T) 或多條曲線 ((T, K) 陣列 / DataFrame, 每欄一條曲線);
+缺值 (NaN, 如不同期間的曲線對齊後的頭尾) 不視為回撤。
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def _as_2d(values) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    return values[:, None] if values.ndim == 1 else values
+
+
+def _squeeze(result: np.ndarray, values):
+    """單一曲線時回傳純量"""
+    return result[0] if np.ndim(values) == 1 else result
+
+
+def running_peak(values) -> np.ndarray:
+    """歷史最高值 (缺值沿用前一個最高值, 開頭的缺值保持 NaN)"""
+    values = np.asarray(values, dtype=float)
+    return np.fmax.accumulate(values, axis=0)
+
+
+def drawdown(values) -> np.ndarray:
+    """回撤序列 (value - peak) / peak, 負值表示低於前高"""
+    values = np.asarray(values, dtype=float)
+    peak = running_peak(values)
+    return (values - peak) / peak
+
+
+def max_drawdown(values):
+    """最大回撤幅度 (正值)"""
+    dd = _as_2d(drawdown(values))
+    with np.errstate(invalid='ignore'):
+        depth = -np.fmin.reduce(dd, axis=0) if len(dd) else np.zeros(dd.shape[1])
+    return _squeeze(np.where(depth > 0, depth, 0.0), values)
+
+
+@dataclass
+class DrawdownEpisodes:
+    """
+    回撤區間 (每個區間一筆, 依曲線與時間排序)
+
+    區間為連續低於前高的交易日 [start, end); end 為回到前高的位置,
+    尚未回到前高時 recovered 為 False (end 為曲線長度或缺值的位置)。
+    """
+    curve: np.ndarray      # 所屬曲線 (欄位位置)
+    start: np.ndarray      # 第一個低於前高的位置
+    trough: np.ndarray     # 最低點位置 (同深度取最早)
+    end: np.ndarray        # 回到前高的位置
+    depth: np.ndarray      # 回撤幅度 (正值)
+    recovered: np.ndarray  # 是否已回到前高
+
+    def __len__(self) -> int:
+        return len(self.depth)
+
+    def to_frame(self, index=None, columns=None) -> pd.DataFrame:
+        """
+        轉為 DataFrame
+
+        Args:
+            index: 曲線的日期索引 (可選, 指定時位置轉為日期, 未回復的 recovery 為 NaT)
+            columns: 曲線名稱 (可選)
+        """
+        frame = pd.DataFrame({
+            'curve': self.curve if columns is None else np.asarray(columns)[self.curve],
+            'start': self.start,
+            'trough': self.trough,
+            'recovery': self.end,
+            'depth': self.depth,
+            'recovered': self.recovered,
+        })
+        if index is not None:
+            index = pd.Index(index)
+            for column in ('start', 'trough'):
+                frame[column] = index[frame[column]]
+            recovery = np.where(self.recovered, self.end, 0)
+            frame['recovery'] = index[recovery].where(self.recovered)
+        return frame
+
+
+def drawdown_episodes(values) -> DrawdownEpisodes:
+    """
+    找出所有曲線的回撤區間 (不使用逐日迴圈)
+
+    Args:
+        values: 單一曲線 (T,) 或多條曲線 (T, K)
+
+    Returns:
+        DrawdownEpisodes
+    """
+    dd = _as_2d(drawdown(values))
+    length, n_curves = dd.shape
+    width = length + 1
+
+    # 各曲線之後接一個非回撤的分隔位置, 攤平後每個區間都在同一條曲線內結束
+    flat_dd = np.zeros((n_curves, width))
+    flat_dd[:, :length] = dd.T
+    flat_dd = flat_dd.ravel()
+    with np.errstate(invalid='ignore'):
+        under = flat_dd < 0
+    edges = np.diff(under.astype(np.int8), prepend=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    if len(starts):
+        depth = np.minimum.reduceat(flat_dd, np.column_stack([starts, ends]).ravel())[::2]
+        positions = np.flatnonzero(under)
+        episode = np.cumsum(edges == 1)[positions] - 1
+        at_trough = flat_dd[positions] == depth[episode]
+        positions, episode = positions[at_trough], episode[at_trough]
+        first = np.r_[True, episode[1:] != episode[:-1]]
+        trough = positions[first] % width
+    else:
+        depth = trough = np.zeros(0)
+
+    end = ends % width
+    recovered = end < length
+    recovered[recovered] = dd[end[recovered], starts[recovered] // width] >= 0
+    return DrawdownEpisodes(
+        curve=starts // width,
+        start=starts % width,
+        trough=trough.astype(np.int64),
+        end=end,
+        depth=-depth,
+        recovered=recovered,
+    )
+
+
+def average_drawdown(values, threshold: float = 0.15, episodes: DrawdownEpisodes = None):
+    """
+    幅度不小於門檻的回撤區間的平均幅度與次數 (含尚未回到前高的最後一段)
+
+    Args:
+        values: 單一曲線或多條曲線
+        threshold: 回撤門檻 (預設 0.15, 即 15%)
+        episodes: 已計算的 drawdown_episodes(values) (可選)
+
+    Returns:
+        (average, count): 沒有符合的回撤時為 (0, 0)
+    """
+    n_curves = _as_2d(values).shape[1]
+    episodes = episodes if episodes is not None else drawdown_episodes(values)
+    selected = episodes.depth >= threshold
+    curve = episodes.curve[selected]
+    count = np.bincount(curve, minlength=n_curves)
+    total = np.bincount(curve, weights=episodes.depth[selected], minlength=n_curves)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(count > 0, total / count, 0.0)
+    return _squeeze(average, values), _squeeze(count, values)
+
+
+def annual_return(values, dates, initial=None):
+    """
+    年化報酬 (final / initial) ** (365 / 天數) - 1, 天數為第一個與最後一個有效值的日曆日差
+
+    Args:
+        values: 單一曲線或多條曲線
+        dates: 日期索引 (長度 T)
+        initial: 初始資金 (純量或每條曲線一個, 預設為曲線的第一個有效值)
+    """
+    curves = _as_2d(values)
+    length, n_curves = curves.shape
+    columns = np.arange(n_curves)
+    valid = ~np.isnan(curves)
+    first = valid.argmax(axis=0)
+    last = length - 1 - valid[::-1].argmax(axis=0)
+
+    final = curves[last, columns]
+    initial = curves[first, columns] if initial is None else np.broadcast_to(np.asarray(initial, dtype=float), (n_curves,))
+    dates = pd.DatetimeIndex(dates).to_numpy()
+    days = (dates[last] - dates[first]) // np.timedelta64(1, 'D')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = np.where(days > 0, (final / initial) ** (365 / np.where(days > 0, days, 1)) - 1, 0.0)
+    return _squeeze(result, values)
+
+
+def sharpe_ratio(values, periods: int = 252):
+    """
+    以每日報酬計算的年化 Sharpe (mean / std * √periods, 無風險利率為 0); 報酬標準差為 0 時為 0
+    """
+    curves = _as_2d(values)
+    returns = curves[1:] / curves[:-1] - 1
+    valid = ~np.isnan(returns)
+    count = valid.sum(axis=0)
+    returns = np.where(valid, returns, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = returns.sum(axis=0) / count
+        std = np.sqrt((np.where(valid, returns - mean, 0.0) ** 2).sum(axis=0) / (count - 1))
+        result = np.where(std > 0, mean / std * np.sqrt(periods), 0.0)
+    return _squeeze(result, values)
+
+
+def summarize_curves(curves: pd.DataFrame, initial=None, threshold: float = 0.15) -> pd.DataFrame:
+    """
+    一次計算多條權益曲線的績效指標
+
+    Args:
+        curves: 權益曲線 (日期索引, 每欄一條曲線)
+        initial: 初始資金 (純量或每欄一個, 預設為曲線的第一個有效值)
+        threshold: 平均回撤的門檻
+
+    Returns:
+        DataFrame (每條曲線一列): final_value, total_return, annual_return, max_drawdown,
+        sharpe, avg_drawdown, drawdown_count
+    """
+    columns = ['final_value', 'total_return', 'annual_return', 'max_drawdown',
+               'sharpe', 'avg_drawdown', 'drawdown_count']
+    values = curves.to_numpy(dtype=float)
+    length, n_curves = values.shape
+    if length == 0 or n_curves == 0:
+        return pd.DataFrame(np.zeros((n_curves, len(columns))), index=curves.columns, columns=columns)
+    valid = ~np.isnan(values)
+    positions = np.arange(n_curves)
+    final = values[length - 1 - valid[::-1].argmax(axis=0), positions]
+    start = values[valid.argmax(axis=0), positions] if initial is None else \
+        np.broadcast_to(np.asarray(initial, dtype=float), (n_curves,))
+
+    avg_drawdown, drawdown_count = average_drawdown(values, threshold)
+    return pd.DataFrame(dict(zip(columns, (
+        final,
+        final / start - 1,
+        annual_return(values, curves.index, start),
+        max_drawdown(values),
+        sharpe_ratio(values),
+        avg_drawdown,
+        drawdown_count,
+    ))), index=curves.columns)
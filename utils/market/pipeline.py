@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+
+
+# 欄位以樣板表示: {code} 代表個股代碼, {industry} 代表產業名稱,
+# 不含樣板的欄位 (如 Trend, segments) 為市場層級欄位
+TICKER_PREFIX = '{code}_'
+
+
+@dataclass(frozen=True)
+class PipelineStage:
+    """數據建立流程的單一階段"""
+    name: str
+    provides: Tuple[str, ...]
+    requires: Tuple[str, ...] = ()
+
+
+# 依執行順序排列 (同時為拓撲順序)
+STAGES = [
+    PipelineStage('download',
+                  provides=('{code}_Close', '{code}_Sharpe', '{code}_Base', '{code}_Volatility', '{code}_Beta')),
+    PipelineStage('industry',
+                  provides=('{industry}_Integrated_Sharpe', '{industry}_Sharpe_Slope',
+                            '{industry}_MA_Short', '{industry}_MA_Long'),
+                  requires=('{code}_Sharpe',)),
+    PipelineStage('turning_points',
+                  provides=('{industry}_CP',),
+                  requires=('{industry}_Sharpe_Slope', '{industry}_MA_Short', '{industry}_MA_Long')),
+    PipelineStage('overall_state',
+                  provides=('{industry}_Crossover_State', 'Trend'),
+                  requires=('{industry}_MA_Short', '{industry}_MA_Long')),
+    PipelineStage('decline',
+                  provides=('{industry}_Decline',),
+                  requires=('Trend', '{industry}_Crossover_State', '{industry}_CP')),
+]
+
+ALL_FIELDS = tuple(field for stage in STAGES for field in stage.provides)
+
+
+def resolve_stages(fields: Optional[Iterable[str]] = None) -> Tuple[List[str], List[str]]:
+    """
+    依需求欄位反推需要執行的階段
+
+    Args:
+        fields: 需求欄位樣板 (None 表示全部)
+
+    Returns:
+        (依序執行的階段名稱, 需要下載計算的個股欄位後綴)
+    """
+    needed = set(ALL_FIELDS if fields is None else fields)
+
+    selected = []
+    for stage in reversed(STAGES):
+        if needed.intersection(stage.provides):
+            selected.append(stage.name)
+            needed.update(stage.requires)
+    selected.reverse()
+
+    download = STAGES[0]
+    ticker_columns = [
+        field[len(TICKER_PREFIX):] for field in download.provides if field in needed
+    ]
+    return selected, ticker_columns
+
+
+def available_fields(stages: Iterable[str], ticker_columns: Iterable[str]) -> Set[str]:
+    """回傳執行指定階段後可取得的欄位樣板"""
+    stages = set(stages)
+    fields = {TICKER_PREFIX + column for column in ticker_columns}
+    for stage in STAGES[1:]:
+        if stage.name in stages:
+            fields.update(stage.provides)
+    return fields
+
+
+def collect_fields(*sources) -> Optional[List[str]]:
+    """
+    合併多個策略 / 報表的需求欄位
+
+    Args:
+        sources: 策略 (類別或實例, 讀取 required_fields) 或欄位樣板列表
+
+    Returns:
+        合併後的欄位樣板, 任一來源未宣告需求時回傳 None (表示全部)
+    """
+    fields = []
+    for source in sources:
+        required = getattr(source, 'required_fields', source)
+        if required is None:
+            return None
+        fields.extend(f for f in required if f not in fields)
+    return fields
+
+
+def expand_fields(fields: Iterable[str], codes: Iterable[str], industries: Iterable[str]) -> List[str]:
+    """將欄位樣板展開為實際欄位名稱 (依樣板順序, 不含重複)"""
+    codes, industries = list(codes), list(industries)
+    columns, seen = [], set()
+    for field in fields:
+        if '{code}' in field:
+            names = [field.format(code=code) for code in codes]
+        elif '{industry}' in field:
+            names = [field.format(industry=industry) for industry in industries]
+        else:
+            names = [field]
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                columns.append(name)
+    return columns
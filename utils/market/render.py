@@ -0,0 +1,146 @@
+"""
+權益曲線繪圖輔助 - LTTB 降採樣與批次回撤陰影
+
+長期間、多條曲線時, 每條曲線先降採樣到畫面可分辨的點數 (保留形狀與極值),
+各層回撤陰影合併為單一 PolyCollection 一次繪製。
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import PolyCollection
+from matplotlib.dates import date2num
+
+
+def lttb_indices(values: np.ndarray, n_out: int, x: np.ndarray = None) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 降採樣 - 多條共用 x 的曲線同時計算
+
+    Args:
+        values: 曲線數值 (T,) 或 (T, K), 不可含 NaN
+        n_out: 保留的點數 (含第一點與最後一點)
+        x: 橫軸位置 (預設為 0..T-1)
+
+    Returns:
+        保留點的位置 (n_out,) 或 (n_out, K), 各曲線遞增; T <= n_out 時保留全部
+    """
+    values = np.asarray(values, dtype=float)
+    squeeze = values.ndim == 1
+    y = values[:, None] if squeeze else values
+    length, n_curves = y.shape
+    if length <= n_out or n_out < 3:
+        selected = np.repeat(np.arange(length)[:, None], n_curves, axis=1)
+        return selected[:, 0] if squeeze else selected
+
+    x = np.arange(length, dtype=float) if x is None else np.asarray(x, dtype=float)
+    # 中間 T-2 點分成 n_out-2 個桶, 最後一個桶的「下一桶」為最後一點
+    edges = np.append(np.linspace(1, length - 1, n_out - 1).astype(np.int64), length)
+    csum_x = np.concatenate([[0.0], np.cumsum(x)])
+    csum_y = np.vstack([np.zeros(n_curves), np.cumsum(y, axis=0)])
+    next_lo, next_hi = edges[1:-1], edges[2:]
+    size = (next_hi - next_lo)[:, None]
+    next_x = (csum_x[next_hi] - csum_x[next_lo])[:, None] / size
+    next_y = (csum_y[next_hi] - csum_y[next_lo]) / size
+
+    columns = np.arange(n_curves)
+    selected = np.empty((n_out, n_curves), dtype=np.int64)
+    selected[0], selected[-1] = 0, length - 1
+    anchor = selected[0]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        anchor_x, anchor_y = x[anchor], y[anchor, columns]
+        area = np.abs((anchor_x - next_x[i]) * (y[lo:hi] - anchor_y)
+                      - (anchor_x - x[lo:hi, None]) * (next_y[i] - anchor_y))
+        anchor = lo + area.argmax(axis=0)
+        selected[i + 1] = anchor
+    return selected[:, 0] if squeeze else selected
+
+
+def downsample(curves: pd.DataFrame, max_points: int = None, log: bool = True) -> dict:
+    """
+    以 LTTB 降採樣每條曲線 (沒有缺值的曲線一起計算)
+
+    Args:
+        curves: 曲線 (日期索引, 每欄一條曲線; 缺值視為該曲線不存在的日期)
+        max_points: 每條曲線最多保留的點數 (None 表示不降採樣)
+        log: 以對數值選點 (對數座標的圖)
+
+    Returns:
+        {欄位: 降採樣後的 Series}
+    """
+    if max_points is None:
+        return {column: curves[column].dropna() for column in curves.columns}
+
+    result = {}
+    values = curves.to_numpy(dtype=float)
+    complete = ~np.isnan(values).any(axis=0)
+    x = date2num(curves.index)
+    transform = _log if log else np.asarray
+    if complete.any():
+        block = np.flatnonzero(complete)
+        selected = lttb_indices(transform(values[:, block]), max_points, x)
+        for j, column in enumerate(block):
+            result[curves.columns[column]] = curves.iloc[selected[:, j], column]
+    for column in np.flatnonzero(~complete):
+        series = curves.iloc[:, column].dropna()
+        if len(series):
+            series = series.iloc[lttb_indices(transform(series.to_numpy()), max_points, date2num(series.index))]
+        result[curves.columns[column]] = series
+    return {column: result[column] for column in curves.columns}
+
+
+def _log(values: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logged = np.log(values)
+    return np.where(np.isfinite(logged), logged, 0.0)
+
+
+def drawdown_layers(series: pd.Series, peak: pd.Series, step: float = None, max_depth: float = 0.0) -> list:
+    """
+    疊加式回撤陰影的多邊形 - 第 n 層填滿曲線與 peak × (1 - (n-1) × step) 之間曲線較低的區段
+
+    Args:
+        series: 曲線
+        peak: 曲線的歷史最高值 (與 series 相同索引)
+        step: 每層的回撤幅度 (None 表示只畫一層: 曲線與 peak 之間)
+        max_depth: 最大回撤幅度 (決定層數)
+
+    Returns:
+        多邊形頂點列表 (每個為 (N, 2) 陣列, 橫軸為 matplotlib 日期數值)
+    """
+    x = date2num(series.index)
+    y = series.to_numpy(dtype=float)
+    peak = peak.to_numpy(dtype=float)
+    layers = int(max_depth / step) + 1 if step else 1
+
+    polygons = []
+    for layer in range(1, layers + 1):
+        top = peak if layer == 1 else peak * (1 + (-(layer - 1) * step))
+        below = y < top
+        edges = np.diff(below.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            polygons.append(np.concatenate([
+                np.column_stack([x[start:end], y[start:end]]),
+                np.column_stack([x[start:end], top[start:end]])[::-1],
+            ]))
+    return polygons
+
+
+def fill_drawdown(ax, series: pd.Series, peak: pd.Series, step: float = None, max_depth: float = 0.0,
+                  alpha: float = 0.25, label: str = None):
+    """以單一 PolyCollection 繪製所有層的回撤陰影 (重疊處顏色較深)"""
+    polygons = drawdown_layers(series, peak, step, max_depth)
+    if not polygons:
+        return None
+    collection = PolyCollection(polygons, color='red', alpha=alpha, label=label)
+    ax.add_collection(collection, autolim=True)
+    ax.autoscale_view()
+    return collection
+
+
+def figure_to_png(fig, dpi: int = 100) -> bytes:
+    """將 Figure 輸出為 PNG bytes"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
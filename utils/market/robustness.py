@@ -0,0 +1,240 @@
+"""
+區塊自助法 (block bootstrap) 穩健性評估 - 以重抽的歷史報酬區塊產生大量合成路徑,
+比較各策略與 rebalance 頻率的分數 (年化報酬 - 平均回撤) 分布
+
+每個交易日的「策略目標權重」與「次日報酬」只取決於當日的市場數據, 先在歷史數據上
+逐日計算一次; 合成路徑以連續區塊重抽這兩者 (保留區塊內的訊號與報酬關係及跨股票相關性),
+再依歷史日曆決定 rebalance 日, 向量化模擬所有路徑。路徑分塊計算, 記憶體與路徑總數無關。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .metrics import annual_return, average_drawdown
+from ..trader.engine import Trader
+
+
+def strategy_weights(frame: pd.DataFrame, strategy, codes: list) -> np.ndarray:
+    """
+    策略在每個交易日的目標權重 (與 Trader.execute_trades 相同: 略過 CASH 與沒有有效價格的股票)
+
+    Args:
+        frame: 投資組合數據
+        strategy: 交易策略 (會被推進狀態, 請傳入新的實例)
+        codes: 可交易股票列表
+
+    Returns:
+        (T, len(codes)) 權重矩陣, 其餘為現金
+    """
+    close = frame.reindex(columns=[f'{code}_Close' for code in codes]).to_numpy(dtype=float)
+    tradable = np.isfinite(close) & (close > 0)
+    position = {code: j for j, code in enumerate(codes)}
+    weights = np.zeros((len(frame), len(codes)))
+
+    strategy.prepare(frame, frame.index, codes)
+    for t, (date, row) in enumerate(frame.iterrows()):
+        strategy.observe(row, codes)
+        for code, weight in strategy.calculate_weights(row, codes).items():
+            j = position.get(code)
+            if j is not None and weight > 0 and tradable[t, j]:
+                weights[t, j] = weight
+    return weights
+
+
+def block_indices(rng: np.random.Generator, n_paths: int, length: int, block_size: int) -> np.ndarray:
+    """
+    移動區塊自助法的來源交易日 (每條路徑由隨機起點的連續區塊串接而成)
+
+    Returns:
+        (n_paths, length) 來源位置, 路徑第 0 日固定為第 0 日 (沒有前一日報酬)
+    """
+    block_size = max(1, min(block_size, length - 1))
+    n_blocks = -(-(length - 1) // block_size)
+    starts = rng.integers(1, length - block_size + 1, size=(n_paths, n_blocks))
+    offsets = np.arange(block_size)
+    days = (starts[:, :, None] + offsets).reshape(n_paths, -1)[:, :length - 1]
+    return np.concatenate([np.zeros((n_paths, 1), dtype=days.dtype), days], axis=1)
+
+
+def simulate_paths(growth: np.ndarray, weights: List[np.ndarray], schedules: List[Tuple[int, np.ndarray]],
+                   indices: np.ndarray) -> np.ndarray:
+    """
+    以分數持股模擬所有路徑的權益曲線 (初始資金為 1)
+
+    每日先以來源日報酬更新持股價值, rebalance 日再依來源日的目標權重重新配置, 與 Trader.step 的順序相同。
+
+    Args:
+        growth: (T, N) 來源日的 1 + 報酬 (缺值為 1)
+        weights: 各策略的 (T, N) 目標權重
+        schedules: 每個組合的 (策略位置, (T,) rebalance 日遮罩)
+        indices: (P, T) 每條路徑的來源交易日
+
+    Returns:
+        (組合數, T, P) 權益曲線
+    """
+    n_paths, length = indices.shape
+    n_assets = growth.shape[1]
+    holdings = np.zeros((len(schedules), n_paths, n_assets))
+    cash = np.ones((len(schedules), n_paths))
+    curves = np.empty((len(schedules), length, n_paths))
+
+    for k in range(length):
+        source = indices[:, k]
+        day_growth = growth[source]
+        holdings *= day_growth
+        for c, (s, mask) in enumerate(schedules):
+            total = holdings[c].sum(axis=1) + cash[c]
+            if mask[k]:
+                target = weights[s][source]
+                holdings[c] = total[:, None] * target
+                cash[c] = total * (1 - target.sum(axis=1))
+            curves[c, k] = total
+    return curves
+
+
+# 行程池共用的輸入 (由 initializer 設定, 每個工作行程只傳送一次)
+_SHARED: dict = {}
+
+
+def _init_worker(shared: dict):
+    _SHARED.update(shared)
+
+
+def _evaluate_chunk(chunk: int) -> np.ndarray:
+    """計算一個路徑區塊的分數 (組合數, 路徑數)"""
+    shared = _SHARED
+    start = chunk * shared['chunk_size']
+    n_paths = min(shared['chunk_size'], shared['n_paths'] - start)
+    rng = np.random.default_rng([shared['seed'], chunk])
+    indices = block_indices(rng, n_paths, len(shared['dates']), shared['block_size'])
+    return _scores(shared, indices)
+
+
+def _scores(shared: dict, indices: np.ndarray) -> np.ndarray:
+    curves = simulate_paths(shared['growth'], shared['weights'], shared['schedules'], indices)
+    scores = np.empty(curves.shape[::2])
+    for c, values in enumerate(curves):
+        avg_dd, _ = average_drawdown(values, shared['threshold'])
+        scores[c] = annual_return(values, shared['dates'], 1.0) - avg_dd
+    return scores
+
+
+class BlockBootstrap:
+    """
+    區塊自助法穩健性評估 - 所有策略與頻率組合使用相同的合成路徑 (結果可直接比較),
+    路徑分塊 (chunk_size) 以行程池平行計算; 相同 seed 的結果與 workers 無關
+    """
+
+    def __init__(self, n_paths: int = 1000, block_size: int = 21, chunk_size: int = 128,
+                 workers: int = None, seed: int = 0, threshold: float = 0.15, confidence: float = 0.9):
+        """
+        Args:
+            n_paths: 合成路徑數量
+            block_size: 重抽區塊長度 (交易日), 保留區塊內的序列相關
+            chunk_size: 每次計算的路徑數 (記憶體約為 組合數 × chunk_size × (股票數 + 交易日數) × 8 bytes)
+            workers: 行程數量 (預設為 CPU 核心數)
+            seed: 隨機種子
+            threshold: 平均回撤的門檻 (與交易建議相同)
+            confidence: 信賴區間的信賴水準
+        """
+        self.n_paths = n_paths
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.seed = seed
+        self.threshold = threshold
+        self.confidence = confidence
+
+    def evaluate(self, frame: pd.DataFrame, strategies: Dict[str, object], frequencies: list,
+                 codes: list, events=None) -> pd.DataFrame:
+        """
+        評估所有 (策略, 頻率) 組合
+
+        Args:
+            frame: 投資組合數據 (已裁切 warmup)
+            strategies: {名稱: 策略實例} (以相同參數建立新的實例計算權重)
+            frequencies: rebalance 頻率列表
+            codes: 可交易股票列表
+            events: 事件分派 (可選, 以 'bootstrap' 階段回報進度)
+
+        Returns:
+            DataFrame (每個組合一列): fractional, mean, median, low, high, std, p_best
+            (fractional 為原始歷史路徑以相同的分數持股模擬 (初始資金 1.0, 不取整股) 的分數,
+            與實際回測的分數不同; p_best 為同一策略中該頻率分數最高的路徑比例)
+        """
+        codes = list(codes)
+        dates = frame.index
+        close = frame.reindex(columns=[f'{code}_Close' for code in codes]).to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            growth = close[1:] / close[:-1]
+        growth = np.vstack([np.ones((1, len(codes))), np.where(np.isfinite(growth), growth, 1.0)])
+
+        names = list(strategies)
+        weights = []
+        for name in names:
+            strategy = strategies[name]
+            weights.append(strategy_weights(frame, type(strategy)(**strategy.params()), codes))
+        # 只模擬曾被任何策略持有的股票
+        held = np.flatnonzero(np.any([w.any(axis=0) for w in weights], axis=0))
+        growth = np.ascontiguousarray(growth[:, held])
+        weights = [np.ascontiguousarray(w[:, held]) for w in weights]
+
+        combos, schedules = [], []
+        for s, name in enumerate(names):
+            for frequency in frequencies:
+                trader = Trader(balance=1.0, strategy=strategies[name], rebalance_frequency=frequency)
+                combos.append((name, frequency))
+                schedules.append((s, dates.isin(trader.rebalance_dates(dates))))
+
+        shared = {
+            'growth': growth, 'weights': weights, 'schedules': schedules, 'dates': dates,
+            'n_paths': self.n_paths, 'chunk_size': self.chunk_size, 'block_size': self.block_size,
+            'seed': self.seed, 'threshold': self.threshold,
+        }
+        fractional = _scores(shared, np.arange(len(dates))[None, :])[:, 0]
+
+        n_chunks = -(-self.n_paths // self.chunk_size)
+        workers = min(self.workers or os.cpu_count() or 1, n_chunks)
+        results = []
+        stage = events.stage('bootstrap', total=self.n_paths, desc="Bootstrap paths") if events else nullcontext()
+        with stage as advance:
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,))
+                with executor:
+                    for scores in executor.map(_evaluate_chunk, range(n_chunks)):
+                        results.append(scores)
+                        if advance is not None:
+                            advance(scores.shape[1])
+            else:
+                _init_worker(shared)
+                for chunk in range(n_chunks):
+                    results.append(_evaluate_chunk(chunk))
+                    if advance is not None:
+                        advance(results[-1].shape[1])
+        scores = np.concatenate(results, axis=1)
+
+        return self._summarize(combos, fractional, scores)
+
+    def _summarize(self, combos: list, fractional: np.ndarray, scores: np.ndarray) -> pd.DataFrame:
+        tail = (1 - self.confidence) / 2
+        best = np.zeros(len(combos))
+        names = np.array([name for name, _ in combos])
+        for name in dict.fromkeys(names):
+            rows = np.flatnonzero(names == name)
+            winners = rows[scores[rows].argmax(axis=0)]
+            best[rows] = np.bincount(winners, minlength=len(combos))[rows] / scores.shape[1]
+
+        return pd.DataFrame({
+            'fractional': fractional,
+            'mean': scores.mean(axis=1),
+            'median': np.median(scores, axis=1),
+            'low': np.quantile(scores, tail, axis=1),
+            'high': np.quantile(scores, 1 - tail, axis=1),
+            'std': scores.std(axis=1, ddof=1) if scores.shape[1] > 1 else np.zeros(len(combos)),
+            'p_best': best,
+        }, index=pd.MultiIndex.from_tuples(combos, names=['strategy', 'frequency']))
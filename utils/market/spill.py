@@ -0,0 +1,89 @@
+"""
+記憶體上限建立的落地儲存 - 中間欄位分塊寫入 .npy, 最後以唯讀 memmap 組合成 DataFrame
+
+每塊以欄為主序 (Fortran order) 儲存, 每個欄位在檔案中連續; 組合後的 DataFrame 直接引用 memmap,
+只有實際讀取的欄位才由作業系統載入記憶體 (且可隨時釋放)。
+不再被任何 DataFrame 引用的區塊檔案會自動刪除。
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def _remove(path: str):
+    """刪除區塊檔案, 目錄已空時一併刪除"""
+    try:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+class SpillStore:
+    """分塊寫入的欄位儲存 (每次建立使用獨立的子目錄)"""
+
+    def __init__(self, directory: str = None):
+        """
+        Args:
+            directory: 上層目錄 (預設為系統暫存目錄)
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='spill-', dir=directory)
+        self.nbytes = 0
+        self._chunks: List[tuple] = []  # [(路徑或記憶體陣列, 欄位)]
+
+    def write(self, values: np.ndarray, columns: list):
+        """
+        寫入一塊欄位
+
+        Args:
+            values: (rows, len(columns)) 數值
+            columns: 欄位名稱
+        """
+        if values.size == 0:
+            # 空的陣列無法 memmap, 直接保留
+            self._chunks.append((values, list(columns)))
+            return
+        path = os.path.join(self.directory, f'chunk-{len(self._chunks):05d}.npy')
+        array = np.lib.format.open_memmap(path, mode='w+', dtype=values.dtype, shape=values.shape,
+                                          fortran_order=True)
+        array[:] = values
+        array.flush()
+        del array
+        self.nbytes += values.nbytes
+        self._chunks.append((path, list(columns)))
+
+    def discard(self):
+        """刪除所有區塊與目錄 (建立失敗時使用, 之後不可再呼叫 frame)"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._chunks = []
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def frame(self, index: pd.Index) -> pd.DataFrame:
+        """
+        組合所有區塊 (不複製數值)
+
+        Args:
+            index: 列索引 (長度與寫入的列數相同)
+        """
+        parts = []
+        for source, columns in self._chunks:
+            if isinstance(source, str):
+                values = np.load(source, mmap_mode='r')
+                weakref.finalize(values, _remove, source)
+            else:
+                values = source
+            parts.append(pd.DataFrame(values, index=index, columns=columns, copy=False))
+        if not any(isinstance(source, str) for source, _ in self._chunks) and os.path.isdir(self.directory):
+            os.rmdir(self.directory)
+        return pd.concat(parts, axis=1) if parts else pd.DataFrame(index=index)
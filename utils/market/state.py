@@ -0,0 +1,199 @@
+import hashlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+
+@dataclass
+class TickerState:
+    """個股指標的增量狀態 - 以累計量推進 Sharpe、波動率、Beta 與權重"""
+    last_date: pd.Timestamp
+    last_close: float
+    sharpe_window: int
+    risk_free_rate: float
+    excess_returns: deque          # 最近 sharpe_window 筆超額報酬
+    n_returns: int = 0             # 對數報酬 Welford 累計量
+    mean_return: float = 0.0
+    m2_return: float = 0.0
+    vol_count: int = 0             # 非零波動率的累計數量、總和與最大值
+    vol_sum: float = 0.0
+    vol_max: float = np.nan
+    base: float = np.nan           # 最後一筆 (ffill 後) 的權重與 Beta
+    beta: float = np.nan
+
+    @classmethod
+    def from_history(cls, close: pd.Series, sharpe_window: int, risk_free_rate: float = 0.04) -> 'TickerState':
+        """由個股收盤價歷史 (已排除第一個交易日) 建立狀態"""
+        prices = close.to_numpy(dtype=float)
+        log_ret = np.diff(np.log(prices))
+        valid = log_ret[np.isfinite(log_ret)]
+
+        state = cls(
+            last_date=close.index[-1],
+            last_close=prices[-1],
+            sharpe_window=sharpe_window,
+            risk_free_rate=risk_free_rate,
+            excess_returns=deque(maxlen=sharpe_window),
+        )
+        if len(valid):
+            state.n_returns = len(valid)
+            state.mean_return = valid.mean()
+            state.m2_return = ((valid - valid.mean()) ** 2).sum()
+
+        # 重現 expanding 波動率序列以取得累計平均與最大值
+        finite = np.isfinite(log_ret)
+        count = np.cumsum(finite)
+        mean = np.cumsum(np.where(finite, log_ret, 0.0)) / np.maximum(count, 1)
+        mean_sq = np.cumsum(np.where(finite, log_ret ** 2, 0.0)) / np.maximum(count, 1)
+        vol = np.sqrt(np.maximum(mean_sq - mean ** 2, 0.0)) * np.sqrt(252)
+        vol = vol[(count > 0) & (vol > 0)]
+        if len(vol):
+            state.vol_count = len(vol)
+            state.vol_sum = vol.sum()
+            state.vol_max = vol.max()
+            state.base = 1.0 / (state.vol_sum / state.vol_count)
+            last_vol = np.sqrt(state.m2_return / state.n_returns) * np.sqrt(252)
+            state.beta = last_vol / state.vol_max
+
+        returns = prices[1:] / prices[:-1] - 1
+        daily_rf_rate = risk_free_rate / sharpe_window
+        state.excess_returns.extend(np.concatenate([[np.nan], returns])[-sharpe_window:] - daily_rf_rate)
+        return state
+
+    def advance(self, date: pd.Timestamp, close: float) -> Dict[str, float]:
+        """推進一個交易日, 回傳當日 Close / Sharpe / Base / Volatility / Beta"""
+        log_ret = np.log(close) - np.log(self.last_close)
+        if np.isfinite(log_ret):
+            self.n_returns += 1
+            delta = log_ret - self.mean_return
+            self.mean_return += delta / self.n_returns
+            self.m2_return += delta * (log_ret - self.mean_return)
+
+        vol = np.sqrt(self.m2_return / self.n_returns) * np.sqrt(252) if self.n_returns else np.nan
+        if np.isfinite(vol) and vol != 0:
+            self.vol_count += 1
+            self.vol_sum += vol
+            self.vol_max = vol if np.isnan(self.vol_max) else max(self.vol_max, vol)
+            self.base = 1.0 / (self.vol_sum / self.vol_count)
+        if np.isfinite(vol) and self.vol_max > 0:
+            self.beta = vol / self.vol_max
+
+        self.excess_returns.append(close / self.last_close - 1 - self.risk_free_rate / self.sharpe_window)
+        window = np.fromiter(self.excess_returns, dtype=float)
+        sharpe = np.nan
+        if len(window) == self.sharpe_window and np.isfinite(window).all():
+            sharpe = window.mean() / window.std(ddof=1) * np.sqrt(self.sharpe_window)
+
+        self.last_date = date
+        self.last_close = close
+        return {'Close': close, 'Sharpe': sharpe, 'Base': self.base, 'Volatility': vol, 'Beta': self.beta}
+
+
+@dataclass
+class IndustryState:
+    """產業指標的增量狀態 - 保留斜率、均線所需的視窗與最後交叉狀態"""
+    sharpe_history: deque          # 最近 slope_window 筆整合 Sharpe
+    slope_history: deque           # 最近 ma_period * 4 筆斜率
+    ma_period: int
+    crossover: Optional[int] = None
+    last_short: float = np.nan
+    last_long: float = np.nan
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, industry: str, slope_window: int, ma_period: int) -> 'IndustryState':
+        """由完整數據最後幾列建立狀態"""
+        state = cls(
+            sharpe_history=deque(df[f'{industry}_Integrated_Sharpe'].to_numpy()[-slope_window:], maxlen=slope_window),
+            slope_history=deque(df[f'{industry}_Sharpe_Slope'].to_numpy()[-ma_period * 4:], maxlen=ma_period * 4),
+            ma_period=ma_period,
+            last_short=df[f'{industry}_MA_Short'].iat[-1],
+            last_long=df[f'{industry}_MA_Long'].iat[-1],
+        )
+        if f'{industry}_Crossover_State' in df.columns:
+            state.crossover = int(df[f'{industry}_Crossover_State'].iat[-1])
+        return state
+
+    def advance(self, integrated_sharpe: float) -> Dict[str, float]:
+        """推進一個交易日, 回傳當日產業指標"""
+        window = self.sharpe_history.maxlen
+        y = np.fromiter(self.sharpe_history, dtype=float)
+        slope = np.nan
+        if len(y) == window and np.isfinite(y).all():
+            x = np.arange(window) - (window - 1) / 2
+            slope = np.dot(x, y - y.mean()) / np.dot(x, x)
+        self.sharpe_history.append(integrated_sharpe)
+
+        self.slope_history.append(slope)
+        slopes = np.fromiter(self.slope_history, dtype=float)
+        ma_short = slopes[-self.ma_period:].mean() if len(slopes) >= self.ma_period else np.nan
+        ma_long = slopes.mean() if len(slopes) == self.slope_history.maxlen else np.nan
+
+        values = {
+            'Integrated_Sharpe': integrated_sharpe,
+            'Sharpe_Slope': slope,
+            'MA_Short': ma_short,
+            'MA_Long': ma_long,
+        }
+
+        if self.crossover is not None:
+            # 與 generate_crossover_state 相同的判斷規則
+            s0, l0, s, l = self.last_short, self.last_long, ma_short, ma_long
+            if self.crossover and s0 > l0 and s <= l:
+                self.crossover = 0
+            elif not self.crossover and s0 < l0 and s >= l:
+                self.crossover = 1
+            else:
+                self.crossover = int(s > l)
+            values['Crossover_State'] = self.crossover
+
+        self.last_short, self.last_long = ma_short, ma_long
+        return values
+
+
+@dataclass
+class DeclineModel:
+    """下跌預測模型 - 保存已訓練的 LogisticRegression 與訓練資料指紋"""
+    # 收斂容許誤差需夠小, warm start 與重新訓練才會得到相同結果
+    TOL = 1e-8
+
+    model: Optional[LogisticRegression] = None
+    fingerprint: Optional[str] = None
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> bool:
+        """
+        訓練模型; 訓練資料未變時略過, 已有模型時以既有係數 warm start
+
+        Returns:
+            是否重新訓練
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(X).tobytes())
+        digest.update(np.ascontiguousarray(y).tobytes())
+        fingerprint = digest.hexdigest()
+        if self.model is not None and fingerprint == self.fingerprint:
+            return False
+
+        if self.model is None:
+            self.model = LogisticRegression(tol=self.TOL)
+        else:
+            self.model.set_params(warm_start=True)
+        self.model.fit(X, y)
+        self.fingerprint = fingerprint
+        return True
+
+
+@dataclass
+class PortfolioState:
+    """投資組合數據的建立狀態 - 供增量更新與存檔使用"""
+    frame: pd.DataFrame            # 尚未裁切 warmup 的完整數據
+    watchlist: dict                # 建立時的 watchlist.todict()
+    params: dict                   # sharpe_window / slope_window / ma_period
+    stages: List[str]
+    columns: List[str]
+    fields: Optional[List[str]] = None  # 建立時的需求欄位 (None 表示全部)
+    tickers: Dict[str, TickerState] = field(default_factory=dict)
+    industries: Dict[str, IndustryState] = field(default_factory=dict)
+    decline: Optional[DeclineModel] = None
@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import pandas as pd
+
+
+class RawStore:
+    """
+    原始數據層 - 每檔股票 (ticker, period, interval, 欄位) 只下載一次
+
+    不同指標參數的建立共用同一份原始數據; 資料日期 (key) 改變時清空。
+    超過 max_bytes (含日期索引) 時淘汰最久未使用的數據 (LRU), 之後需要時重新下載。
+    """
+
+    def __init__(self, max_bytes: int = 128 * 2 ** 20):
+        """
+        Args:
+            max_bytes: 保存的原始數據總大小上限 (bytes)
+        """
+        self.key = None
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def _size(history) -> int:
+        return int(history.memory_usage(index=True).sum()) if isinstance(history, pd.DataFrame) \
+            else int(history.memory_usage(index=True))
+
+    def reset(self, key: Hashable) -> bool:
+        """資料日期改變時清空, 回傳是否清空"""
+        with self._lock:
+            if key == self.key:
+                return False
+            self._data.clear()
+            self.nbytes = 0
+            self.key = key
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def get(self, key: tuple, fetch: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        取得原始數據, 尚未下載 (或已淘汰) 時呼叫 fetch() 並保存
+
+        Args:
+            key: (ticker, period, interval, 欄位)
+            fetch: 實際下載的函式
+        """
+        with self._lock:
+            history = self._data.get(key)
+            if history is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return history
+            self.misses += 1
+        history = fetch()
+        size = self._size(history)
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._size(self._data.pop(key))
+            if size <= self.max_bytes:
+                self._data[key] = history
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, evicted = self._data.popitem(last=False)
+                    self.nbytes -= self._size(evicted)
+                    self.evictions += 1
+        return history
+
+    def stats(self) -> dict:
+        """快取統計"""
+        with self._lock:
+            return {
+                'histories': len(self._data),
+                'mb': self.nbytes / 2 ** 20,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FeatureStore:
+    """
+    指標快取 - 以 (ticker, indicator, params) 為鍵保存個股指標序列
+
+    超過 max_bytes (只計算數值, 同一交易日曆的序列共用日期索引) 時淘汰最久未使用的指標 (LRU)。
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2 ** 20):
+        """
+        Args:
+            max_bytes: 快取指標的總大小上限 (bytes)
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def make_key(ticker: str, indicator: str, params: Optional[dict] = None) -> tuple:
+        return ticker, indicator, tuple(sorted((params or {}).items()))
+
+    def get(self, key: tuple) -> Optional[pd.Series]:
+        with self._lock:
+            series = self._data.get(key)
+            if series is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return series
+
+    def put(self, key: tuple, series: pd.Series):
+        size = series.nbytes
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key).nbytes
+            if size > self.max_bytes:
+                return
+            self._data[key] = series
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """快取統計"""
+        with self._lock:
+            return {
+                'features': len(self._data),
+                'mb': self.nbytes / 2 ** 20,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
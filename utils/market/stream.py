@@ -0,0 +1,125 @@
+import queue
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+
+# 佇列結束標記
+_DONE = object()
+
+
+def stream_map(items: list, fetch: Callable[[Any], Any], process: Callable[[Any, Any], Any],
+               io_workers: int = 4, compute_workers: int = 1, queue_size: int = 16,
+               progress=None, batch_size: int = None) -> List[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    以 producer-consumer 管線處理每個項目: I/O 與計算重疊執行
+
+    io_workers 個執行緒以 fetch 取得原始資料放入有界佇列, compute_workers 個執行緒
+    取出後以 process 計算。佇列滿時 fetch 會等待 (backpressure), 同時存在的原始資料
+    最多約 queue_size + io_workers 筆 (分批時每個計算執行緒另外保留最多 batch_size 筆)。
+
+    Args:
+        items: 要處理的項目 (如股票代碼)
+        fetch: fetch(item) -> raw, I/O 工作 (如下載歷史數據)
+        process: process(item, raw) -> result, 計算工作;
+                 指定 batch_size 時為 process([item], [raw]) -> [result], 一次計算一批
+        io_workers: I/O 執行緒數量
+        compute_workers: 計算執行緒數量
+        queue_size: 佇列容量
+        batch_size: 每批計算的項目數 (可選); 計算執行緒累積到 batch_size 筆 (或下載結束) 時
+                    計算一批, 同時下載繼續進行。批次計算失敗時該批所有項目回報相同的錯誤
+        progress: 可選的回報函式 progress(item, error), 每完成一個項目呼叫一次 (依序呼叫, 不會同時執行);
+                  progress 拋出例外時不再呼叫, 管線照常處理完所有項目後再拋出第一個例外
+
+    Returns:
+        依 items 順序排列的 (item, result, error) 列表, 失敗時 result 為 None
+    """
+    results = [None] * len(items)
+    pending = queue.Queue(maxsize=queue_size)
+    next_index = iter(range(len(items)))
+    index_lock = threading.Lock()
+    progress_lock = threading.Lock()
+    progress_errors = []
+
+    def producer():
+        while True:
+            with index_lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            try:
+                pending.put((i, fetch(items[i]), None))
+            except Exception as e:
+                pending.put((i, None, e))
+
+    def report(i, error):
+        if progress is None:
+            return
+        with progress_lock:
+            if progress_errors:
+                return
+            try:
+                progress(items[i], error)
+            except Exception as e:
+                # 回報失敗不可中斷計算執行緒 (否則佇列無人取出, producer 永遠等待)
+                progress_errors.append(e)
+
+    def consumer():
+        while True:
+            task = pending.get()
+            if task is _DONE:
+                return
+            i, raw, error = task
+            result = None
+            if error is None:
+                try:
+                    result = process(items[i], raw)
+                except Exception as e:
+                    error = e
+            results[i] = (items[i], result, error)
+            del raw, task
+            report(i, error)
+
+    def flush(batch):
+        indices = [i for i, _ in batch]
+        try:
+            outputs = process([items[i] for i in indices], [raw for _, raw in batch])
+            errors = [None] * len(indices)
+        except Exception as e:
+            outputs, errors = [None] * len(indices), [e] * len(indices)
+        batch.clear()
+        for i, result, error in zip(indices, outputs, errors):
+            results[i] = (items[i], result, error)
+            report(i, error)
+
+    def batch_consumer():
+        batch = []
+        while True:
+            task = pending.get()
+            if task is _DONE:
+                if batch:
+                    flush(batch)
+                return
+            i, raw, error = task
+            if error is not None:
+                results[i] = (items[i], None, error)
+                report(i, error)
+            else:
+                batch.append((i, raw))
+                if len(batch) >= batch_size:
+                    flush(batch)
+            del raw, task
+
+    producers = [threading.Thread(target=producer, daemon=True) for _ in range(max(1, io_workers))]
+    target = batch_consumer if batch_size else consumer
+    consumers = [threading.Thread(target=target, daemon=True) for _ in range(max(1, compute_workers))]
+    for thread in producers + consumers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    for _ in consumers:
+        pending.put(_DONE)
+    for thread in consumers:
+        thread.join()
+    if progress_errors:
+        raise progress_errors[0]
+    return results
@@ -0,0 +1,118 @@
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from .data import MarketDataProvider, TradingViewWatchlist
+
+
+class SyntheticWatchlist(TradingViewWatchlist):
+    """合成投資組合清單 - 與 TradingViewWatchlist 相同介面, 不需連線 TradingView"""
+
+    def __init__(self, n_industries: int = 5, tickers_per_industry: int = 10, industries: dict = None):
+        """
+        Args:
+            n_industries: 自動產生的產業數量
+            tickers_per_industry: 每個產業的股票數量
+            industries: 自訂清單 {industry: {provider: [codes]}} (可選, 優先於自動產生)
+        """
+        self.watchlist_id = None
+        self.session_id = None
+        if industries is None:
+            industries = {
+                f"Industry{i + 1:03d}": {
+                    "NASDAQ": [f"S{i + 1:03d}T{j + 1:03d}" for j in range(tickers_per_industry)]
+                }
+                for i in range(n_industries)
+            }
+        self._set_result(industries)
+
+    def _fetch_watchlist(self):
+        """合成清單不需重新取得"""
+        pass
+
+
+class SyntheticMarketDataProvider(MarketDataProvider):
+    """合成市場數據提供者 - 以 GBM 產生可重現的價格歷史, 供離線測試與效能評估使用"""
+
+    def __init__(self, watchlist: TradingViewWatchlist = None,
+                 n_industries: int = 5, tickers_per_industry: int = 10,
+                 years: int = 15, end: str = "2024-12-31", seed: int = 0):
+        """
+        Args:
+            watchlist: 自訂 watchlist (可選, 預設以 n_industries / tickers_per_industry 產生)
+            n_industries: 產業數量
+            tickers_per_industry: 每個產業的股票數量
+            years: 歷史長度 (年)
+            end: 歷史資料最後一天
+            seed: 隨機種子, 相同種子與代碼必定產生相同價格
+        """
+        if watchlist is None:
+            watchlist = SyntheticWatchlist(n_industries, tickers_per_industry)
+        super().__init__(watchlist=watchlist)
+
+        self.seed = seed
+        self.end = pd.Timestamp(end)
+        self.start = self.end - pd.DateOffset(years=years)
+
+    def advance(self, days: int = 1):
+        """將資料最後一天往後推進 days 個交易日 (模擬每日新資料)"""
+        self.end = self.end + pd.offsets.BDay(days)
+
+    def checkpoint_key(self) -> str:
+        """合成數據依種子與日期範圍決定內容"""
+        return f"synthetic:{self.seed}:{self.start.date()}:{self.end.date()}"
+
+    def _period_start(self, period: str) -> pd.Timestamp:
+        """解析 yfinance 風格的 period, 年度以上的長度一律從 start 開始"""
+        match = re.fullmatch(r"(\d+)(d|wk|mo)", period)
+        if match is None:
+            return self.start
+        n, unit = int(match.group(1)), match.group(2)
+        if unit == "d":
+            return self.end - pd.offsets.BDay(n - 1)
+        if unit == "wk":
+            return self.end - pd.DateOffset(weeks=n)
+        return self.end - pd.DateOffset(months=n)
+
+    def _generate_history(self, ticker: str) -> pd.DataFrame:
+        """以 GBM (含共同市場因子) 產生單一股票的 OHLCV 歷史"""
+        days = np.arange(np.datetime64(self.start.date()), np.datetime64(self.end.date()) + np.timedelta64(1, 'D'))
+        dates = pd.DatetimeIndex(days[np.is_busday(days)], dtype='datetime64[ns]')
+        n = len(dates)
+
+        # 參數與雜訊皆依序抽取, 延長 end 不會改變既有日期的價格
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        mu = rng.uniform(-0.05, 0.25)
+        sigma = rng.uniform(0.15, 0.6)
+        beta = rng.uniform(0.3, 0.9)
+        price0 = rng.uniform(10, 500)
+        noise = rng.standard_normal((n, 3))
+        market = np.random.default_rng([self.seed, 0]).standard_normal(n)
+
+        dt = 1 / 252
+        z = beta * market + np.sqrt(1 - beta ** 2) * noise[:, 0]
+        log_ret = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * z
+        log_ret[0] = 0.0
+        close = price0 * np.exp(np.cumsum(log_ret))
+
+        prev_close = np.concatenate([[price0], close[:-1]])
+        open_ = prev_close * np.exp(0.2 * sigma * np.sqrt(dt) * noise[:, 1])
+        spread = np.abs(noise[:, 2]) * sigma * np.sqrt(dt)
+        high = np.maximum(open_, close) * (1 + spread)
+        low = np.minimum(open_, close) * (1 - spread)
+        volume = (1e6 * np.exp(np.abs(z))).astype(np.int64)
+
+        df = pd.DataFrame({
+            'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume
+        }, index=dates)
+
+        # 台股使用不同的交易日曆
+        if ticker.endswith('.TW'):
+            holidays = np.random.default_rng([self.seed, 1]).random(n) < 0.03
+            df = df[~holidays]
+        return df
+
+    def get_history_with_unified_datetime(self, ticker: str, period: str = "15y", interval: str = "1d") -> pd.DataFrame:
+        """產生股票歷史數據 (取代 yfinance 下載)"""
+        df = self._generate_history(ticker)
+        return df[df.index >= self._period_start(period)]
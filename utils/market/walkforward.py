@@ -0,0 +1,235 @@
+"""
+Walk-forward 最佳化 - 在滑動的樣本內視窗選出最佳的 (策略參數, rebalance 頻率),
+套用到緊接的樣本外視窗, 並將各樣本外區段串接成一條權益曲線
+
+每個候選策略的每日目標權重只計算一次 (robustness.strategy_weights), 所有視窗共用;
+樣本內評估以陣列模擬 (分數持股) 在權重與報酬矩陣的區段上進行, 不重新執行回測。
+樣本外區段以 Trader 逐日推進 (整股, 與一般回測相同), 資金延續上一個區段。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .metrics import annual_return, average_drawdown, sharpe_ratio, summarize_curves
+from .robustness import simulate_paths, strategy_weights
+from ..trader.engine import Trader
+
+
+METRICS = ('score', 'annual_return', 'sharpe')
+
+
+def walk_forward_windows(length: int, in_sample: int, out_of_sample: int,
+                         step: int = None) -> List[Tuple[int, int, int]]:
+    """
+    切分視窗
+
+    Args:
+        length: 交易日數
+        in_sample: 樣本內交易日數
+        out_of_sample: 樣本外交易日數
+        step: 視窗每次前進的交易日數 (預設為 out_of_sample)
+
+    每個樣本外區段只到下一個視窗的樣本外起點為止 (最後一個為 out_of_sample 天),
+    step 與 out_of_sample 不同時串接的區段仍首尾相接, 不重疊也不留空。
+
+    Returns:
+        [(樣本內起點, 樣本外起點, 樣本外終點)], 位置為左閉右開
+    """
+    step = step or out_of_sample
+    splits = list(range(in_sample, length, step))
+    stops = splits[1:] + [min(splits[-1] + out_of_sample, length)] if splits else []
+    return [(split - in_sample, split, stop) for split, stop in zip(splits, stops)]
+
+
+def score_curves(values: np.ndarray, dates: pd.Index, metric: str = 'score', threshold: float = 0.15) -> np.ndarray:
+    """
+    權益曲線的評分 (越高越好)
+
+    Args:
+        values: (T, K) 權益曲線
+        dates: 日期索引
+        metric: 'score' (年化報酬 - 平均回撤, 與交易建議相同), 'annual_return' 或 'sharpe'
+    """
+    if metric == 'sharpe':
+        return sharpe_ratio(values)
+    result = annual_return(values, dates)
+    if metric == 'score':
+        result = result - average_drawdown(values, threshold)[0]
+    return result
+
+
+# 行程池共用的輸入 (由 initializer 設定, 每個工作行程只傳送一次)
+_SHARED: dict = {}
+
+
+def _init_worker(shared: dict):
+    _SHARED.update(shared)
+
+
+def _evaluate_window(window: Tuple[int, int, int]) -> np.ndarray:
+    """計算一個樣本內視窗中所有候選的評分"""
+    shared = _SHARED
+    start, stop, _ = window
+    dates = shared['dates'][start:stop]
+    masks = {}
+    for frequency in shared['frequencies']:
+        trader = Trader(balance=1.0, strategy=None, rebalance_frequency=frequency)
+        masks[frequency] = dates.isin(trader.rebalance_dates(dates))
+    schedules = [(s, masks[frequency]) for s, frequency in shared['candidates']]
+    curves = simulate_paths(shared['growth'], shared['weights'], schedules, np.arange(start, stop)[None, :])
+    return score_curves(curves[:, :, 0].T, dates, shared['metric'], shared['threshold'])
+
+
+@dataclass
+class WalkForwardResult:
+    """Walk-forward 結果"""
+    windows: pd.DataFrame    # 每個視窗一列: 期間、選出的候選、樣本內評分、樣本外報酬
+    scores: pd.DataFrame     # 樣本內評分 (視窗 × 候選)
+    curve: pd.Series         # 串接的樣本外權益曲線
+    history: list            # 樣本外的每日快照 (PortfolioSnapshot)
+
+    def stats(self, threshold: float = 0.15) -> pd.Series:
+        """樣本外權益曲線的績效 (summarize_curves)"""
+        return summarize_curves(self.curve.to_frame('walk_forward'), threshold=threshold).iloc[0]
+
+
+class WalkForward:
+    """
+    Walk-forward 執行器
+
+    候選為 (策略, 頻率) 的組合; 相同類別與參數的策略只計算一次每日權重,
+    樣本內視窗以行程池平行評估, 樣本外區段依序執行並串接。
+    """
+
+    def __init__(self, in_sample: int = 756, out_of_sample: int = 126, step: int = None,
+                 metric: str = 'score', threshold: float = 0.15, workers: int = None):
+        """
+        Args:
+            in_sample: 樣本內交易日數 (預設約 3 年)
+            out_of_sample: 樣本外交易日數 (預設約半年)
+            step: 視窗每次前進的交易日數 (預設為 out_of_sample)
+            metric: 樣本內評分方式 ('score', 'annual_return', 'sharpe')
+            threshold: score 的平均回撤門檻
+            workers: 行程數量 (預設為 CPU 核心數)
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric} (expected one of {list(METRICS)})")
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.step = step
+        self.metric = metric
+        self.threshold = threshold
+        self.workers = workers
+
+    @staticmethod
+    def label(strategy, frequency: str) -> str:
+        params = ', '.join(f'{k}={v}' for k, v in strategy.params().items())
+        return f"{strategy.__class__.__name__}({params})_{frequency}"
+
+    def run(self, frame: pd.DataFrame, strategies: list, frequencies: list, codes: list,
+            balance: float = 10000, events=None) -> WalkForwardResult:
+        """
+        執行 walk-forward
+
+        Args:
+            frame: 投資組合數據 (已裁切 warmup)
+            strategies: 候選策略實例 (如不同 topk 的 MaxSharpeStrategy)
+            frequencies: 候選 rebalance 頻率
+            codes: 可交易股票列表
+            balance: 初始資金
+            events: 事件分派 (可選, 以 'walk_forward' 階段回報進度)
+        """
+        codes = list(codes)
+        dates = frame.index
+        windows = walk_forward_windows(len(dates), self.in_sample, self.out_of_sample, self.step)
+        if not windows:
+            raise ValueError(f"{len(dates)} trading days are not enough for a {self.in_sample}-day in-sample window")
+
+        # 每個不同的策略只計算一次每日權重, 所有視窗與頻率共用
+        close = frame.reindex(columns=[f'{code}_Close' for code in codes]).to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            growth = close[1:] / close[:-1]
+        growth = np.vstack([np.ones((1, len(codes))), np.where(np.isfinite(growth), growth, 1.0)])
+        unique, weights, candidates, labels = {}, [], [], []
+        for strategy in strategies:
+            key = (type(strategy), repr(sorted(strategy.params().items())))
+            if key not in unique:
+                unique[key] = len(weights)
+                weights.append(strategy_weights(frame, type(strategy)(**strategy.params()), codes))
+            for frequency in frequencies:
+                candidates.append((unique[key], frequency))
+                labels.append((strategy, frequency))
+        held = np.flatnonzero(np.any([w.any(axis=0) for w in weights], axis=0))
+        shared = {
+            'growth': np.ascontiguousarray(growth[:, held]),
+            'weights': [np.ascontiguousarray(w[:, held]) for w in weights],
+            'candidates': candidates, 'frequencies': list(frequencies), 'dates': dates,
+            'metric': self.metric, 'threshold': self.threshold,
+        }
+
+        # 樣本內評估 (各視窗獨立, 平行計算)
+        workers = min(self.workers or os.cpu_count() or 1, len(windows))
+        stage = events.stage('walk_forward', total=len(windows), desc="Walk-forward windows") if events else nullcontext()
+        scores = []
+        with stage as advance:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(shared,)) as executor:
+                    for window_scores in executor.map(_evaluate_window, windows):
+                        scores.append(window_scores)
+                        if advance is not None:
+                            advance()
+            else:
+                _init_worker(shared)
+                for window in windows:
+                    scores.append(_evaluate_window(window))
+                    if advance is not None:
+                        advance()
+        scores = np.array(scores)
+
+        # 樣本外區段依序執行, 資金延續
+        value, history, rows = balance, [], []
+        for (start, split, stop), window_scores in zip(windows, scores):
+            best = int(np.argmax(np.where(np.isfinite(window_scores), window_scores, -np.inf)))
+            strategy, frequency = labels[best]
+            trader = self._run_segment(frame, strategy, frequency, codes, split, stop, value)
+            history.extend(trader.portfolio_history)
+            rows.append({
+                'in_sample_start': dates[start],
+                'out_of_sample_start': dates[split],
+                'out_of_sample_end': dates[stop - 1],
+                'candidate': self.label(strategy, frequency),
+                'in_sample_score': window_scores[best],
+                'out_of_sample_return': trader.portfolio_history[-1].total_value / value - 1,
+            })
+            value = trader.portfolio_history[-1].total_value
+
+        columns = [self.label(strategy, frequency) for strategy, frequency in labels]
+        curve = pd.Series([snap.total_value for snap in history],
+                          index=pd.DatetimeIndex([snap.timestamp for snap in history]), name='walk_forward')
+        return WalkForwardResult(
+            windows=pd.DataFrame(rows),
+            scores=pd.DataFrame(scores, index=[dates[split] for _, split, _ in windows], columns=columns),
+            curve=curve,
+            history=history,
+        )
+
+    @staticmethod
+    def _run_segment(frame: pd.DataFrame, strategy, frequency: str, codes: list,
+                     start: int, stop: int, balance: float) -> Trader:
+        """以新的交易員回測一個樣本外區段 (stateful 策略先以之前的數據 prime)"""
+        trader = Trader(balance=balance, strategy=type(strategy)(**strategy.params()),
+                        rebalance_frequency=frequency)
+        if trader.strategy.lookback:
+            trader.strategy.prime(frame.iloc[:start], codes)
+        dates = frame.index[start:stop]
+        trader.strategy.prepare(frame, trader.rebalance_dates(dates), codes)
+        for date in dates:
+            trader.step(date, frame.loc[date], codes)
+        return trader
@@ -1,11 +1,14 @@
 from .engine import Trader
-from .strategies import BaseStrategy, MaxSharpeStrategy, LinearProgrammingStrategy
+from .strategies import BaseStrategy, MaxSharpeStrategy, LinearProgrammingStrategy, MeanVarianceStrategy
 from .action import PortfolioSnapshot
+from .paper import PaperTrader
 
 __all__ = [
     'Trader',
     'BaseStrategy',
     'MaxSharpeStrategy',
     'LinearProgrammingStrategy',
+    'MeanVarianceStrategy',
     'PortfolioSnapshot',
+    'PaperTrader',
 ]
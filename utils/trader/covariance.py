@@ -0,0 +1,137 @@
+from typing import Optional
+import numpy as np
+from scipy.linalg import blas
+
+
+class RollingCovariance:
+    """
+    滾動視窗共變異數 - 每日以 rank-1 更新加入新報酬、移除離開視窗的報酬 (O(N²))
+
+    缺值 (NaN) 以成對完整 (pairwise complete) 的方式處理, 結果與
+    pd.DataFrame(視窗內報酬).cov() 相同。完整的報酬列只更新交叉乘積與總和;
+    含缺值的報酬列另外累計成對的次數與總和。
+    每 refresh 次更新以視窗內的報酬重新計算一次, 避免加減累積的捨入誤差。
+    """
+
+    def __init__(self, window: int = 252, refresh: int = None):
+        """
+        Args:
+            window: 視窗大小 (交易日)
+            refresh: 每幾次更新重新計算一次 (預設為 window)
+        """
+        self.window = window
+        self.refresh = refresh or window
+        self.n_assets = None
+
+    def reset(self, n_assets: int):
+        """清空視窗並設定資產數量"""
+        self.n_assets = n = n_assets
+        self.returns = np.zeros((self.window, n))  # 視窗內報酬 (缺值為 0), 環狀緩衝
+        self.valid = np.zeros((self.window, n), dtype=bool)
+        self.complete = np.zeros(self.window, dtype=bool)
+        self.size = 0          # 視窗內的報酬列數
+        self.head = 0          # 下一個寫入位置
+        self.updates = 0
+
+        self.cross = np.zeros((n, n), order='F')     # Σ x xᵀ (只維護上三角)
+        self.full_count = 0                           # 完整報酬列數
+        self.full_sum = np.zeros(n)                   # 完整報酬列的總和
+        self.partial_count = np.zeros((n, n), order='F')  # 含缺值列的成對次數
+        self.partial_sum = np.zeros((n, n), order='F')    # 含缺值列中 j 有值時 i 的報酬總和
+
+    def update(self, returns: np.ndarray):
+        """
+        加入一日報酬 (視窗已滿時同時移除最舊的一日)
+
+        Args:
+            returns: 長度為資產數量的報酬 (缺值為 NaN)
+        """
+        returns = np.asarray(returns, dtype=float)
+        if self.n_assets != len(returns):
+            self.reset(len(returns))
+
+        if self.size == self.window:
+            self._apply(self.returns[self.head], self.valid[self.head], self.complete[self.head], -1.0)
+        else:
+            self.size += 1
+
+        valid = np.isfinite(returns)
+        x = np.where(valid, returns, 0.0)
+        self.returns[self.head] = x
+        self.valid[self.head] = valid
+        self.complete[self.head] = valid.all()
+        self.head = (self.head + 1) % self.window
+
+        self.updates += 1
+        if self.updates % self.refresh == 0:
+            self._recompute()
+        else:
+            self._apply(x, valid, self.complete[self.head - 1], 1.0)
+
+    def _apply(self, x: np.ndarray, valid: np.ndarray, complete: bool, sign: float):
+        """以 rank-1 更新加入 (sign=1) 或移除 (sign=-1) 一列報酬"""
+        self.cross = blas.dsyr(sign, x, a=self.cross, overwrite_a=1)
+        if complete:
+            self.full_count += int(sign)
+            self.full_sum += sign * x
+        else:
+            m = valid.astype(float)
+            self.partial_count = blas.dger(sign, m, m, a=self.partial_count, overwrite_a=1)
+            self.partial_sum = blas.dger(sign, x, m, a=self.partial_sum, overwrite_a=1)
+
+    def _recompute(self):
+        """以視窗內的報酬重新計算所有累計量"""
+        rows = self._rows()
+        x, valid, complete = self.returns[rows], self.valid[rows], self.complete[rows]
+        m = valid.astype(float)
+        self.cross = np.asfortranarray(x.T @ x)
+        self.full_count = int(complete.sum())
+        self.full_sum = x[complete].sum(axis=0)
+        self.partial_count = np.asfortranarray(m[~complete].T @ m[~complete])
+        self.partial_sum = np.asfortranarray(x[~complete].T @ m[~complete])
+
+    def _rows(self) -> np.ndarray:
+        """視窗內的報酬列 (由舊到新)"""
+        return (self.head - self.size + np.arange(self.size)) % self.window
+
+    def counts(self, index: Optional[np.ndarray] = None) -> np.ndarray:
+        """各資產在視窗內的有效報酬數"""
+        index = slice(None) if index is None else index
+        return self.full_count + np.diagonal(self.partial_count)[index]
+
+    def mean(self, index: Optional[np.ndarray] = None) -> np.ndarray:
+        """各資產在視窗內的平均報酬"""
+        index = slice(None) if index is None else index
+        total = self.full_sum[index] + np.diagonal(self.partial_sum)[index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return total / self.counts(index)
+
+    def covariance(self, index: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        視窗內報酬的樣本共變異數 (ddof=1, 成對完整)
+
+        Args:
+            index: 只計算部分資產 (位置索引), 預設全部
+
+        Returns:
+            (k × k) 共變異數矩陣, 成對有效次數不足 2 時為 NaN
+        """
+        index = np.arange(self.n_assets) if index is None else np.asarray(index)
+        block = np.ix_(index, index)
+        # cross 只維護上三角: 索引遞增時直接對稱化, 否則以 (min, max) 位置讀取
+        if np.all(np.diff(index) > 0):
+            upper = np.triu(self.cross[block])
+            cross = upper + np.triu(upper, 1).T
+        else:
+            cross = self.cross[np.minimum.outer(index, index), np.maximum.outer(index, index)]
+        if self.full_count == self.size:
+            # 視窗內沒有缺值
+            count = self.full_count
+            sums = np.broadcast_to(self.full_sum[index][:, None], cross.shape)
+        else:
+            count = self.full_count + self.partial_count[block]
+            sums = self.full_sum[index][:, None] + self.partial_sum[block]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (cross - sums * sums.T / count) / (count - 1)
+        cov[np.broadcast_to(count < 2, cov.shape)] = np.nan
+        return cov
@@ -23,9 +23,11 @@ class Trader:
         self.portfolio_history = []  # List[PortfolioSnapshot]
         self.last_rebalance_date = None
         
-    def _should_rebalance(self, current_date: pd.Timestamp) -> bool:
-        """判斷是否該執行 rebalance"""
-        if self.last_rebalance_date is None:
+    def _should_rebalance(self, current_date: pd.Timestamp, last_rebalance_date: pd.Timestamp = None) -> bool:
+        """判斷是否該執行 rebalance (last_rebalance_date 預設為目前狀態)"""
+        if last_rebalance_date is None:
+            last_rebalance_date = self.last_rebalance_date
+        if last_rebalance_date is None:
             return True
             
         if self.rebalance_frequency == 'daily':
@@ -33,21 +35,62 @@ class Trader:
         elif self.rebalance_frequency == 'weekly':
             # 每週一 rebalance
             return current_date.weekday() == 0 and \
-                   (current_date - self.last_rebalance_date).days >= 7
+                   (current_date - last_rebalance_date).days >= 7
         elif self.rebalance_frequency == 'monthly':
             # 每月第一個交易日 rebalance
-            return current_date.month != self.last_rebalance_date.month
+            return current_date.month != last_rebalance_date.month
         elif self.rebalance_frequency == 'quarterly':
             # 每季第一個交易日 rebalance (1, 4, 7, 10月)
             quarter_months = [1, 4, 7, 10]
             return current_date.month in quarter_months and \
-                   current_date.month != self.last_rebalance_date.month
+                   current_date.month != last_rebalance_date.month
         elif self.rebalance_frequency == 'yearly':
             # 每年第一個交易日 rebalance (1月)
-            return current_date.year != self.last_rebalance_date.year
+            return current_date.year != last_rebalance_date.year
         
         return False
         
+    def rebalance_dates(self, dates: pd.Index) -> pd.Index:
+        """
+        推算 dates 中會 rebalance 的交易日 (rebalance 與否只取決於日期, 與持倉無關)
+        
+        Args:
+            dates: 之後依序推進的交易日
+        """
+        last, selected = self.last_rebalance_date, []
+        for date in dates:
+            if self._should_rebalance(date, last):
+                selected.append(date)
+                last = date
+        return pd.Index(selected, dtype=dates.dtype)
+        
+    def step(self, date: pd.Timestamp, row: pd.Series, codes: list = None) -> PortfolioSnapshot:
+        """
+        推進一個交易日 - 需要時 rebalance, 並記錄當日快照 (O(股票數))
+        
+        回測逐日呼叫 step 的結果, 與每日以 step 推進的模擬交易完全相同。
+        
+        Args:
+            date: 交易日
+            row: 當日市場數據 (如 portfolio_df.loc[date])
+            codes: 可交易股票列表 (預設為 row 中有收盤價欄位的股票)
+            
+        Returns:
+            當日的投資組合快照
+        """
+        if row.name != date:
+            row = row.rename(date)
+        if codes is None:
+            codes = [key[:-len('_Close')] for key in row.index if key.endswith('_Close')]
+        
+        self.strategy.observe(row, codes)
+        if self._should_rebalance(date):
+            weights = self.decide(row, codes)
+            self.execute_trades(weights, row)
+        
+        self.update_daily_snapshot(row)
+        return self.portfolio_history[-1]
+        
     def decide(self, market_data: pd.Series, codes: list) -> Dict[str, float]:
         """
         根據策略決定配置權重
@@ -81,7 +124,8 @@ class Trader:
             if price_key not in market_data.index:
                 continue
                 
-            price = market_data[price_key]
+            # 精簡模式的 float32 價格轉為 float, 資金計算維持 float64 精度
+            price = float(market_data[price_key])
             if pd.isna(price) or price <= 0:
                 continue
                 
@@ -93,7 +137,7 @@ class Trader:
         
         # 計算實際使用金額
         used = sum(
-            units * market_data[f'{ticker}_Close']
+            units * float(market_data[f'{ticker}_Close'])
             for ticker, units in new_inventory.items()
             if f'{ticker}_Close' in market_data.index
         )
@@ -119,7 +163,7 @@ class Trader:
         for ticker, units in self.inventory.items():
             price_key = f'{ticker}_Close'
             if price_key in market_data.index:
-                price = market_data[price_key]
+                price = float(market_data[price_key])
                 if pd.notna(price) and price > 0:
                     total += units * price
         return total
@@ -0,0 +1,297 @@
+"""
+模擬交易 (paper trading) - 以具名交易員的持久化狀態每日推進一個交易日
+
+用法:
+    python -m utils.trader.paper advance --dir paper --name main --state portfolio_state.pkl
+    python -m utils.trader.paper verify --dir paper --name main --state portfolio_state.pkl
+"""
+
+import argparse
+import importlib
+import json
+import os
+from typing import List, Optional
+
+import pandas as pd
+
+from .action import PortfolioSnapshot
+from .engine import Trader
+from ..market.checkpoint import atomic_write
+
+
+class PaperTrader:
+    """
+    具名交易員的持久化狀態 - step() 每日只處理一個交易日, 不需重播完整歷史
+
+    目錄結構:
+        {name}.json           交易員設定與目前狀態 (現金、持倉、最後 rebalance 日)
+        {name}.history.jsonl  每日快照 (只附加; 持倉只在變動時記錄)
+        {name}.strategy.{days}.pkl  策略的內部狀態 (只有 stateful 策略, 如滾動共變異數), 狀態檔記錄對應的檔名
+
+    狀態檔以原子操作寫入; 快照與策略狀態先寫入再更新狀態檔, 中斷時多出的快照在讀取時捨棄,
+    狀態檔仍指向上一日的策略檔 (新的策略檔在讀取時刪除)。
+    浮點數以 JSON 的最短精確表示保存, 還原後與記憶體中的數值完全相同。
+    """
+
+    def __init__(self, directory: str, name: str):
+        """
+        Args:
+            directory: 狀態目錄
+            name: 交易員名稱
+        """
+        self.directory = directory
+        self.name = name
+        self.state_path = os.path.join(directory, f'{name}.json')
+        self.history_path = os.path.join(directory, f'{name}.history.jsonl')
+        self.trader: Optional[Trader] = None
+        self.codes: List[str] = []
+        self.start_date = None
+        self.last_date = None
+        self.days = 0
+        self.history_bytes = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.state_path)
+
+    def create(self, trader: Trader, codes: list) -> 'PaperTrader':
+        """
+        建立新的具名交易員 (尚未交易)
+
+        Args:
+            trader: 交易員 (使用其初始資金、策略與 rebalance 頻率)
+            codes: 可交易股票列表
+        """
+        if self.exists():
+            raise FileExistsError(f"Paper trader already exists: {self.state_path}")
+        os.makedirs(self.directory, exist_ok=True)
+        strategy = type(trader.strategy)(**trader.strategy.params())
+        self.trader = Trader(balance=trader.initial_balance, strategy=strategy,
+                             rebalance_frequency=trader.rebalance_frequency)
+        self.codes = list(codes)
+        open(self.history_path, 'w').close()
+        self._save()
+        return self
+
+    def load(self) -> 'PaperTrader':
+        """讀取狀態檔 (不讀取快照歷史)"""
+        with open(self.state_path, encoding='utf-8') as f:
+            state = json.load(f)
+
+        module = importlib.import_module(state['strategy']['module'])
+        strategy_class = getattr(module, state['strategy']['class'])
+        strategy = strategy_class(**state['strategy']['params'])
+        strategy_file = state.get('strategy_file')
+        if strategy.stateful and strategy_file is not None:
+            saved = pd.read_pickle(os.path.join(self.directory, strategy_file))
+            if saved['days'] != state['days']:
+                raise RuntimeError(f"Strategy state of {self.name} is at day {saved['days']}, "
+                                   f"trader state at day {state['days']}")
+            strategy = saved['strategy']
+
+        trader = Trader(balance=state['initial_balance'], strategy=strategy,
+                        rebalance_frequency=state['rebalance_frequency'])
+        trader.cash = state['cash']
+        trader.inventory = state['inventory']
+        trader.last_rebalance_date = _parse_date(state['last_rebalance_date'])
+
+        self.trader = trader
+        self.codes = state['codes']
+        self.start_date = _parse_date(state['start_date'])
+        self.last_date = _parse_date(state['last_date'])
+        self.days = state['days']
+        self.history_bytes = state['history_bytes']
+        if os.path.getsize(self.history_path) > self.history_bytes:
+            # 上次附加快照後、更新狀態檔前中斷: 捨棄狀態檔未記錄的快照
+            os.truncate(self.history_path, self.history_bytes)
+        self._remove_strategy_files(keep=strategy_file)
+        return self
+
+    def _remove_strategy_files(self, keep: Optional[str] = None):
+        """刪除狀態檔未指向的策略檔 (上一日的版本, 或中斷時多寫的版本)"""
+        prefix = f'{self.name}.strategy.'
+        for name in os.listdir(self.directory):
+            if name == keep or not (name.startswith(prefix) and name.endswith('.pkl')):
+                continue
+            if not name[len(prefix):-len('.pkl')].isdigit():
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _save(self):
+        trader = self.trader
+        strategy = trader.strategy
+        strategy_file = f'{self.name}.strategy.{self.days}.pkl' if strategy.stateful else None
+        state = {
+            'name': self.name,
+            'strategy': {
+                'module': type(strategy).__module__,
+                'class': type(strategy).__qualname__,
+                'params': strategy.params(),
+            },
+            'rebalance_frequency': trader.rebalance_frequency,
+            'initial_balance': trader.initial_balance,
+            'codes': self.codes,
+            'cash': trader.cash,
+            'inventory': trader.inventory,
+            'last_rebalance_date': _format_date(trader.last_rebalance_date),
+            'start_date': _format_date(self.start_date),
+            'last_date': _format_date(self.last_date),
+            'days': self.days,
+            'history_bytes': self.history_bytes,
+            'strategy_file': strategy_file,
+        }
+
+        def write(tmp):
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+        if strategy_file is not None:
+            # 新的策略檔與上一日的並存, 狀態檔指向新檔後才刪除舊檔
+            atomic_write(os.path.join(self.directory, strategy_file),
+                         lambda tmp: pd.to_pickle({'days': self.days, 'strategy': strategy}, tmp))
+        atomic_write(self.state_path, write)
+        if strategy_file is not None:
+            self._remove_strategy_files(keep=strategy_file)
+
+    def step(self, date: pd.Timestamp, row: pd.Series) -> Optional[PortfolioSnapshot]:
+        """
+        推進一個交易日並存檔 (O(股票數))
+
+        Args:
+            date: 交易日
+            row: 當日市場數據 (如 portfolio_df.loc[date])
+
+        Returns:
+            當日快照; date 不晚於最後交易日 (已推進過) 時回傳 None
+        """
+        if self.trader is None:
+            self.load()
+        if self.last_date is not None and date <= self.last_date:
+            return None
+
+        previous = self.trader.inventory
+        snapshot = self.trader.step(date, row, self.codes)
+        self.trader.portfolio_history.clear()
+
+        record = [_format_date(snapshot.timestamp), snapshot.cash, snapshot.total_value]
+        if self.days == 0 or snapshot.positions != previous:
+            record.append(snapshot.positions)
+        with open(self.history_path, 'ab') as f:
+            f.write((json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8'))
+            self.history_bytes = f.tell()
+
+        self.start_date = self.start_date if self.start_date is not None else date
+        self.last_date = date
+        self.days += 1
+        self._save()
+        return snapshot
+
+    def advance(self, frame: pd.DataFrame) -> int:
+        """
+        推進 frame 中最後交易日之後的所有交易日
+
+        Returns:
+            推進的交易日數
+        """
+        if self.trader is None:
+            self.load()
+        dates = frame.index if self.last_date is None else frame.index[frame.index > self.last_date]
+        for date in dates:
+            self.step(date, frame.loc[date])
+        return len(dates)
+
+    def history(self) -> List[PortfolioSnapshot]:
+        """讀取每日快照"""
+        if self.trader is None:
+            self.load()
+        snapshots = []
+        positions = {}
+        with open(self.history_path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if len(record) > 3:
+                    positions = record[3]
+                snapshots.append(PortfolioSnapshot(
+                    timestamp=_parse_date(record[0]),
+                    cash=record[1],
+                    positions=dict(positions),
+                    total_value=record[2]
+                ))
+        return snapshots
+
+    def verify(self, frame: pd.DataFrame) -> List[str]:
+        """
+        以 frame 從第一個交易日完整重播, 逐日比對快照與目前狀態
+
+        Returns:
+            不一致的描述 (空列表表示完全一致)
+        """
+        if self.trader is None:
+            self.load()
+        strategy = self.trader.strategy
+        replay = Trader(balance=self.trader.initial_balance, strategy=type(strategy)(**strategy.params()),
+                        rebalance_frequency=self.trader.rebalance_frequency)
+
+        errors = []
+        if self.days == 0:
+            return errors
+        dates = frame.index[(frame.index >= self.start_date) & (frame.index <= self.last_date)]
+        recorded = self.history()
+        if len(dates) != len(recorded):
+            errors.append(f"{len(recorded)} recorded days, {len(dates)} days in data")
+
+        for date, snapshot in zip(dates, recorded):
+            expected = replay.step(date, frame.loc[date], self.codes)
+            if snapshot != expected:
+                errors.append(f"{date.date()}: recorded {snapshot}, replay {expected}")
+
+        for attr in ('cash', 'inventory', 'last_rebalance_date'):
+            if getattr(replay, attr) != getattr(self.trader, attr):
+                errors.append(f"{attr}: state {getattr(self.trader, attr)}, replay {getattr(replay, attr)}")
+        return errors
+
+
+def _format_date(date) -> Optional[str]:
+    return None if date is None else pd.Timestamp(date).isoformat()
+
+
+def _parse_date(text: Optional[str]):
+    return None if text is None else pd.Timestamp(text)
+
+
+def _load_frame(path: str) -> pd.DataFrame:
+    """讀取 SimulatedMarket.save() 儲存的投資組合數據 (裁切 warmup 後)"""
+    from ..market.data import MarketDataProvider
+    return pd.read_pickle(path).frame.iloc[MarketDataProvider.WARMUP_DAYS:, :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FinBuddy paper trading')
+    parser.add_argument('command', choices=['advance', 'verify'],
+                        help='advance: 推進到數據最後一天; verify: 以完整重播檢查狀態')
+    parser.add_argument('--dir', required=True, help='模擬交易狀態目錄')
+    parser.add_argument('--name', required=True, help='交易員名稱')
+    parser.add_argument('--state', required=True, help='SimulatedMarket.save() 儲存的數據檔')
+    args = parser.parse_args()
+
+    paper = PaperTrader(args.dir, args.name).load()
+    frame = _load_frame(args.state)
+
+    if args.command == 'advance':
+        days = paper.advance(frame)
+        print(f"✅ {args.name}: advanced {days} days to {_format_date(paper.last_date)}, "
+              f"cash ${paper.trader.cash:,.2f}, {len(paper.trader.inventory)} positions")
+        return
+
+    errors = paper.verify(frame)
+    if errors:
+        print(f"❌ {args.name}: {len(errors)} mismatches")
+        for error in errors[:20]:
+            print(f"  {error}")
+        raise SystemExit(1)
+    print(f"✅ {args.name}: {paper.days} days match a full replay")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,58 @@
+import hashlib
+import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+from scipy.linalg import LinAlgError, cho_factor, cho_solve
 from scipy.optimize import linprog
+from .covariance import RollingCovariance
 
 
 class BaseStrategy(ABC):
     """策略基類"""
     
+    # 策略讀取的欄位樣板 ({code} 代表個股代碼), None 表示需要完整數據
+    required_fields = None
+    
+    # observe 需要的歷史交易日數 (0 表示策略不需要每日數據)
+    lookback = 0
+    
+    # 策略是否保存跨日的內部狀態 (以底線開頭的屬性)
+    stateful = False
+    
+    # 只影響執行方式、不影響權重的參數 (不列入回測快取鍵)
+    execution_params = ()
+    
+    def params(self) -> dict:
+        """策略參數 (不含底線開頭的內部狀態), 可用 type(strategy)(**params) 重建"""
+        return {k: v for k, v in vars(self).items() if not k.startswith('_')}
+    
+    def observe(self, market_data: pd.Series, codes: list):
+        """
+        每個交易日 (rebalance 判斷之前) 呼叫一次, 預設不做任何事
+        
+        Args:
+            market_data: 當日市場數據
+            codes: 可交易的股票代碼列表
+        """
+        
+    def prepare(self, frame: pd.DataFrame, dates: pd.Index, codes: list):
+        """
+        回測開始前呼叫一次, 可預先計算 rebalance 日的權重 (預設不做任何事)
+        
+        Args:
+            frame: 投資組合數據
+            dates: 會 rebalance 的交易日
+            codes: 可交易的股票代碼列表
+        """
+        
+    def prime(self, history: pd.DataFrame, codes: list):
+        """以歷史數據的最後 lookback 個交易日依序呼叫 observe (用於未經回測的策略實例)"""
+        if self.lookback:
+            for date in history.index[-self.lookback:]:
+                self.observe(history.loc[date], codes)
+    
     @abstractmethod
     def calculate_weights(self, market_data: pd.Series, codes: list) -> dict:
         """
@@ -25,6 +71,8 @@ class BaseStrategy(ABC):
 class MaxSharpeStrategy(BaseStrategy):
     """最大夏普策略 - 選擇 Sharpe 最高的前 topk 檔股票"""
     
+    required_fields = ('{code}_Close', '{code}_Sharpe')
+    
     def __init__(self, topk: int = 5, max_weight: float = 0.2):
         """
         Args:
@@ -73,19 +121,47 @@ class MaxSharpeStrategy(BaseStrategy):
 
 
 class LinearProgrammingStrategy(BaseStrategy):
-    """線性規劃策略 - 在 Beta 約束下最大化 Sharpe"""
+    """
+    線性規劃策略 - 在 Beta 約束下最大化 Sharpe
+    
+    每個 rebalance 日的權重只取決於當日的 Sharpe、Beta 與 betas, 與持倉無關;
+    precompute=True 時回測開始前以多個行程求解所有 rebalance 日, 權重矩陣可快取於磁碟。
+    """
+    
+    required_fields = ('{code}_Close', '{code}_Sharpe', '{code}_Beta', 'betas')
+    execution_params = ('precompute', 'workers', 'cache_dir')
     
-    def __init__(self, max_weight: float = 0.2, enable_beta_constraint: bool = True):
+    def __init__(self, max_weight: float = 0.2, enable_beta_constraint: bool = True,
+                 precompute: bool = False, workers: int = None, cache_dir: str = None):
         """
         Args:
             max_weight: 單一股票最大權重
             enable_beta_constraint: 是否啟用 Beta 約束
+            precompute: 回測前先以行程池平行求解所有 rebalance 日的權重
+            workers: 行程數量 (預設為 CPU 核心數)
+            cache_dir: 權重矩陣的磁碟快取目錄 (可選), 只重新求解輸入有變動或新增的日期
         """
         self.max_weight = max_weight
         self.enable_beta_constraint = enable_beta_constraint
+        self.precompute = precompute
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self._weights = None  # 預先求解的權重 {date: (輸入雜湊, 權重列)}
+        self._codes = None
+        self._columns = None    # 上次查詢輸入欄位位置的欄位索引
+        self._positions = None  # 輸入欄位在 self._columns 中的位置
+        
+    def __getstate__(self):
+        # 預先求解的權重可由數據重建, 不隨回測快取或模擬交易狀態保存
+        return {**self.__dict__, '_weights': None, '_codes': None, '_columns': None, '_positions': None}
         
     def calculate_weights(self, market_data: pd.Series, codes: list) -> dict:
-        """用線性規劃求解最佳權重"""
+        """用線性規劃求解最佳權重 (當日輸入與預先求解時相同才沿用預先求解的權重)"""
+        if self._weights is not None and self._codes == list(codes) and market_data.name in self._weights:
+            digest, row = self._weights[market_data.name]
+            if self._row_digest(market_data) == digest:
+                return _weights_from_row(row, codes)
+        
         weights = {code: 0.0 for code in codes}
         
         # 收集有效股票
@@ -112,47 +188,423 @@ class LinearProgrammingStrategy(BaseStrategy):
             weights['CASH'] = 1.0
             return weights
         
-        # 設定線性規劃問題
-        n = len(valid_codes)
-        sharpe = np.array(sharpe_list)
-        beta = np.array(beta_list)
-        
-        # 目標函數: 最大化 Sharpe (轉為最小化 -Sharpe)
-        c = -sharpe
-        
-        # 等式約束: 總權重 = 1
-        A_eq = [np.ones(n)]
-        b_eq = [1.0]
-        
-        # 不等式約束: Beta 限制
-        A_ub = []
-        b_ub = []
-        
+        # Beta 限制
+        beta_threshold = None
         if self.enable_beta_constraint and 'betas' in market_data.index:
             beta_threshold = market_data['betas']
-            if pd.notna(beta_threshold) and np.isfinite(beta_threshold):
-                A_ub.append(beta)
-                b_ub.append(beta_threshold)
-        
-        # 邊界: 0 <= weight <= max_weight
-        bounds = [(0, self.max_weight) for _ in range(n)]
-        
-        # 求解
-        res = linprog(
-            c, 
-            A_ub=A_ub or None, 
-            b_ub=b_ub or None,
-            A_eq=A_eq, 
-            b_eq=b_eq, 
-            bounds=bounds, 
-            method="highs"
-        )
+            if not (pd.notna(beta_threshold) and np.isfinite(beta_threshold)):
+                beta_threshold = None
+        
+        x = _solve_lp(np.array(sharpe_list, dtype=float), np.array(beta_list, dtype=float),
+                      beta_threshold, self.max_weight)
         
         # 處理結果
-        if res.success and res.x.sum() > 1e-6:
+        if x is not None:
             for i, code in enumerate(valid_codes):
-                weights[code] = res.x[i]
+                weights[code] = x[i]
         else:
             weights['CASH'] = 1.0
         
         return weights
+        
+    def prepare(self, frame: pd.DataFrame, dates: pd.Index, codes: list):
+        """
+        回測開始前平行求解所有 rebalance 日的權重 (precompute=False 時不做任何事)
+        
+        已求解的日期只在輸入 (Sharpe、Beta、Close、betas) 的雜湊改變時重新求解。
+        
+        Args:
+            frame: 投資組合數據
+            dates: 會 rebalance 的交易日
+            codes: 可交易股票列表
+        """
+        if not self.precompute or len(dates) == 0:
+            return
+        codes = list(codes)
+        if self._codes != codes:
+            self._weights, self._codes = {}, codes
+        
+        sharpe, beta, close, threshold = self._inputs(frame.loc[dates], codes)
+        digests = _row_digests(sharpe, beta, close, threshold)
+        stale = np.array([date not in self._weights or self._weights[date][0] != digest
+                          for date, digest in zip(dates, digests)])
+        if not stale.any():
+            return
+        dates, digests = dates[stale], digests[stale]
+        sharpe, beta, close, threshold = sharpe[stale], beta[stale], close[stale], threshold[stale]
+        
+        cache = _LPWeightCache(self.cache_dir, self, codes) if self.cache_dir else None
+        result = np.full((len(dates), len(codes) + 1), np.nan)
+        pending = np.ones(len(dates), dtype=bool)
+        if cache is not None:
+            found = cache.lookup(dates, digests)
+            for i, row in found.items():
+                result[i] = row
+                pending[i] = False
+        
+        # 平行求解其餘日期
+        todo = np.flatnonzero(pending)
+        tasks = []
+        for i in todo:
+            valid = np.isfinite(sharpe[i]) & np.isfinite(beta[i]) & np.isfinite(close[i]) & (close[i] > 0)
+            tasks.append((valid, sharpe[i][valid], beta[i][valid],
+                          threshold[i] if np.isfinite(threshold[i]) else None))
+        if tasks:
+            workers = self.workers or os.cpu_count() or 1
+            args = [(sharpe_i, beta_i, threshold_i, self.max_weight) for _, sharpe_i, beta_i, threshold_i in tasks]
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    solutions = list(executor.map(_solve_lp_task, args,
+                                                  chunksize=max(1, len(args) // (workers * 4))))
+            else:
+                solutions = [_solve_lp_task(arg) for arg in args]
+            
+            for i, (valid, *_), x in zip(todo, tasks, solutions):
+                row = np.zeros(len(codes) + 1)
+                row[-1] = np.nan
+                if x is None:
+                    row[-1] = 1.0
+                else:
+                    row[:-1][valid] = x
+                result[i] = row
+            if cache is not None:
+                cache.store(dates[todo], digests[todo], result[todo])
+        
+        for date, digest, row in zip(dates, digests, result):
+            self._weights[date] = (digest, row)
+        
+    def _row_digest(self, market_data: pd.Series):
+        """單日輸入的雜湊 (與 prepare 的 _row_digests 相同, 欄位位置只在欄位改變時重新查詢)"""
+        if self._columns is not market_data.index and not market_data.index.equals(self._columns):
+            names = [f'{code}_{suffix}' for suffix in ('Sharpe', 'Beta', 'Close') for code in self._codes]
+            self._columns = market_data.index
+            self._positions = self._columns.get_indexer(names + ['betas'])
+            if not self.enable_beta_constraint:
+                self._positions[-1] = -1
+        positions = self._positions
+        values = market_data.iloc[np.maximum(positions, 0)].to_numpy(dtype=float, na_value=np.nan)
+        values = np.where(positions < 0, np.nan, values)
+        n = len(self._codes)
+        return _row_digests(values[None, :n], values[None, n:2 * n], values[None, 2 * n:3 * n], values[3 * n:])[0]
+        
+    def _inputs(self, rows: pd.DataFrame, codes: list) -> tuple:
+        """每日的輸入 (依 codes 順序, 缺少的欄位為 NaN): Sharpe、Beta、Close 矩陣與 betas"""
+        def matrix(suffix):
+            return rows.reindex(columns=[f'{code}_{suffix}' for code in codes]).to_numpy(dtype=float)
+        if self.enable_beta_constraint and 'betas' in rows.columns:
+            threshold = rows['betas'].to_numpy(dtype=float)
+        else:
+            threshold = np.full(len(rows), np.nan)
+        return matrix('Sharpe'), matrix('Beta'), matrix('Close'), threshold
+
+
+def _solve_lp(sharpe: np.ndarray, beta: np.ndarray, beta_threshold, max_weight: float):
+    """
+    在 Beta 約束下最大化 Sharpe 的線性規劃
+    
+    Returns:
+        各股票權重; 無解或權重總和過小時回傳 None (全部持有現金)
+    """
+    n = len(sharpe)
+    if n == 0:
+        return None
+    
+    # 目標函數: 最大化 Sharpe (轉為最小化 -Sharpe)
+    c = -sharpe
+    
+    # 等式約束: 總權重 = 1
+    A_eq = [np.ones(n)]
+    b_eq = [1.0]
+    
+    # 不等式約束: Beta 限制
+    A_ub = []
+    b_ub = []
+    if beta_threshold is not None:
+        A_ub.append(beta)
+        b_ub.append(beta_threshold)
+    
+    # 邊界: 0 <= weight <= max_weight
+    bounds = [(0, max_weight) for _ in range(n)]
+    
+    # 求解
+    res = linprog(
+        c, 
+        A_ub=A_ub or None, 
+        b_ub=b_ub or None,
+        A_eq=A_eq, 
+        b_eq=b_eq, 
+        bounds=bounds, 
+        method="highs"
+    )
+    
+    if res.success and res.x.sum() > 1e-6:
+        return res.x
+    return None
+
+
+def _solve_lp_task(args):
+    """行程池的工作函式"""
+    return _solve_lp(*args)
+
+
+def _weights_from_row(row: np.ndarray, codes: list) -> dict:
+    """將預先求解的權重列 (codes 與 CASH, CASH 為 NaN 表示沒有現金部位) 轉為權重字典"""
+    weights = {code: row[i] for i, code in enumerate(codes)}
+    if not np.isnan(row[-1]):
+        weights['CASH'] = float(row[-1])
+    return weights
+
+
+def _row_digests(*matrices) -> np.ndarray:
+    """每日輸入的內容雜湊 (輸入不變時沿用快取的權重)"""
+    digests = np.empty(len(matrices[0]), dtype=np.uint64)
+    for i in range(len(digests)):
+        digest = hashlib.blake2b(digest_size=8)
+        for matrix in matrices:
+            digest.update(np.ascontiguousarray(matrix[i]).tobytes())
+        digests[i] = int.from_bytes(digest.digest(), 'little')
+    return digests
+
+
+class _LPWeightCache:
+    """線性規劃權重矩陣的磁碟快取 - 以 (策略參數, 股票池) 為檔案, 每日以輸入雜湊驗證"""
+    
+    def __init__(self, directory: str, strategy: LinearProgrammingStrategy, codes: list):
+        os.makedirs(directory, exist_ok=True)
+        key = repr((strategy.max_weight, strategy.enable_beta_constraint, codes))
+        name = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        self.path = os.path.join(directory, f'lp-{name}.npz')
+        
+    def _load(self):
+        if not os.path.exists(self.path):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64), None
+        with np.load(self.path) as data:
+            return data['dates'], data['digests'], data['weights']
+        
+    def lookup(self, dates: pd.Index, digests: np.ndarray) -> dict:
+        """回傳輸入雜湊相同的日期 {位置: 權重列}"""
+        cached_dates, cached_digests, weights = self._load()
+        if weights is None:
+            return {}
+        position = {date: i for i, date in enumerate(cached_dates)}
+        found = {}
+        for i, (date, digest) in enumerate(zip(dates.as_unit('ns').asi8, digests)):
+            j = position.get(date)
+            if j is not None and cached_digests[j] == digest:
+                found[i] = weights[j]
+        return found
+        
+    def store(self, dates: pd.Index, digests: np.ndarray, weights: np.ndarray):
+        """合併新求解的日期後寫回 (同一日期以新結果為準)"""
+        from ..market.checkpoint import atomic_write  # utils.market 匯入 utils.trader, 延後匯入避免循環
+        
+        cached_dates, cached_digests, cached_weights = self._load()
+        new_dates = dates.as_unit('ns').asi8
+        if cached_weights is not None and cached_weights.shape[1] == weights.shape[1]:
+            keep = ~np.isin(cached_dates, new_dates)
+            new_dates = np.concatenate([cached_dates[keep], new_dates])
+            digests = np.concatenate([cached_digests[keep], digests])
+            weights = np.concatenate([cached_weights[keep], weights])
+        order = np.argsort(new_dates, kind='stable')
+        
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, dates=new_dates[order], digests=digests[order], weights=weights[order])
+        atomic_write(self.path, write)
+
+
+class MeanVarianceStrategy(BaseStrategy):
+    """
+    均值-變異數策略 - 以滾動共變異數考慮股票間的相關性, 配置最大夏普 (tangency) 投資組合
+    
+    每日以 observe 將報酬加入滾動共變異數 (rank-1 更新, O(N²));
+    rebalance 時只對候選股票取出共變異數並求解 Σw = μ。
+    候選股票不變時沿用上次的 Cholesky 分解作為前置條件的共軛梯度法求解,
+    每 refactor_every 次 rebalance 或未收斂時才重新分解。
+    共變異數不是正定時 (價格共線, 或含缺值的成對完整估計) 逐次加倍對角線負載後求解。
+    """
+    
+    required_fields = ('{code}_Close', '{code}_Sharpe')
+    stateful = True
+    
+    def __init__(self, window: int = 252, shrinkage: float = 0.1, max_weight: float = 0.2,
+                 topk: int = None, refactor_every: int = 21):
+        """
+        Args:
+            window: 共變異數與平均報酬的滾動視窗 (交易日)
+            shrinkage: 共變異數向對角線收縮的比例 (0-1)
+            max_weight: 單一股票最大權重
+            topk: 只考慮 Sharpe 最高的前 topk 檔股票 (預設全部 Sharpe > 0 的股票)
+            refactor_every: 沿用同一個 Cholesky 分解的最多 rebalance 次數
+        """
+        self.window = window
+        self.shrinkage = shrinkage
+        self.max_weight = max_weight
+        self.topk = topk
+        self.refactor_every = refactor_every
+        
+        self._estimator = RollingCovariance(window)
+        self._codes = None
+        self._columns = None
+        self._positions = None
+        self._last_close = None
+        self._factor = None
+        self._factor_key = None
+        self._factor_age = 0
+        
+    @property
+    def lookback(self) -> int:
+        return self.window + 1
+        
+    def _values(self, market_data: pd.Series, suffix: str) -> np.ndarray:
+        """依 self._codes 順序取出當日欄位數值 (欄位位置只在欄位改變時重新查詢)"""
+        if self._columns is not market_data.index and not market_data.index.equals(self._columns):
+            self._columns = market_data.index
+            self._positions = {}
+        if suffix not in self._positions:
+            self._positions[suffix] = self._columns.get_indexer([f'{code}_{suffix}' for code in self._codes])
+        positions = self._positions[suffix]
+        values = market_data.to_numpy(dtype=float, na_value=np.nan)[np.maximum(positions, 0)]
+        values[positions < 0] = np.nan
+        return values
+        
+    def observe(self, market_data: pd.Series, codes: list):
+        """將當日報酬加入滾動共變異數"""
+        if self._codes != list(codes):
+            self._codes = list(codes)
+            self._columns = None
+            self._last_close = None
+            self._factor = None
+            self._estimator.reset(len(self._codes))
+        
+        close = self._values(market_data, 'Close')
+        close[~(close > 0)] = np.nan
+        if self._last_close is not None:
+            self._estimator.update(close / self._last_close - 1)
+        self._last_close = close
+        
+    def _solve(self, cov: np.ndarray, mu: np.ndarray, key: tuple) -> np.ndarray:
+        """求解 cov · x = mu, 候選股票相同時以上次的分解作為前置條件"""
+        if self._factor is not None and self._factor_key == key and self._factor_age < self.refactor_every:
+            x, converged = _preconditioned_cg(cov, mu, self._factor)
+            if converged:
+                self._factor_age += 1
+                return x
+        
+        self._factor = None
+        factor, loaded = _loaded_cholesky(cov)
+        if factor is None:
+            return np.linalg.lstsq(cov, mu, rcond=None)[0]
+        if loaded:
+            # 加了對角線負載的分解只用於這一次求解, 不作為之後的前置條件
+            return cho_solve(factor, mu)
+        self._factor = factor
+        self._factor_key = key
+        self._factor_age = 0
+        return cho_solve(factor, mu)
+        
+    def calculate_weights(self, market_data: pd.Series, codes: list) -> dict:
+        """
+        以收縮後的共變異數求解最大夏普權重 (不放空, 單一股票不超過 max_weight)
+        
+        先求解不受限的 tangency 投資組合 Σw = μ, 求解後才將負的權重截為 0 並重新正規化;
+        並非求解 long-only 的最佳化問題, 候選股票負相關較強時結果與 long-only 最適解不同。
+        """
+        weights = {code: 0.0 for code in codes}
+        
+        if self._codes != list(codes) or self._estimator.size < 2:
+            weights['CASH'] = 1.0
+            return weights
+        
+        # 候選股票: 價格有效、Sharpe > 0、視窗內至少一半交易日有報酬
+        estimator = self._estimator
+        close = self._values(market_data, 'Close')
+        sharpe = self._values(market_data, 'Sharpe')
+        counts = estimator.counts()
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero((close > 0) & (sharpe > 0) & (counts >= max(2, estimator.size // 2)))
+        if self.topk is not None:
+            candidates = np.sort(candidates[np.argsort(-sharpe[candidates], kind='stable')[:self.topk]])
+        
+        cov = estimator.covariance(candidates)
+        variance = np.diagonal(cov)
+        usable = np.isfinite(variance) & (variance > 0)
+        candidates, cov = candidates[usable], cov[np.ix_(usable, usable)]
+        if len(candidates) == 0:
+            weights['CASH'] = 1.0
+            return weights
+        
+        cov = np.nan_to_num(cov)
+        cov = (1 - self.shrinkage) * cov + self.shrinkage * np.diag(np.diagonal(cov))
+        mu = estimator.mean(candidates)
+        raw = np.maximum(self._solve(cov, mu, tuple(candidates)), 0)
+        if raw.sum() <= 0:
+            weights['CASH'] = 1.0
+            return weights
+        
+        allocation = _cap_weights(raw / raw.sum(), self.max_weight)
+        for i, weight in zip(candidates, allocation):
+            weights[self._codes[i]] = float(weight)
+        weights['CASH'] = max(0.0, 1.0 - float(allocation.sum()))
+        return weights
+
+
+def _loaded_cholesky(cov: np.ndarray, eps: float = 1e-10, max_tries: int = 64):
+    """
+    Cholesky 分解; 矩陣不是正定時 (如價格完全共線, 或含缺值的成對完整共變異數不是半正定)
+    加上 eps · trace / n 的對角線負載, 每次失敗加倍直到可分解
+
+    Returns:
+        (分解, 是否加了對角線負載); 無法分解時分解為 None
+    """
+    try:
+        return cho_factor(cov), False
+    except LinAlgError:
+        pass
+    identity = np.eye(len(cov))
+    loading = eps * max(np.trace(cov) / len(cov), np.finfo(float).tiny)
+    for _ in range(max_tries):
+        try:
+            return cho_factor(cov + loading * identity), True
+        except LinAlgError:
+            loading *= 2
+    return None, True
+
+
+def _preconditioned_cg(A: np.ndarray, b: np.ndarray, factor, tol: float = 1e-10, max_iter: int = 50):
+    """以 Cholesky 分解 (通常來自前一次 rebalance) 為前置條件的共軛梯度法"""
+    x = cho_solve(factor, b)
+    r = b - A @ x
+    z = cho_solve(factor, r)
+    p = z.copy()
+    rz = r @ z
+    threshold = tol * np.linalg.norm(b)
+    for _ in range(max_iter):
+        if np.linalg.norm(r) <= threshold:
+            return x, True
+        Ap = A @ p
+        alpha = rz / (p @ Ap)
+        x += alpha * p
+        r -= alpha * Ap
+        z = cho_solve(factor, r)
+        rz_next = r @ z
+        p = z + (rz_next / rz) * p
+        rz = rz_next
+    return x, np.linalg.norm(r) <= threshold
+
+
+def _cap_weights(weights: np.ndarray, max_weight: float) -> np.ndarray:
+    """將超過上限的權重設為上限, 超出部分依比例分配給其他股票 (全部達上限時剩餘為現金)"""
+    weights = weights.copy()
+    capped = np.zeros(len(weights), dtype=bool)
+    while True:
+        over = ~capped & (weights > max_weight)
+        if not over.any():
+            return weights
+        excess = (weights[over] - max_weight).sum()
+        weights[over] = max_weight
+        capped |= over
+        free = ~capped
+        if not free.any() or weights[free].sum() <= 0:
+            return weights
+        weights[free] += excess * weights[free] / weights[free].sum()